@@ -1,2 +1,20 @@
-from .ancestry import AncestryScraper
-from .family_search import FamilySearchScraper
+import importlib
+
+# The scrapers (and selenium, pyshadow and requests with them) are only imported when first used, so that
+# processes which only parse or post-process (e.g. pipeline parse workers) start quickly.
+_LAZY_ATTRIBUTES = {'AncestryScraper'     : '.ancestry',
+                    'FamilySearchScraper' : '.family_search'}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
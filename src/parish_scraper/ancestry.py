@@ -6,17 +6,29 @@ Class: AncestryScraper
 A selenium-based webscraping bot which gathers parish records from Ancestry.co.uk.
 '''
 
+import functools
 import os
-import pandas as pd
 import time
 
-from bs4 import BeautifulSoup
-from selenium import webdriver   
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException, WebDriverException
+
+from .browse_cache import BrowseTreeCache, replace_branch
+from .checkpoint import ProgressJournal
+from .dedup import RowDeduplicator, page_fingerprint
+from .parsing import concat_labelled, parse_grid_container
+from .drivers import boot_up_chrome
+from .metrics import get_metrics
+from .pipeline import ScrapePipeline
+from .pool import DriverPool
+from .profiling import get_profiler
+from .sessions import restore_session, save_session
+from .sinks import LabelledSink, MemorySink
+from .throttle import get_limiter
+from .waits import adaptive_wait
+from .workqueue import ANCESTRY_RECORD, enqueue_records, run_worker
 
 
 class AuthenticationError(Exception):
@@ -39,26 +51,16 @@ class Timer():
         self.created_time = time.time()
 
 
-def boot_up_driver():
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36"
+
+
+def boot_up_driver(browser_profile='default', executable_path=None):
     '''
     Boots up chromedriver with minimal detectability.
+    browser_profile='performance' runs headless without downloading images, media or fonts (see parish_scraper.drivers).
     Returns webdriver.Chrome object.
     '''
-    # Change settings to minimize detectability
-    option = webdriver.ChromeOptions()
-    # For older ChromeDriver under version 79.0.3945.16
-    option.add_experimental_option("excludeSwitches", ["enable-automation"])
-    option.add_experimental_option('useAutomationExtension', False)
-    #For ChromeDriver version 79.0.3945.16 or over
-    option.add_argument('--disable-blink-features=AutomationControlled')
-    # Change resolution and user-agent
-    option.add_argument("window-size=1280,800")
-    option.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36")
-    #Open Browser
-    driver = webdriver.Chrome(executable_path='chromedriver.exe',options=option)
-    driver.maximize_window()
-
-    return driver
+    return boot_up_chrome(USER_AGENT, browser_profile, executable_path)
 
 
 def accept_cookies(driver):
@@ -66,7 +68,7 @@ def accept_cookies(driver):
     Accepts cookies.
     '''
     xpath_accept = r'//*[@id="Banner_cookie_0"]/div[2]/div/div[2]/div/button[1]'
-    accept_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, xpath_accept)))
+    accept_button = adaptive_wait(driver, 'ancestry.accept_cookies', 10).until(EC.presence_of_element_located((By.XPATH, xpath_accept)))
     accept_button.click()
 
     return driver
@@ -79,20 +81,20 @@ def sign_in(driver, username, password):
     # Switch to sign in iframe
     iframe_xpath = r'//*[@id="signInFrame"]'
     try:
-        frames = WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.XPATH,iframe_xpath)))
+        frames = adaptive_wait(driver, 'ancestry.sign_in_frame', 10).until(EC.presence_of_all_elements_located((By.XPATH,iframe_xpath)))
         if frames[0].is_displayed(): 
             driver.switch_to.frame(frames[0])
             #Enter username
             xpath_un = r'//*[@id="username"]'
-            un_box = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_un)))
+            un_box = adaptive_wait(driver, 'ancestry.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_un)))
             un_box.send_keys(username)
             # Enter password
             xpath_pw = r'//*[@id="password"]'
-            pw_box = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_pw)))
+            pw_box = adaptive_wait(driver, 'ancestry.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_pw)))
             pw_box.send_keys(password)
             # Click sign in 
             xpath_sign_in = r'//*[@id="signInBtn"]'
-            sign_in_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_sign_in)))
+            sign_in_button = adaptive_wait(driver, 'ancestry.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_sign_in)))
             sign_in_button.click()
         else:
             raise Exception
@@ -109,7 +111,7 @@ def when_dom_static(driver, xpath, timeout=15, to_send='click'):
     no_success = True
     while no_success:
         try:
-            element = WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
+            element = adaptive_wait(driver, 'ancestry.browse_select', timeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
             if to_send == 'click':
                 element.click()
             else:
@@ -134,9 +136,9 @@ def collect_urls(driver, option_names):
     num_browse_levels = len(option_names)
     year_range_xpath = r'//*[@id="divBL_{}"]/div/ul/li'.format(num_browse_levels)
     try:
-        urls_li_list     = WebDriverWait(driver, 20, ignored_exceptions=ignored_exceptions)\
+        urls_li_list     = adaptive_wait(driver, 'ancestry.browse_urls', 20, ignored_exceptions=ignored_exceptions)\
                         .until(EC.presence_of_all_elements_located((By.XPATH, year_range_xpath)))
-        urls_list        = [WebDriverWait(element, 15, ignored_exceptions=ignored_exceptions)\
+        urls_list        = [adaptive_wait(element, 'ancestry.browse_url_link', 15, ignored_exceptions=ignored_exceptions)\
                         .until(EC.presence_of_element_located((By.XPATH, 'a'))) for element in urls_li_list]
         urls_dict        = {element.text : element.get_attribute('href') for element in urls_list}
     # If no urls are displayed:
@@ -157,25 +159,176 @@ def get_browse_labels(driver):
     return labels
 
 
+def open_browse_controls(driver, collection_code):
+    '''
+    Goes to the page of the collection with code collection_code and waits for its "Browse this collection" box.
+    Returns: list of xpaths (one per browse level drop-down).
+    '''
+    url_collection = r'https://www.ancestry.co.uk/search/collections/{}/'.format(collection_code)
+    metrics = get_metrics('ancestry')
+    get_limiter('ancestry').acquire()
+    with metrics.phase('navigation'):
+        driver.get(url_collection)
+    # Check the "Browse this collection" box is displayed.
+    xpath_browse_box = r'//*[@id="divBrowse"]'
+    xpath_browse_level = r'//*[@id="browseControls"]/div'
+    try:
+        with metrics.phase('wait'):
+            browse_box = adaptive_wait(driver, 'ancestry.browse_box', 10).until(EC.presence_of_element_located((By.XPATH, xpath_browse_box)))
+            browse_levels = adaptive_wait(driver, 'ancestry.browse_box', 10).until(EC.presence_of_all_elements_located((By.XPATH, xpath_browse_level)))
+    except:
+        metrics.increment('timeouts')
+        raise NotFoundError('Either {} is not a valid ID or the collection cannot be browsed in the image viewer.'.format(collection_code))
+    xpaths_bl = [r'//*[@id="browseControls"]/div[{}]'.format(i) for i in range(1, len(browse_levels) + 1)]
+
+    return xpaths_bl
+
+
+def get_level_options(driver, xpath_bl):
+    '''
+    Returns the option elements (excluding the placeholder) of the browse level drop-down at xpath_bl.
+    '''
+    xpath_options = xpath_bl + r'/div/select/option'
+    metrics = get_metrics('ancestry')
+    no_success = True
+    # Sometimes, webpage becomes stuck loading the next options drop-down box. If this happens, refresh and try again.
+    while no_success:
+        try:
+            with metrics.phase('wait'):
+                options = adaptive_wait(driver, 'ancestry.browse_options', 10).until(EC.presence_of_all_elements_located((By.XPATH, xpath_options)))[1:]
+            no_success = False
+        except:
+            metrics.increment('refreshes')
+            limiter = get_limiter('ancestry')
+            limiter.penalize()
+            limiter.acquire()
+            with metrics.phase('navigation'):
+                driver.refresh()
+            continue
+
+    return options
+
+
+def select_option(driver, xpath_bl, option_name):
+    '''
+    Selects the option named option_name in the browse level drop-down at xpath_bl.
+    '''
+    option_names = [option.text for option in get_level_options(driver, xpath_bl)]
+    if option_name not in option_names:
+        raise NotFoundError('No browse option named {}.'.format(option_name))
+    xpath_select = xpath_bl + r'/div/select'
+    driver = when_dom_static(driver, xpath_select, timeout=15, to_send='click')
+    for _ in range(option_names.index(option_name) + 1):
+        driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.DOWN)
+    driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.ENTER)
+
+    return driver
+
+
+def explore_browse_tree(driver, xpaths_bl, option_names, urls):
+    '''
+    Explores the browse level drop-downs xpaths_bl depth-first, below the options already selected (option_names).
+    Adds {((label, option), ...) : {<date range> : <url>}} to urls for every leaf.
+    Returns: driver, urls
+    '''
+    if not xpaths_bl:
+        driver, url_key, urls_dict = collect_urls(driver, option_names)
+        labels = get_browse_labels(driver)
+        url_key = tuple(zip(labels, url_key))
+        # Update urls with date-ranges and hrefs
+        urls[url_key] = urls_dict
+    else:
+        xpath_select               = xpaths_bl[0] + r'/div/select'
+        highest_level_options      = get_level_options(driver, xpaths_bl[0])
+        highest_level_option_names = [option.text for option in highest_level_options]
+        for option_name in highest_level_option_names:
+            driver = when_dom_static(driver, xpath_select, timeout=15, to_send='click')
+            driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.DOWN)
+            driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.ENTER)
+            option_names_copy = list(option_names)
+            option_names_copy.append(option_name)
+            explore_browse_tree(driver, xpaths_bl[1:], option_names_copy, urls)
+
+    return driver, urls
+
+
+def explore_browse_branch(driver, collection_code, option_names):
+    '''
+    Opens the browse controls of collection_code, selects option_names at the first len(option_names) browse levels,
+    then explores every browse level below them.
+    Returns: dictionary {((label, option), ...) : {<date range> : <url>}} of the branch.
+    '''
+    xpaths_bl = open_browse_controls(driver, collection_code)
+    for xpath_bl, option_name in zip(xpaths_bl, option_names):
+        driver = select_option(driver, xpath_bl, option_name)
+    driver, urls = explore_browse_tree(driver, xpaths_bl[len(option_names):], list(option_names), {})
+
+    return urls
+
+
+def is_signed_in(driver, timeout=5):
+    '''
+    Returns True if the page open in driver shows the signed-in welcome title.
+    '''
+    welcome_xpath = r'//h1[@class="pageTitle"]'
+    try:
+        welcome = adaptive_wait(driver, 'ancestry.welcome', timeout).until(EC.presence_of_element_located((By.XPATH,welcome_xpath)))
+    except TimeoutException:
+        return False
+
+    return 'Welcome,' in welcome.text
+
+
+def authenticate_driver(username, password, session_path=None, browser_profile='default'):
+    '''
+    Boots up a chrome webdriver with minimal detectability and signs into ancestry, accepting cookies.
+    If session_path is given, cookies saved there by a previous sign-in are tried first, falling back to signing in
+    (after which the new cookies are saved to session_path).
+    Returns: authenticated webdriver.Chrome object.
+    '''
+    driver = boot_up_driver(browser_profile)
+    url_home = r'https://www.ancestry.co.uk'
+    if session_path and restore_session(driver, session_path, url_home):
+        driver.get(url_home)
+        if is_signed_in(driver):
+            print('Successfully restored session.')
+            return driver
+        driver.delete_all_cookies()
+    # Go to sign in page, accept cookies, sign in.
+    driver.get('https://www.ancestry.co.uk/secure/login')
+    driver = accept_cookies(driver)
+    driver = sign_in(driver, username, password)
+    # Check welcome screen is displayed
+    if is_signed_in(driver, timeout=10):
+        print('Successfully logged in.')
+    else:
+        driver.quit()
+        raise AuthenticationError('Something went wrong.')
+    if session_path:
+        save_session(driver, session_path)
+
+    return driver
+
+
 def get_useful_elements(driver):
     '''
     Returns a dictionary of useful image viewer page elements.
     '''
     # Button panel
     xpath_buttons       = r'//*[@class="paging-wrapper"]'
-    buttons_panel       = WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.XPATH, xpath_buttons)))
+    buttons_panel       = adaptive_wait(driver, 'ancestry.viewer_buttons_panel', 15).until(EC.presence_of_element_located((By.XPATH, xpath_buttons)))
     # Button to reveal table
     xpath_table_buttons = r'./button'
-    table_button        = WebDriverWait(buttons_panel, 15).until(EC.presence_of_all_elements_located((By.XPATH, xpath_table_buttons)))[-1]
+    table_button        = adaptive_wait(buttons_panel, 'ancestry.viewer_table_button', 15).until(EC.presence_of_all_elements_located((By.XPATH, xpath_table_buttons)))[-1]
     # Next page button
     css_next_page       = r'button.page'
-    next_page_button    = WebDriverWait(driver, 15).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, css_next_page)))[-1]
+    next_page_button    = adaptive_wait(driver, 'ancestry.viewer_next_page', 15).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, css_next_page)))[-1]
     # Number of pages
     css_pages           = r'span.imageCountText.middle'
-    num_pages           = WebDriverWait(buttons_panel, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_pages))).text
+    num_pages           = adaptive_wait(buttons_panel, 'ancestry.viewer_page_count', 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_pages))).text
     # Index panel
     css_index_panel     = r'div.index-panel'
-    index_panel         = WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_index_panel)))
+    index_panel         = adaptive_wait(driver, 'ancestry.viewer_index_panel', 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_index_panel)))
  
     elements = {'buttons_panel'   : buttons_panel,
                'table_button'     : table_button,
@@ -187,7 +340,7 @@ def get_useful_elements(driver):
 
 
 def get_next_page_button(driver):
-        next_page_button = WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, r'button.page')))[-1]
+        next_page_button = adaptive_wait(driver, 'ancestry.viewer_next_page', 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, r'button.page')))[-1]
         not_last_page = next_page_button.is_enabled()
         return next_page_button, not_last_page
 
@@ -206,50 +359,33 @@ def get_table_html(driver, **kwargs):
         grid_container_html = None
     else:
         css_grid_container   = r'div.grid-container'
-        grid_container       = WebDriverWait(index_panel, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR,css_grid_container)))
+        grid_container       = adaptive_wait(index_panel, 'ancestry.viewer_grid_container', 15).until(EC.presence_of_element_located((By.CSS_SELECTOR,css_grid_container)))
         grid_container_html  = grid_container.get_attribute('innerHTML')
 
     return driver, grid_container_html
 
 
-def make_grid_container_df(grid_container):
+def make_grid_container_df(grid_container, parser='html.parser'):
     '''
     Returns pandas.DataFrame containing the data within grid_container html.
+    See parish_scraper.parsing.parse_grid_container for parser.
     '''
-    soup = BeautifulSoup(grid_container, 'html.parser')
-    rows          = soup.find_all('div', {'class':'grid-row'})
-    columns_html  = rows[0].findChildren('div')
-    elements_html = [row.findChildren('div') for i, row in enumerate(rows) if i >= 1]
-    columns       = [column.text for column in columns_html]
-    elements      = []
-    for i in range(len(elements_html)):
-        element_row_html = elements_html[i]
-        row_elements     = [element.text for element in element_row_html]
-        elements.append(row_elements)
-        df = pd.DataFrame(elements, columns=columns)
-    
-    return df
+    return parse_grid_container(grid_container, parser)
 
 
-def scrape_record(driver, record_url):
+def poll_record_pages(driver):
     '''
-    Scrape index panel data from parish collection at collection_url using driver.
-    Driver must be authenticated (if not, call athuenticate() before calling this function).
-    Progress is printed.
-    Returns: Tuple (driver, complete DataFrame for that collection)
+    Yields the grid container html of each page of the image viewer open in driver (None for pages without an index),
+    polling the page for changes and clicking through with the next page button.
     '''
-    # Go to webpage for the collection
-    driver.get(record_url)
-
     elements         = get_useful_elements(driver)
     next_page_button = elements['next_page_button']
     not_last_page    = True
-    counter          = 1
+    limiter          = get_limiter('ancestry')
+    metrics          = get_metrics('ancestry')
 
-    grid_containers  = []
-    df_list          = []
     grid_container_html = None
-    prev_grid_container = None     
+    prev_fingerprint    = None     
     
     # Start timer
     timer = Timer()
@@ -257,42 +393,404 @@ def scrape_record(driver, record_url):
     # Scrape the grid containers
     while not_last_page:
         if timer.time_elapsed >= 5:
+            # The page has not changed: click the next page button again
+            metrics.increment('retries')
             timer.reset_time()
             next_page_button, not_last_page = get_next_page_button(driver)
             if not_last_page:
-                next_page_button.click()
+                limiter.acquire()
+                with metrics.phase('navigation'):
+                    next_page_button.click()
                 continue
             else:
                 break
+        start                       = time.perf_counter()
         elements                    = get_useful_elements(driver)
         driver, grid_container_html = get_table_html(driver, **elements)
-        if grid_container_html == prev_grid_container:
+        # Compare content hashes rather than holding on to the previous page's html
+        fingerprint = page_fingerprint(grid_container_html) if grid_container_html is not None else None
+        if fingerprint == prev_fingerprint:
+            # Reading a page which has not changed yet is time spent waiting for the next one
+            metrics.add_time('wait', time.perf_counter() - start)
             continue
         else:
             next_page_button, not_last_page = get_next_page_button(driver)
-            prev_grid_container = grid_container_html
-            grid_containers.append(grid_container_html)
+            metrics.add_time('extraction', time.perf_counter() - start)
+            prev_fingerprint = fingerprint
+            yield grid_container_html
             if not_last_page:
-                next_page_button.click()
+                limiter.acquire()
+                with metrics.phase('navigation'):
+                    next_page_button.click()
                 timer.reset_time()
             else:
                 break
 
-    # Now use BeautifulSoup to turn the html into a dataframe
-    for grid_container in grid_containers:
+
+# Watches the image viewer from the browser side. Once the DOM has been quiet for 100ms, the page's signature
+# (url + a 53-bit hash of the index table) is compared with the last one seen, so only the short signature
+# (not the whole table) travels back and forth with each call. If it has changed, waiting callbacks are resolved with
+# [signature, grid container html (or null if the page has no index), whether the next page button is enabled].
+PAGE_OBSERVER_SCRIPT = '''
+(function() {
+    if (window.__parishPageObserver) { return; }
+    var state = {signature : null, page : null, waiting : [], timer : null};
+    window.__parishPageObserver = state;
+    var fingerprint = function(text) {
+        // cyrb53 string hash
+        var h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+        for (var i = 0; i < text.length; i++) {
+            var ch = text.charCodeAt(i);
+            h1 = Math.imul(h1 ^ ch, 2654435761);
+            h2 = Math.imul(h2 ^ ch, 1597334677);
+        }
+        h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+        h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+        return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(16) + ':' + text.length;
+    };
+    var lastEnabled = function(selector) {
+        var buttons = document.querySelectorAll(selector);
+        return buttons.length > 0 && !buttons[buttons.length - 1].disabled;
+    };
+    var check = function() {
+        if (!document.querySelector('div.paging-wrapper') || !document.querySelector('button.page')) { return; }
+        var html = null;
+        if (lastEnabled('.paging-wrapper > button')) {
+            var grid = document.querySelector('div.index-panel div.grid-container');
+            if (!grid || !grid.querySelector('div.grid-row')) { return; }
+            html = grid.innerHTML;
+        }
+        var signature = location.href + '\\n' + (html === null ? 'null' : fingerprint(html));
+        if (signature === state.signature) { return; }
+        state.signature = signature;
+        state.page = [signature, html, lastEnabled('button.page')];
+        state.waiting.splice(0).forEach(function(done) { done(state.page); });
+    };
+    new MutationObserver(function() {
+        clearTimeout(state.timer);
+        state.timer = setTimeout(check, 100);
+    }).observe(document, {childList : true, subtree : true, characterData : true, attributes : true});
+    state.timer = setTimeout(check, 100);
+})();
+'''
+
+# Resolves with the observer's page state as soon as its signature differs from arguments[0],
+# optionally clicking the next page button first. Resolves with null if the observer is not installed.
+WAIT_FOR_PAGE_SCRIPT = '''
+var known = arguments[0];
+var clickNext = arguments[1];
+var done = arguments[arguments.length - 1];
+var state = window.__parishPageObserver;
+if (!state) { done(null); return; }
+if (clickNext) {
+    var buttons = document.querySelectorAll('button.page');
+    buttons[buttons.length - 1].click();
+}
+if (state.page && state.signature !== known) { done(state.page); return; }
+state.waiting.push(done);
+'''
+
+# Returns the page state last seen by the observer, or null if it is not installed.
+PAGE_STATE_SCRIPT = '''
+var state = window.__parishPageObserver;
+return state ? state.page : null;
+'''
+
+# WebDriver's default script timeout (seconds). Selenium 3 cannot read the current timeout back, so
+# set_script_timeout records the timeout it sets on the driver.
+DEFAULT_SCRIPT_TIMEOUT = 30
+
+
+def install_page_observer(driver):
+    '''
+    Installs a mutation observer on the image viewer page currently open in driver.
+    '''
+    get_useful_elements(driver)
+    driver.execute_script(PAGE_OBSERVER_SCRIPT)
+
+    return driver
+
+
+def set_script_timeout(driver, timeout):
+    '''
+    Sets the timeout (seconds) of driver's async scripts, recording it as driver.parish_script_timeout.
+    '''
+    driver.set_script_timeout(timeout)
+    driver.parish_script_timeout = timeout
+
+    return driver
+
+
+def wait_for_page(driver, known_signature, click_next=False, timeout=30):
+    '''
+    Blocks until the image viewer shows a page whose signature differs from known_signature.
+    Reinstalls the observer if the browser has navigated to a new document.
+    The driver's script timeout is set to timeout for the wait, then restored.
+    Returns: list [signature, grid container html or None, next page button enabled].
+    '''
+    # The driver may be shared (e.g. lent by a DriverPool), so its other async scripts keep their timeout
+    previous_timeout = getattr(driver, 'parish_script_timeout', DEFAULT_SCRIPT_TIMEOUT)
+    set_script_timeout(driver, timeout)
+    try:
+        for attempt in range(3):
+            try:
+                if attempt > 0:
+                    install_page_observer(driver)
+                page = driver.execute_async_script(WAIT_FOR_PAGE_SCRIPT, known_signature, click_next and attempt == 0)
+            except TimeoutException:
+                raise
+            except WebDriverException:
+                # The document was unloaded while waiting (full page navigation)
+                page = None
+            if page is not None:
+                return page
+    finally:
+        try:
+            set_script_timeout(driver, previous_timeout)
+        except WebDriverException:
+            # The browser has gone: the wait's own error is the one to raise
+            pass
+
+    raise TimeoutException('Image viewer page did not change.')
+
+
+def current_page(driver):
+    '''
+    Returns the page last seen by the image viewer's observer (as returned by wait_for_page), or None.
+    '''
+    try:
+        return driver.execute_script(PAGE_STATE_SCRIPT)
+    except WebDriverException:
+        return None
+
+
+def observe_record_pages(driver, timeout=30, max_retries=3):
+    '''
+    Yields the grid container html of each page of the image viewer open in driver (None for pages without an index).
+    Page changes are detected by a mutation observer in the browser, so each page costs one blocking script call
+    rather than repeated polling. If a page does not change within timeout seconds, the next page button is clicked
+    again (up to max_retries times).
+    '''
+    install_page_observer(driver)
+    limiter    = get_limiter('ancestry')
+    metrics    = get_metrics('ancestry')
+    signature  = None
+    click_next = False
+    retries    = 0
+    while True:
+        try:
+            if click_next:
+                limiter.acquire()
+            with metrics.phase('wait'):
+                page = wait_for_page(driver, signature, click_next, timeout)
+        except TimeoutException:
+            # A page which never arrives is treated as throttling
+            metrics.increment('timeouts')
+            limiter.penalize()
+            retries += 1
+            if retries > max_retries:
+                raise
+            metrics.increment('retries')
+            # The click may have landed just after the wait gave up: only click again if the viewer still
+            # shows the last page read, as clicking past a page that has arrived would skip it
+            page = current_page(driver) if click_next else None
+            if page is None or page[0] == signature:
+                continue
+        limiter.reward()
+        retries = 0
+        signature, grid_container_html, not_last_page = page
+        yield grid_container_html
+        if not not_last_page:
+            break
+        click_next = True
+
+
+def iter_record_pages(driver, record_url, event_driven=False, journal=None):
+    '''
+    Opens the image viewer at record_url (or, if journal has a resume point for it, at the last page scraped)
+    and yields (page url, grid container html or None) for each page not already in the journal.
+    See scrape_record for event_driven.
+    '''
+    resume_point = journal.resume_point(record_url) if journal else None
+    metrics = get_metrics('ancestry')
+    get_limiter('ancestry').acquire()
+    if resume_point:
+        # Go to the last page scraped; it is already in the journal, so skip it.
+        _, page_url = resume_point
+        with metrics.phase('navigation'):
+            driver.get(page_url)
+        skip_page = True
+    else:
+        # Go to webpage for the collection
+        with metrics.phase('navigation'):
+            driver.get(record_url)
+        skip_page = False
+
+    if event_driven:
+        pages = observe_record_pages(driver)
+    else:
+        pages = poll_record_pages(driver)
+    for grid_container in pages:
+        if skip_page:
+            skip_page = False
+            continue
+        metrics.increment('pages')
+        yield driver.current_url, grid_container
+
+
+def record_deduplicator(record_url, journal=None):
+    '''
+    Returns a RowDeduplicator for the record at record_url, already holding the rows journaled so far
+    if the record is being resumed.
+    '''
+    dedup = RowDeduplicator()
+    if journal and journal.resume_point(record_url):
+        for df in journal.iter_record_frames(record_url):
+            dedup.update(df)
+
+    return dedup
+
+
+def scrape_record(driver, record_url, event_driven=False, sink=None, journal=None, profiler=None):
+    '''
+    Scrape index panel data from parish collection at collection_url using driver.
+    Driver must be authenticated (if not, call athuenticate() before calling this function).
+    If event_driven, page changes are detected with a mutation observer (observe_record_pages)
+    instead of polling the page (poll_record_pages).
+    Each page is parsed as soon as it is scraped, unless it repeats a page already scraped, and rows already
+    scraped from earlier pages are dropped (see parish_scraper.dedup.RowDeduplicator).
+    If a sink (see parish_scraper.sinks) is given, each page's DataFrame is written straight to it and nothing is
+    kept in memory.
+    If a journal (parish_scraper.checkpoint.ProgressJournal) is given, every page is saved to it as it is scraped,
+    and a partially scraped record resumes from the last page saved.
+    If a profiler (parish_scraper.profiling.Profiler) is given, the record may be sampled for a CPU and allocation
+    profile, written to files named after record_url.
+    Returns: Tuple (driver, complete DataFrame for that collection), or (driver, None) if a sink was given.
+    '''
+    if profiler is not None:
+        with profiler.profile(record_url):
+            return scrape_record(driver, record_url, event_driven, sink, journal)
+
+    record_sink = sink if sink is not None else MemorySink()
+    dedup = record_deduplicator(record_url, journal)
+    metrics = get_metrics('ancestry')
+
+    # Turn each page's html into a dataframe as it arrives
+    for page_url, grid_container in iter_record_pages(driver, record_url, event_driven, journal):
+        if grid_container and not dedup.is_new_page(grid_container):
+            continue
+        df = None
         if grid_container:
-            df = make_grid_container_df(grid_container)
-            df_list.append(df)
+            with metrics.phase('parse'):
+                df = dedup.filter(make_grid_container_df(grid_container))
+            metrics.increment('rows', len(df))
+            record_sink.write(df)
+        if journal:
+            journal.record_page(record_url, page_url, df)
+
+    if journal:
+        journal.complete_record(record_url)
+
+    if sink is not None:
+        return driver, None
 
     # Concatenate all dataframes into a final dataframe
-    if df_list:
-        df_concat = pd.concat(df_list, ignore_index=True).drop_duplicates().reset_index(drop=True)
-    else:
-        df_concat = pd.DataFrame([], columns = [])
+    with metrics.phase('concat'):
+        if journal:
+            df_concat = journal.load_record(record_url)
+        else:
+            df_concat = record_sink.to_frame()
 
     return driver, df_concat
 
 
+def write_record(sink, df_record, labels, date_range, collection_code=None):
+    '''
+    Writes the DataFrame of a record to sink with its labels and date range as columns,
+    partitioned by collection, labels and date range.
+    '''
+    if df_record.empty:
+        return None
+    labels = [tuple(label) for label in labels]
+    partition = [('collection', collection_code)] + labels + [('date_range', date_range)]
+    LabelledSink(sink, labels + [('Record Date Range', date_range)]).write(df_record, partition)
+
+    return None
+
+
+def record_handler(driver, sink, event_driven=False, journal=None):
+    '''
+    Returns a work queue handler (see parish_scraper.workqueue.run_worker) which scrapes the record of an
+    ANCESTRY_RECORD item with driver and writes it to sink (see write_record).
+    See scrape_record for event_driven and journal; with a journal directory shared by the workers (see
+    parish_scraper.checkpoint), a record whose worker died resumes from its last page.
+    '''
+    def handle(item):
+        if journal and journal.is_complete(item.key):
+            rows = journal.rows_written(item.key)
+            if rows is not None:
+                # Written by a worker which died before completing the item
+                return {'rows' : rows}
+            df_record = journal.load_record(item.key)
+        else:
+            _, df_record = scrape_record(driver, item.key, event_driven, journal=journal)
+        write_record(sink, df_record, item.payload['labels'], item.payload['date_range'], item.payload['collection'])
+        if journal:
+            journal.mark_written(item.key, len(df_record))
+        return {'rows' : len(df_record)}
+
+    return handle
+
+
+def scrape_records_pipelined(pool, record_urls, event_driven=False, journal=None, parse_workers=None, on_record=None):
+    '''
+    Scrapes every record in record_urls through a ScrapePipeline (see parish_scraper.pipeline): the drivers in pool
+    click through the image viewers while the pages already scraped are parsed in a process pool.
+    See scrape_record for event_driven and journal. If given, on_record(record url, DataFrame) is called as soon
+    as each record is complete, and its return value is kept instead of the DataFrame.
+    Parsing happens in other processes, so it is not timed in get_metrics('ancestry'); see the pipeline's statistics.
+    Returns: Tuple (dict {record url : DataFrame}, the ScrapePipeline, which holds the run's queue statistics).
+    '''
+    record_urls  = list(record_urls)
+    dedups       = {record_url : record_deduplicator(record_url, journal) for record_url in record_urls}
+    record_sinks = {record_url : MemorySink() for record_url in record_urls}
+    metrics      = get_metrics('ancestry')
+
+    def record_pages(record_url):
+        with pool.acquire() as driver:
+            for page_url, grid_container in iter_record_pages(driver, record_url, event_driven, journal):
+                # Drop repeated pages before they are sent for parsing
+                if grid_container and not dedups[record_url].is_new_page(grid_container):
+                    continue
+                yield page_url, grid_container
+
+    def on_page(record_url, page_url, df):
+        if df is not None:
+            df = dedups[record_url].filter(df)
+            metrics.increment('rows', len(df))
+            record_sinks[record_url].write(df)
+        if journal:
+            journal.record_page(record_url, page_url, df)
+
+    def record_frame(record_url, pages):
+        dedups.pop(record_url)
+        record_sink = record_sinks.pop(record_url)
+        if journal:
+            journal.complete_record(record_url)
+        with metrics.phase('concat'):
+            return journal.load_record(record_url) if journal else record_sink.to_frame()
+
+    def on_source(record_url, pages):
+        df = record_frame(record_url, pages)
+        return on_record(record_url, df) if on_record else df
+
+    pipeline = ScrapePipeline(parse_grid_container, fetch_workers=pool.size, parse_workers=parse_workers)
+    sources  = [(record_url, functools.partial(record_pages, record_url)) for record_url in record_urls]
+    dfs      = pipeline.run(sources, on_page, on_source)
+
+    return dict(zip(record_urls, dfs)), pipeline
+
+
 class AncestryScraper:
     '''
     A selenium-based bot which scrapes parish data from ancestry.co.uk.
@@ -301,10 +799,17 @@ class AncestryScraper:
     def __init__(self):
         self.authenticated_driver = None
         self.collection_urls = None
+        self.collection_code = None
+        self.driver_pool = None
+        self.session_path = None
+        self.browser_profile = 'default'
+        self.pipeline = None
 
-    def authenticate(self):
+    def authenticate(self, session_path=None, browser_profile='default'):
         '''
         Boots up a chrome webdriver with minimal detectability, signs into ancestry, accepting cookies.
+        If session_path is given, the cookies of the last sign-in are saved there and reused on the next start.
+        See boot_up_driver for browser_profile.
         '''
         # Sign in details
         USERNAME = os.getenv('ANC_USERNAME', None)
@@ -312,90 +817,106 @@ class AncestryScraper:
         if not (USERNAME and PASSWORD):
             raise AuthenticationError('No username and/or password found in environment variables. \
                 Ensure these are set before attempting to authenticate.')
-        driver = boot_up_driver()
-        # Go to sign in page, accept cookies, sign in.
-        driver.get('https://www.ancestry.co.uk/secure/login')
-        driver = accept_cookies(driver)
-        driver = sign_in(driver, USERNAME, PASSWORD)
-        # Check welcome screen is displayed
-        welcome_xpath = r'//h1[@class="pageTitle"]'
-        welcome = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,welcome_xpath)))
-        if 'Welcome,' in welcome.text:
-            print('Successfully logged in.')
-            self.authenticated_driver = driver
-        else:
-            driver.quit()
-            raise AuthenticationError('Something went wrong.')
+        self.session_path = session_path
+        self.browser_profile = browser_profile
+        self.authenticated_driver = authenticate_driver(USERNAME, PASSWORD, session_path, browser_profile)
             
         return 
 
-    def get_parish_urls(self, collection_code):
+    def get_driver_pool(self, workers):
+        '''
+        Returns a DriverPool of at least workers authenticated drivers, sharing self.authenticated_driver.
+        Extra drivers are signed in with the same credentials as authenticate().
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate before attempting to collect urls.')
+        if self.driver_pool is None:
+            driver_factory = lambda: authenticate_driver(os.getenv('ANC_USERNAME'), os.getenv('ANC_PASSWORD'), self.session_path, self.browser_profile)
+            self.driver_pool = DriverPool(driver_factory, size=workers, drivers=[self.authenticated_driver])
+        self.driver_pool.size = max(self.driver_pool.size, workers)
+        self.driver_pool.fill()
+
+        return self.driver_pool
+
+    def get_parish_urls(self, collection_code, cache=None, refresh=False, workers=1):
         '''
         Collects the urls to the image viewer pages with transcribed records for collection with code 'collection_code'.
         Updates self.collection_urls to be a dictionary: {<record place and/or type> (tuple) : {<year range> : <url>} (dict)}.
+        If a cache (a directory or parish_scraper.browse_cache.BrowseTreeCache) is given, an unexpired cached tree is
+        used instead of clicking through the drop-downs (unless refresh), and a newly collected tree is saved to it.
+        If workers > 1, the sub-trees below each top-level option are explored in parallel by a pool of that many
+        authenticated drivers.
         '''
+        cache = self._browse_cache(cache)
+        if cache and not refresh:
+            urls = cache.load(collection_code)
+            if urls is not None:
+                self.collection_urls = urls
+                self.collection_code = collection_code
+                return urls
         if not self.authenticated_driver:
             raise AuthenticationError('Please authenticate before attempting to collect urls.')
         driver = self.authenticated_driver
         # Go to collection url
-        url_collection = r'https://www.ancestry.co.uk/search/collections/{}/'.format(collection_code)
-        driver.get(url_collection)
-        # Check the "Browse this collection" box is displayed.
-        xpath_browse_box = r'//*[@id="divBrowse"]'
-        xpath_browse_level = r'//*[@id="browseControls"]/div'
-        try:
-            browse_box = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, xpath_browse_box)))
-            browse_levels = WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.XPATH, xpath_browse_level)))
-        except:
-            raise NotFoundError('Either {} is not a valid ID or the collection cannot be browsed in the image viewer.')
-        xpaths_bl = [r'//*[@id="browseControls"]/div[{}]'.format(i) for i in range(1, len(browse_levels) + 1)]
-        urls = {}
-
-        def _drop_down(driver, xpaths_bl, option_names=[]):
-            nonlocal urls
-            if not xpaths_bl:
-                driver, url_key, urls_dict = collect_urls(driver, urls, option_names)
-                labels = get_browse_labels(driver)
-                url_key = tuple(zip(labels, url_key))
-                # Update urls with date-ranges and hrefs
-                urls[url_key] = urls_dict
-            else:
-                xpath_select               = xpaths_bl[0] + r'/div/select'
-                xpath_options              = xpath_select + r'/option'
-                no_success = True
-                # Sometimes, webpage becomes stuck loading the next options drop-down box. If this happens, refresh and try again.
-                while no_success:
-                    try:
-                        highest_level_options = WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.XPATH, xpath_options)))[1:]
-                        no_success = False
-                    except:
-                        driver.refresh()
-                        continue
-                highest_level_option_names = [option.text for option in highest_level_options]
-                option_label = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, xpath_options))).text
-                for option, option_name in zip(highest_level_options, highest_level_option_names):
-                    driver = when_dom_static(driver, xpath_select, timeout=15, to_send='click')
-                    driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.DOWN)
-                    driver = when_dom_static(driver, xpath_select, timeout=15, to_send=Keys.ENTER)
-                    option_names_copy = option_names.copy()
-                    option_names_copy.append(option_name)
-                    if xpaths_bl[:-1]:
-                        _drop_down(driver, xpaths_bl[1:], option_names_copy)
-                    else:
-                        _drop_down(driver, xpaths_bl[:-1], option_names_copy)
-            
-            return driver, urls
-
-        driver, urls = _drop_down(driver, xpaths_bl)
+        xpaths_bl = open_browse_controls(driver, collection_code)
+        if workers > 1:
+            top_level_names = [option.text for option in get_level_options(driver, xpaths_bl[0])]
+            pool = self.get_driver_pool(workers)
+            branches = pool.map(lambda pool_driver, name: explore_browse_branch(pool_driver, collection_code, [name]),
+                                top_level_names, workers)
+            # Merge in top-level option order, as explore_browse_tree would have
+            urls = {}
+            for branch_urls in branches:
+                urls.update(branch_urls)
+        else:
+            driver, urls = explore_browse_tree(driver, xpaths_bl, [], {})
         self.collection_urls = urls
+        self.collection_code = collection_code
+        if cache:
+            cache.save(collection_code, urls)
         driver.get(r'https://www.ancestry.co.uk')
 
         return urls
 
-    def scrape_collection(self):
+    def refresh_parish_urls(self, collection_code, option_names, cache=None):
+        '''
+        Re-collects only the branch of the browse tree below option_names (the option chosen at each of the
+        first len(option_names) browse levels), e.g. ['Kent'] or ['Kent', 'Canterbury, St Alphege'].
+        The branch is merged into self.collection_urls and, if given, the cache.
+        Returns: dictionary of the refreshed branch, as in get_parish_urls.
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate before attempting to collect urls.')
+        driver = self.authenticated_driver
+        cache = self._browse_cache(cache)
+        branch_urls = explore_browse_branch(driver, collection_code, option_names)
+        self.collection_urls = replace_branch(self.collection_urls or {}, branch_urls, option_names)
+        if cache:
+            cache.update_branches(collection_code, branch_urls, option_names)
+        driver.get(r'https://www.ancestry.co.uk')
+
+        return branch_urls
+
+    @staticmethod
+    def _browse_cache(cache):
+        if isinstance(cache, str):
+            return BrowseTreeCache(cache)
+        return cache
+
+    def scrape_collection(self, event_driven=False, journal=None, pipeline=False, workers=1, sink=None, profiler=None):
         '''
         Scrapes all records in a collection with urls contained in self.collection_urls.
-        Returns Pandas.DataFrame.
+        See scrape_record for event_driven.
+        journal (a directory or parish_scraper.checkpoint.ProgressJournal) makes the run resumable: records already
+        completed are read back from the journal (or skipped, if already written to sink) and a partially scraped
+        record resumes from its last page.
+        If pipeline, records are scraped by scrape_records_pipelined with a pool of workers drivers, and
+        self.pipeline holds the run's queue statistics.
+        If a sink (e.g. parish_scraper.sinks.ParquetSink) is given, each record is written to it as soon as it is
+        complete, partitioned by collection, browse labels and date range, and nothing is kept in memory.
+        profiler (a directory or parish_scraper.profiling.Profiler) profiles a sample of the records scraped
+        (without the pipeline), see scrape_record.
+        Returns Pandas.DataFrame, or None if a sink was given.
         '''
         if not self.authenticated_driver:
             raise AuthenticationError('Please authenticate before attempting to collect urls.')
@@ -404,33 +925,97 @@ class AncestryScraper:
         collection_urls = self.collection_urls
         if not collection_urls:
             return None
-        collection_dfs = []
+        if isinstance(journal, str):
+            journal = ProgressJournal(journal)
+        profiler = get_profiler(profiler)
+        record_keys = {url : (labels, date_range) for labels, url_dict in collection_urls.items()
+                       for date_range, url in url_dict.items()}
+
+        def label_record(url, df_record):
+            if sink is None:
+                return df_record
+            # Flush the finished record straight to the sink
+            labels, date_range = record_keys[url]
+            write_record(sink, df_record, labels, date_range, self.collection_code)
+            if journal:
+                journal.mark_written(url, len(df_record))
+            return None
+
+        pipelined_dfs = {}
+        if pipeline:
+            record_urls = [url for url in record_keys if not (journal and journal.is_complete(url))]
+            pipelined_dfs, self.pipeline = scrape_records_pipelined(self.get_driver_pool(workers), record_urls, event_driven, journal,
+                                                                    on_record=label_record)
+        record_dfs    = []
+        record_labels = []
         for labels, url_dict in collection_urls.items():
-            record_dfs = []
             for date_range, url in url_dict.items():
-                driver, df_record = scrape_record(driver, url)
-                df_record.insert(0, 'Record Date Range', date_range) 
-                record_dfs.append(df_record)
-            if record_dfs:
-                df_label = pd.concat(record_dfs, axis=0, ignore_index=True)
-            else:
-                df_label = pd.DataFrame()
-            for label_name, label_value in labels[::-1]:
-                df_label.insert(0, label_name, label_value)
-            collection_dfs.append(df_label)
-        if collection_dfs:
-            df_collection = pd.concat(collection_dfs, axis=0, ignore_index=True)
-        else:
-            df_collection = pd.DataFrame()
+                if url in pipelined_dfs:
+                    df_record = pipelined_dfs[url]
+                else:
+                    if journal and journal.is_complete(url):
+                        if sink is not None and journal.rows_written(url) is not None:
+                            # Already written to the sink by an earlier run
+                            continue
+                        df_record = journal.load_record(url)
+                    else:
+                        driver, df_record = scrape_record(driver, url, event_driven, journal=journal, profiler=profiler)
+                    df_record = label_record(url, df_record)
+                if df_record is not None:
+                    record_dfs.append(df_record)
+                    record_labels.append(list(labels) + [('Record Date Range', date_range)])
+        if sink is not None:
+            return None
+        # Build the collection frame once, with the labels as categorical columns
+        with get_metrics('ancestry').phase('concat'):
+            df_collection = concat_labelled(record_dfs, record_labels)
 
         return df_collection  
 
+    def enqueue_collection(self, queue):
+        '''
+        Adds the records of self.collection_urls to queue (a parish_scraper.workqueue.WorkQueue), so that any
+        number of workers (see work_on_queue) can scrape them.
+        Returns: number of records added.
+        '''
+        if not self.collection_urls:
+            return 0
+
+        return enqueue_records(queue, self.collection_urls, self.collection_code)
+
+    def work_on_queue(self, queue, sink, event_driven=False, journal=None, **kwargs):
+        '''
+        Scrapes records claimed from queue with self.authenticated_driver, writing each to sink as in scrape_collection,
+        until queue has no records left. Run in as many processes (or hosts) as there are drivers to share the work.
+        See parish_scraper.workqueue.run_worker for kwargs.
+        Returns: dict {state : number of records} of the records this worker worked on.
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate before attempting to collect urls.')
+        if isinstance(journal, str):
+            journal = ProgressJournal(journal)
+        handler = record_handler(self.authenticated_driver, sink, event_driven, journal)
+
+        return run_worker(queue, {ANCESTRY_RECORD : handler}, **kwargs)
+
+    @property
+    def metrics(self):
+        '''
+        The ScrapeMetrics (see parish_scraper.metrics) of every ancestry scrape in this process:
+        time spent navigating, waiting, throttled, extracting, parsing and concatenating, and counts of
+        pages, rows, refreshes, retries, timeouts and penalties.
+        '''
+        return get_metrics('ancestry')
+
     def shut_down(self):
         '''
-        Close chromedriver.
+        Close chromedriver (and any other drivers in the pool).
         '''
         driver = self.authenticated_driver
-        if driver:
+        if self.driver_pool:
+            self.driver_pool.close()
+            self.driver_pool = None
+        elif driver:
             driver.close()
         
         return 
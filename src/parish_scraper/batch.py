@@ -0,0 +1,243 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Runs a manifest of Ancestry collections and FamilySearch searches in one process, over shared pools of
+authenticated drivers (one browser boot and sign-in per driver, rather than per job).
+
+Manifest (json):
+    {
+        "output"          : "burials/",          directory for the results (optional: otherwise kept in memory)
+        "format"          : "csv",               csv or parquet
+        "workers"         : 4,                   jobs run at the same time
+        "drivers"         : {"ancestry" : 2, "family_search" : 2},   authenticated drivers per site
+        "browser_profile" : "performance",
+        "session_dir"     : "sessions/",         saved sign-in cookies, reused between runs (optional)
+        "ancestry"        : [{"collection_code" : "1234", "cache" : "browse_cache/", "event_driven" : true,
+                              "journal" : "journal/1234"}],
+        "family_search"   : [{"place_name" : "Canterbury, Kent, England", "year_from" : 1800, "year_to" : 1850,
+                              "backend" : "http", "plan" : true}]
+    }
+
+Run from the command line with:  parish-scraper-batch manifest.json
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import ancestry, family_search
+from .pool import DriverPool
+from .sinks import CsvSink, ParquetSink, Sink
+
+
+DEFAULT_DRIVERS = {'ancestry' : 1, 'family_search' : 1}
+
+CREDENTIALS = {'ancestry'      : ('ANC_USERNAME', 'ANC_PASSWORD'),
+               'family_search' : ('FS_USERNAME', 'FS_PASSWORD')}
+
+
+class CountingSink(Sink):
+    '''
+    Forwards every chunk to sink, counting the rows written.
+    '''
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.rows = 0
+
+    def write(self, df, partition=()):
+        self.rows += len(df)
+        self.sink.write(df, partition)
+
+
+def load_manifest(path):
+    '''
+    Returns: dict of the manifest (json) at path, checked for the keys each job needs.
+    '''
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    for job in manifest.get('ancestry', []):
+        if 'collection_code' not in job:
+            raise ValueError('Ancestry jobs need a collection_code: {}'.format(job))
+    for job in manifest.get('family_search', []):
+        missing = [key for key in ('place_name', 'year_from', 'year_to') if key not in job]
+        if missing:
+            raise ValueError('FamilySearch jobs need {}: {}'.format(', '.join(missing), job))
+
+    return manifest
+
+
+def make_driver_pool(site, size, browser_profile='default', session_dir=None):
+    '''
+    Returns a DriverPool of size drivers signed in to site (ancestry or family_search) lazily, with the
+    credentials in the site's environment variables.
+    '''
+    username_variable, password_variable = CREDENTIALS[site]
+    username, password = os.getenv(username_variable), os.getenv(password_variable)
+    module = ancestry if site == 'ancestry' else family_search
+    if not (username and password):
+        raise module.AuthenticationError('No username and/or password found in environment variables {} and {}.'.format(
+            username_variable, password_variable))
+    session_path = os.path.join(session_dir, '{}.pkl'.format(site)) if session_dir else None
+
+    return DriverPool(lambda: module.authenticate_driver(username, password, session_path, browser_profile), size=size)
+
+
+def run_ancestry_job(driver, job, sink):
+    '''
+    Scrapes the collection of an Ancestry job with driver.
+    Returns: pandas.DataFrame, or None if a sink was given.
+    '''
+    scraper = ancestry.AncestryScraper()
+    scraper.authenticated_driver = driver
+    scraper.get_parish_urls(job['collection_code'], cache=job.get('cache'))
+
+    return scraper.scrape_collection(event_driven=job.get('event_driven', False), journal=job.get('journal'), sink=sink)
+
+
+def run_family_search_job(driver, job, sink):
+    '''
+    Scrapes the burial records of a FamilySearch job with driver.
+    Returns: pandas.DataFrame, or None if a sink was given.
+    '''
+    scraper = family_search.FamilySearchScraper()
+    scraper.authenticated_driver = driver
+    try:
+        return scraper.get_burial_records(job['place_name'], job['year_from'], job['year_to'], backend=job.get('backend', 'browser'),
+                                          plan=job.get('plan', False), sink=sink)
+    finally:
+        if scraper.http_session:
+            scraper.http_session.close()
+
+
+def is_alive(driver):
+    '''
+    Returns False if driver no longer answers (its browser crashed or disconnected).
+    '''
+    try:
+        driver.current_url
+    except Exception:
+        return False
+
+    return True
+
+
+JOB_RUNNERS = {'ancestry'      : run_ancestry_job,
+               'family_search' : run_family_search_job}
+
+
+def job_name(site, job):
+    if site == 'ancestry':
+        return 'ancestry {}'.format(job['collection_code'])
+    return 'family_search {} {}-{}'.format(job['place_name'], job['year_from'], job['year_to'])
+
+
+def run_manifest(manifest, pools=None):
+    '''
+    Runs every job of manifest (see load_manifest), at most manifest['workers'] at a time, each with a driver
+    lent by its site's pool (pools, or pools of manifest['drivers'] drivers signed in when first needed).
+    A failed job does not stop the others.
+    Returns: list of dict {'job', 'site', 'status' ('done' or 'failed'), 'rows', 'seconds', 'error', 'df'} in manifest order
+    ('df' is None if the manifest has an output directory).
+    '''
+    jobs = [(site, job) for site in JOB_RUNNERS for job in manifest.get(site, [])]
+    if not jobs:
+        return []
+    sizes = dict(DEFAULT_DRIVERS, **manifest.get('drivers', {}))
+    pools = dict(pools or {})
+    created_pools = []
+    for site in {site for site, _ in jobs} - set(pools):
+        num_jobs = sum(1 for job_site, _ in jobs if job_site == site)
+        pools[site] = make_driver_pool(site, min(sizes[site], num_jobs), manifest.get('browser_profile', 'default'), manifest.get('session_dir'))
+        created_pools.append(pools[site])
+    sinks = {}
+    if manifest.get('output'):
+        sink_class = ParquetSink if manifest.get('format', 'csv') == 'parquet' else CsvSink
+        sinks = {site : sink_class(os.path.join(manifest['output'], site)) for site in pools}
+
+    def run_job(site, job):
+        result = {'job' : job_name(site, job), 'site' : site, 'status' : 'done', 'rows' : 0, 'seconds' : 0.0, 'error' : None, 'df' : None}
+        start = time.perf_counter()
+        try:
+            pool = pools[site]
+            sink = CountingSink(sinks[site]) if site in sinks else None
+            # Drivers are signed in as jobs first need them, not all at once
+            with pool.acquire(grow=True) as driver:
+                try:
+                    df = JOB_RUNNERS[site](driver, job, sink)
+                except Exception:
+                    # Slow pages and missing elements leave the driver usable; a crashed or disconnected
+                    # browser is replaced by a new sign-in for the next job
+                    if not is_alive(driver):
+                        pool.discard(driver)
+                    raise
+            if sink is None:
+                result['df'] = df
+                result['rows'] = 0 if df is None else len(df)
+            else:
+                result['rows'] = sink.rows
+        except Exception:
+            result['status'] = 'failed'
+            result['error'] = traceback.format_exc()
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=manifest.get('workers', sum(pool.size for pool in pools.values()))) as executor:
+            results = list(executor.map(lambda site_job: run_job(*site_job), jobs))
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        for pool in created_pools:
+            pool.close()
+
+    return results
+
+
+def format_summary(results, seconds=None):
+    '''
+    Returns: str table of the status, rows and time of each job.
+    '''
+    width = max([len(result['job']) for result in results] + [3])
+    lines = ['{:<{width}} {:>7} {:>9} {:>9}'.format('job', 'status', 'rows', 'seconds', width=width)]
+    for result in results:
+        lines.append('{:<{width}} {:>7} {:>9} {:>9.1f}'.format(result['job'], result['status'], result['rows'], result['seconds'], width=width))
+    done = sum(result['status'] == 'done' for result in results)
+    lines.append('{} of {} jobs done, {} rows'.format(done, len(results), sum(result['rows'] for result in results))
+                 + (' in {:.1f}s'.format(seconds) if seconds is not None else ''))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    '''
+    Command line entry point (parish-scraper-batch): runs a manifest and prints a summary of its jobs.
+    Exits with status 1 if any job failed.
+    '''
+    arg_parser = argparse.ArgumentParser(description='Runs a manifest of Ancestry and FamilySearch scraping jobs.')
+    arg_parser.add_argument('manifest', help='path of the manifest (json)')
+    arg_parser.add_argument('--summary', help='path to write the job results to (json)')
+    args = arg_parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run_manifest(load_manifest(args.manifest))
+    seconds = time.perf_counter() - start
+    print(format_summary(results, seconds))
+    for result in results:
+        if result['error']:
+            print('\n{} failed:\n{}'.format(result['job'], result['error']), file=sys.stderr)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump({'seconds' : seconds, 'jobs' : [{key : value for key, value in result.items() if key != 'df'} for result in results]}, f, indent=1)
+
+    return 1 if any(result['status'] == 'failed' for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
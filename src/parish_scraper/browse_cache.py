@@ -0,0 +1,107 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: BrowseTreeCache
+An on-disk cache of Ancestry collection browse trees ({labels : {date range : url}}), keyed by collection code.
+'''
+
+import json
+import os
+import threading
+import time
+
+
+def replace_branch(tree, branch_urls, option_names=()):
+    '''
+    Returns a copy of the browse tree with every entry below option_names replaced by branch_urls.
+    '''
+    option_names = tuple(option_names)
+    tree = {url_key : urls_dict for url_key, urls_dict in tree.items()
+            if tuple(option for _, option in url_key[:len(option_names)]) != option_names}
+    tree.update(branch_urls)
+
+    return tree
+
+
+class BrowseTreeCache:
+    '''
+    Stores each collection's browse tree as directory/<collection_code>.json.
+    Entries older than ttl seconds (default 30 days) are treated as missing; ttl=None never expires.
+    '''
+
+    def __init__(self, directory, ttl=30 * 24 * 60 * 60):
+        self.directory = directory
+        self.ttl       = ttl
+        self._lock     = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, collection_code):
+        return os.path.join(self.directory, '{}.json'.format(collection_code))
+
+    @staticmethod
+    def _to_json(urls):
+        # Tuple keys (((label, option), ...)) are not valid json keys, so store a list of [key, urls_dict] pairs.
+        return [[[list(pair) for pair in url_key], urls_dict] for url_key, urls_dict in urls.items()]
+
+    @staticmethod
+    def _from_json(tree):
+        return {tuple(tuple(pair) for pair in url_key) : urls_dict for url_key, urls_dict in tree}
+
+    def _read(self, collection_code):
+        path = self._path(collection_code)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write(self, collection_code, entry):
+        path = self._path(collection_code)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def load(self, collection_code):
+        '''
+        Returns the cached browse tree for collection_code, or None if it is missing or has expired.
+        '''
+        entry = self._read(collection_code)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry['saved'] > self.ttl:
+            return None
+
+        return self._from_json(entry['tree'])
+
+    def save(self, collection_code, urls):
+        '''
+        Replaces the cached browse tree for collection_code with urls.
+        '''
+        with self._lock:
+            self._write(collection_code, {'saved' : time.time(), 'tree' : self._to_json(urls)})
+
+    def update_branches(self, collection_code, urls, option_names=()):
+        '''
+        Replaces the branch of the cached browse tree for collection_code below option_names with urls,
+        keeping the rest of the tree. The entry's age is not reset, as the rest of the tree has not been refreshed.
+        '''
+        with self._lock:
+            entry = self._read(collection_code) or {'saved' : time.time(), 'tree' : []}
+            tree = replace_branch(self._from_json(entry['tree']), urls, option_names)
+            entry['tree'] = self._to_json(tree)
+            self._write(collection_code, entry)
+
+    def invalidate(self, collection_code=None):
+        '''
+        Removes the cached browse tree for collection_code (or every cached tree if collection_code is None).
+        '''
+        with self._lock:
+            if collection_code is None:
+                names = [name for name in os.listdir(self.directory) if name.endswith('.json')]
+            else:
+                names = ['{}.json'.format(collection_code)]
+            for name in names:
+                path = os.path.join(self.directory, name)
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,198 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: ProgressJournal
+A durable on-disk record of scraping progress, so that interrupted runs can skip finished work and resume mid-record.
+Journals in several processes (e.g. work queue workers) can share a directory: each record's log is read and
+appended under a file lock, so a record whose worker died resumes from its last page in another worker.
+'''
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+from .dedup import RowDeduplicator
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: journals are then shared within a process only.
+    fcntl = None
+
+
+LOG_NAME = 'journal.jsonl'
+
+
+def _new_record():
+    return {'done' : False, 'pages' : 0, 'page_url' : None, 'frames' : [], 'written' : None, 'offset' : 0}
+
+
+def _apply_event(record, event):
+    if 'page' in event:
+        if event['frame']:
+            record['frames'].append(event['page'])
+        record['pages']    = event['page'] + 1
+        record['page_url'] = event['page_url']
+    if event.get('done'):
+        record['done'] = True
+    if 'written' in event:
+        record['written'] = event['written']
+
+
+class ProgressJournal:
+    '''
+    Progress journal for AncestryScraper.scrape_collection, keyed by record url.
+    Layout of directory, one sub-directory per record:
+        <record hash>/journal.jsonl   a line per event: {'page' : int, 'page_url' : str, 'frame' : bool} for each
+                                      page scraped, then {'done' : true} once the record is complete and
+                                      {'written' : int} once its rows have been written to a sink
+        <record hash>/00000.pkl       DataFrame of each scraped page (pages without an index have no frame)
+    Events are appended to the record's log, and only the lines appended since the last read (by this or any other
+    journal over directory) are read back, so a checkpoint costs the same however many records and pages have been journaled.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock     = threading.Lock()
+        self._records  = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _record_directory(self, record_url):
+        return os.path.join(self.directory, hashlib.sha1(record_url.encode('utf-8')).hexdigest())
+
+    def _replay(self, record_url, f):
+        # Brings the cached state of the record up to date with the lines appended to its log since it was last read.
+        record = self._records.get(record_url)
+        if record is None or os.fstat(f.fileno()).st_size < record['offset']:
+            record = self._records[record_url] = _new_record()
+        f.seek(record['offset'])
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Left half-written by a crash
+                break
+            _apply_event(record, json.loads(line))
+            record['offset'] += len(line)
+
+        return record
+
+    @contextlib.contextmanager
+    def _log(self, record_url, write=False):
+        '''
+        Context manager yielding (log file or None, state of the record at record_url).
+        '''
+        with self._lock:
+            log_path = os.path.join(self._record_directory(record_url), LOG_NAME)
+            if write:
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            try:
+                f = open(log_path, 'ab+' if write else 'rb')
+            except FileNotFoundError:
+                self._records.pop(record_url, None)
+                yield None, _new_record()
+                return
+            with f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+                record = self._replay(record_url, f)
+                if write:
+                    f.truncate(record['offset'])
+                yield f, record
+
+    def _append(self, f, record, event):
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        f.write(line)
+        f.flush()
+        _apply_event(record, event)
+        record['offset'] += len(line)
+
+    def is_complete(self, record_url):
+        '''
+        Returns True if every page of the record at record_url has been scraped.
+        '''
+        with self._log(record_url) as (_, record):
+            return record['done']
+
+    def resume_point(self, record_url):
+        '''
+        Returns (number of pages scraped, url of the last page scraped) for a partially scraped record, otherwise None.
+        '''
+        with self._log(record_url) as (_, record):
+            if record['done'] or not record['pages']:
+                return None
+            return record['pages'], record['page_url']
+
+    def record_page(self, record_url, page_url, df):
+        '''
+        Saves the DataFrame (or None) of the next page of the record at record_url, scraped from page_url.
+        '''
+        with self._log(record_url, write=True) as (f, record):
+            page = record['pages']
+            if df is not None:
+                df.to_pickle(os.path.join(self._record_directory(record_url), '{:05d}.pkl'.format(page)))
+            self._append(f, record, {'page' : page, 'page_url' : page_url, 'frame' : df is not None})
+
+    def complete_record(self, record_url):
+        '''
+        Marks the record at record_url as fully scraped.
+        '''
+        with self._log(record_url, write=True) as (f, record):
+            self._append(f, record, {'done' : True})
+
+    def mark_written(self, record_url, rows):
+        '''
+        Records that the complete record at record_url (rows rows) has been written to the run's sink,
+        so that resumed runs do not write it again.
+        '''
+        with self._log(record_url, write=True) as (f, record):
+            self._append(f, record, {'written' : rows})
+
+    def rows_written(self, record_url):
+        '''
+        Returns the number of rows of the record at record_url written to a sink, or None if it has not been written.
+        '''
+        with self._log(record_url) as (_, record):
+            return record['written']
+
+    def load_record(self, record_url):
+        '''
+        Returns the journaled pages of the record at record_url as one pandas.DataFrame (as returned by scrape_record).
+        '''
+        # Pages are deduplicated as they are read, as a resumed run may have journaled rows twice
+        dedup   = RowDeduplicator()
+        df_list = [dedup.filter(df) for df in self.iter_record_frames(record_url)]
+        if df_list:
+            return pd.concat(df_list, ignore_index=True)
+        return pd.DataFrame([], columns = [])
+
+    def iter_record_frames(self, record_url):
+        '''
+        Yields the DataFrame of each journaled page of the record at record_url, in page order.
+        '''
+        with self._log(record_url) as (_, record):
+            frames = list(record['frames'])
+        record_directory = self._record_directory(record_url)
+        for page in frames:
+            yield pd.read_pickle(os.path.join(record_directory, '{:05d}.pkl'.format(page)))
+
+    def reset(self, record_url=None):
+        '''
+        Forgets the progress of the record at record_url (or of every record if record_url is None).
+        '''
+        with self._lock:
+            if record_url:
+                record_directories = [self._record_directory(record_url)]
+            else:
+                record_directories = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                                      if os.path.exists(os.path.join(self.directory, name, LOG_NAME))]
+            for record_directory in record_directories:
+                shutil.rmtree(record_directory, ignore_errors=True)
+            if record_url:
+                self._records.pop(record_url, None)
+            else:
+                self._records = {}
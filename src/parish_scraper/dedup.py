@@ -0,0 +1,81 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: RowDeduplicator
+Content hashes for detecting repeated pages and rows while a record is scraped, so that duplicates are dropped
+as each page arrives rather than by a drop_duplicates pass over the whole record at the end.
+'''
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+def page_fingerprint(html):
+    '''
+    Returns a short content hash (hex string) of a page's html.
+    '''
+    return hashlib.blake2b(html.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def row_hashes(df):
+    '''
+    Returns a uint64 hash of every row of df (its values and column names; the index is ignored).
+    '''
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+    # Combine with the column names, so that rows with the same values under different columns differ
+    columns_hash = int.from_bytes(hashlib.blake2b(repr(list(df.columns)).encode('utf-8'), digest_size=8).digest(), 'little')
+
+    return hashes ^ np.uint64(columns_hash)
+
+
+class RowDeduplicator:
+    '''
+    Remembers the hash of every row it has let through, and filters rows already seen out of later frames.
+    Filtering each page of a record in turn keeps the same rows, in the same order, as drop_duplicates() on the
+    concatenated record, as long as its pages share their columns (rows under different columns never match).
+    Whole pages seen before can be dropped before they are parsed with is_new_page.
+    '''
+
+    def __init__(self):
+        self.seen  = set()
+        self.pages = set()
+
+    def __len__(self):
+        return len(self.seen)
+
+    def is_new_page(self, html):
+        '''
+        Returns False if a page with the same html (by page_fingerprint) has been seen before, else remembers it.
+        '''
+        fingerprint = page_fingerprint(html)
+        if fingerprint in self.pages:
+            return False
+        self.pages.add(fingerprint)
+
+        return True
+
+    def filter(self, df):
+        '''
+        Returns the rows of df not seen before (df itself if there are none to drop), and remembers them.
+        '''
+        if df is None or df.empty:
+            return df
+        keep = np.zeros(len(df), dtype=bool)
+        for i, row_hash in enumerate(row_hashes(df).tolist()):
+            if row_hash not in self.seen:
+                self.seen.add(row_hash)
+                keep[i] = True
+        if keep.all():
+            return df
+
+        return df[keep].reset_index(drop=True)
+
+    def update(self, df):
+        '''
+        Remembers the rows of df without filtering anything.
+        '''
+        if df is not None and not df.empty:
+            self.seen.update(row_hashes(df).tolist())
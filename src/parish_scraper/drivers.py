@@ -0,0 +1,86 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Booting up chromedriver, either as a full visible browser ('default' profile) or as a headless browser which
+does not download images, media or fonts ('performance' profile).
+'''
+
+import os
+import shutil
+
+from selenium import webdriver
+
+
+BROWSER_PROFILES = ('default', 'performance')
+
+# Requests blocked in the 'performance' profile. Only index tables are read, so none of these are needed.
+BLOCKED_URL_PATTERNS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp', '*.tif', '*.tiff',
+                        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+                        '*.mp4', '*.webm', '*.ogg', '*.mp3', '*.wav', '*.m4a']
+
+
+def find_chromedriver():
+    '''
+    Returns the path of the chromedriver binary: $CHROMEDRIVER_PATH, else chromedriver(.exe) on the PATH,
+    else chromedriver.exe in the working directory.
+    '''
+    path = os.getenv('CHROMEDRIVER_PATH') or shutil.which('chromedriver') or shutil.which('chromedriver.exe')
+    if path:
+        return path
+
+    return 'chromedriver.exe'
+
+
+def make_chrome_options(user_agent, browser_profile='default'):
+    '''
+    Returns webdriver.ChromeOptions minimizing detectability, with the extra settings of browser_profile.
+    '''
+    if browser_profile not in BROWSER_PROFILES:
+        raise ValueError('browser_profile must be one of {}.'.format(BROWSER_PROFILES))
+    # Change settings to minimize detectability
+    option = webdriver.ChromeOptions()
+    # For older ChromeDriver under version 79.0.3945.16
+    option.add_experimental_option("excludeSwitches", ["enable-automation"])
+    option.add_experimental_option('useAutomationExtension', False)
+    #For ChromeDriver version 79.0.3945.16 or over
+    option.add_argument('--disable-blink-features=AutomationControlled')
+    # Change resolution and user-agent (the user-agent also hides "HeadlessChrome")
+    option.add_argument("window-size=1280,800")
+    option.add_argument("user-agent={}".format(user_agent))
+    if browser_profile == 'performance':
+        option.add_argument('--headless')
+        option.add_argument('--disable-gpu')
+        option.add_argument('--disable-extensions')
+        option.add_argument('--disable-dev-shm-usage')
+        option.add_argument('--blink-settings=imagesEnabled=false')
+        option.add_argument('--mute-audio')
+        option.add_experimental_option('prefs', {'profile.managed_default_content_settings.images'        : 2,
+                                                 'profile.default_content_setting_values.notifications' : 2,
+                                                 'profile.managed_default_content_settings.media_stream'  : 2})
+        if os.name == 'posix' and hasattr(os, 'geteuid') and os.geteuid() == 0:
+            # Chrome refuses to start as root with the sandbox enabled (e.g. in containers)
+            option.add_argument('--no-sandbox')
+
+    return option
+
+
+def boot_up_chrome(user_agent, browser_profile='default', executable_path=None):
+    '''
+    Boots up chromedriver with the given user agent and browser_profile ('default' or 'performance').
+    Returns webdriver.Chrome object.
+    '''
+    option = make_chrome_options(user_agent, browser_profile)
+    #Open Browser
+    driver = webdriver.Chrome(executable_path=executable_path or find_chromedriver(), options=option)
+    if browser_profile == 'performance':
+        # Block fonts and media (images are also disabled in the options) at the network level
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls' : BLOCKED_URL_PATTERNS})
+        except:
+            pass
+    else:
+        driver.maximize_window()
+
+    return driver
@@ -6,76 +6,86 @@ Class: FamilySearchScraper.
 A selenium-based webscraping bot which gathers burial data from FamilySearch.org.
 '''
 #%%
-import numpy as np
-import pandas as pd
-import requests
 import re
 import os
-import pickle
-import urllib
-import urllib.parse as urlparse
 import math
 import time
+import functools
+import warnings
 
 from urllib.parse import urlencode
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
-from selenium.common.exceptions import StaleElementReferenceException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from pyshadow.main import Shadow
 
+# pandas, requests, selenium and pyshadow are imported by the functions which use them, so that importing
+# the module (e.g. for its query or planning helpers, or in pipeline parse workers) stays cheap.
+from .metrics import get_metrics
+from .parsing import get_burial_info, parse_results_json, parse_table_rows, results_json_frame
+from .pipeline import ScrapePipeline
+from .pool import DriverPool
+from .profiling import get_profiler, profiled
+from .sessions import restore_session, save_session
+from .throttle import get_limiter
+from .waits import adaptive_wait
+from .workqueue import SEARCH_SHARD, enqueue_search_shards, run_worker
 
-def boot_up_driver():
+
+class AuthenticationError(Exception):
+    pass
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36"
+
+# Search results pages (browser backend) and the search service behind them (http backend)
+RESULTS_URL = r'https://www.familysearch.org/search/record/results/?'
+SERVICE_URL = r'https://www.familysearch.org/service/search/hr/v2/personas?'
+
+# The search does not serve results beyond this many (deeper offsets return nothing)
+MAX_RESULTS = 5000
+
+
+def boot_up_driver(browser_profile='default', executable_path=None):
     '''
     Boots up chromedriver with minimal detectability.
+    browser_profile='performance' runs headless without downloading images, media or fonts (see parish_scraper.drivers).
     Returns webdriver.Chrome object.
     '''
-    # Change settings to minimize detectability
-    option = webdriver.ChromeOptions()
-    # For older ChromeDriver under version 79.0.3945.16
-    option.add_experimental_option("excludeSwitches", ["enable-automation"])
-    option.add_experimental_option('useAutomationExtension', False)
-    #For ChromeDriver version 79.0.3945.16 or over
-    option.add_argument('--disable-blink-features=AutomationControlled')
-    # Change resolution and user-agent
-    option.add_argument("window-size=1280,800")
-    option.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36")
-    #Open Browser
-    driver = webdriver.Chrome(executable_path='chromedriver.exe',options=option)
-    driver.maximize_window()
+    from .drivers import boot_up_chrome
 
-    return driver
+    return boot_up_chrome(USER_AGENT, browser_profile, executable_path)
 
 
 def accept_cookies(driver):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
     iframe_xpath = r'/html/body/div[3]/div/iframe'
-    frame = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,iframe_xpath)))
+    frame = adaptive_wait(driver, 'family_search.cookie_frame', 10).until(EC.presence_of_element_located((By.XPATH,iframe_xpath)))
     if frame.is_displayed():
         driver.switch_to.frame(frame)
     xpath_agree = r'/html/body/div[8]/div[1]/div/div[3]/a[1]'
-    agree_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, xpath_agree)))
+    agree_button = adaptive_wait(driver, 'family_search.cookie_agree', 10).until(EC.presence_of_element_located((By.XPATH, xpath_agree)))
     agree_button.click()
 
     return driver
 
 
 def sign_in(driver, username, password):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
     xpath_username = r'//*[@id="userName"]'
     xpath_password = r'//*[@id="password"]'
     xpath_signin  = r'//*[@id="login"]'
-    user_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_username)))
-    pass_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_password)))
-    signin_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH,xpath_signin)))
+    user_input = adaptive_wait(driver, 'family_search.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_username)))
+    pass_input = adaptive_wait(driver, 'family_search.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_password)))
+    signin_button = adaptive_wait(driver, 'family_search.sign_in_form', 10).until(EC.presence_of_element_located((By.XPATH,xpath_signin)))
     user_input.send_keys(username)
     pass_input.send_keys(password)
     signin_button.click()
-    time.sleep(5)
 
-    if driver.current_url != r'https://www.familysearch.org/':
+    try:
+        adaptive_wait(driver, 'family_search.sign_in_redirect', 10).until(EC.url_to_be(r'https://www.familysearch.org/'))
+    except TimeoutException:
         raise AuthenticationError('Sign-in failed. Please ensure username and password are correct.')
 
     return driver
@@ -104,13 +114,10 @@ def scrape_table(shadow_driver, table):
         cell_places = shadow_driver.find_elements(cell_event, r'span.event-place')
         cell_place_texts = [cell_place.text for cell_place in cell_places]
 
-        cell_info = list(zip(cell_event_texts, cell_date_texts, cell_place_texts))
         # Take only burial info
-        pattern = re.compile(r'(B|b)urial')
-        burial_info = [info for info in cell_info if pattern.match(info[0])]
+        burial_info = get_burial_info(cell_event_texts, cell_date_texts, cell_place_texts)
         if burial_info:
-            burial_date = burial_info[0][1]
-            burial_place = burial_info[0][2]
+            burial_date, burial_place = burial_info
             dates.append(burial_date)
             places.append(burial_place)
             names.append(cell_name_text)
@@ -119,30 +126,659 @@ def scrape_table(shadow_driver, table):
 
     return table_data
 
+
+@functools.lru_cache(maxsize=None)
+def shadow_helper_script():
+    '''
+    Returns the script exposing pyshadow's query library on window, so it only has to be sent to the browser once per driver.
+    '''
+    from pyshadow.main import Shadow
+
+    return '''
+(function() {
+    if (window.__parishShadow) { return; }
+''' + Shadow.javascript_library + '''
+    window.__parishShadow = {getObject : getObject, getAllObject : getAllObject, isVisible : isVisible};
+})();
+'''
+
+# Returns [helper installed, the visible element matching arguments[0] (below arguments[1], if given) or null].
+FIND_ELEMENT_SCRIPT = '''
+var shadow = window.__parishShadow;
+if (!shadow) { return [false, null]; }
+var element = null;
+try { element = shadow.getObject(arguments[0], arguments[1] || document); } catch (e) {}
+return [true, element && shadow.isVisible(element) ? element : null];
+'''
+
+# Reads name, event-type, date and place texts (innerText, see parish_scraper.parsing.parse_table_rows) for every
+# row of a results table in one call. Returns null if the shadow helper is not installed on the current page.
+SCRAPE_TABLE_SCRIPT = '''
+var table = arguments[0];
+var shadow = window.__parishShadow;
+if (!shadow) { return null; }
+var text = function(element) { return element.innerText || ''; };
+var rows = Array.prototype.slice.call(table.getElementsByTagName('div'), 1);
+return rows.map(function(row) {
+    var cellName = row.querySelector('span > sr-cell-name');
+    var cellEvent = row.querySelector('span > sr-cell-events');
+    if (!cellName || !cellEvent) { return null; }
+    var texts = function(selector) { return (shadow.getAllObject(selector, cellEvent) || []).map(text); };
+    return [cellName.getAttribute('name'), texts('span.event-type'), texts('span.event-date'), texts('span.event-place')];
+});
+'''
+
+
+def install_shadow_helper(driver):
+    '''
+    Injects the shadow DOM query helper into the current page and, where the driver supports the
+    chrome devtools protocol, registers it to run on every page the driver loads from now on.
+    '''
+    if not getattr(driver, '_shadow_helper_registered', False):
+        try:
+            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source' : shadow_helper_script()})
+            driver._shadow_helper_registered = True
+        except:
+            pass
+    driver.execute_script(shadow_helper_script())
+
+    return driver
+
+
+def find_shadow_element(driver, css_selector, parent=None):
+    '''
+    Returns the visible element matching css_selector, searching through shadow roots (below parent, if given),
+    with the shadow DOM query helper installed on the page (see install_shadow_helper).
+    Raises NoSuchElementException if no such element is displayed.
+    '''
+    from selenium.common.exceptions import NoSuchElementException
+
+    installed, element = driver.execute_script(FIND_ELEMENT_SCRIPT, css_selector, parent)
+    if not installed:
+        install_shadow_helper(driver)
+        installed, element = driver.execute_script(FIND_ELEMENT_SCRIPT, css_selector, parent)
+    if element is None:
+        raise NoSuchElementException('No element with CSS {} is displayed.'.format(css_selector))
+
+    return element
+
+
+class ShadowHelper:
+    '''
+    Stand-in for QuietShadow whose find_element goes through the installed shadow DOM query helper
+    (see find_shadow_element), rather than sending pyshadow's library with every query.
+    '''
+    def __init__(self, driver):
+        self.driver = driver
+
+    def find_element(self, css_selector, parent=None):
+        return find_shadow_element(self.driver, css_selector, parent)
+
+
+def scrape_table_batched(driver, table):
+    '''
+    Returns the same Name, Date and Place data as scrape_table, but reads every row of the web element table
+    in a single script call rather than several WebDriver round trips per row.
+    '''
+    from selenium.common.exceptions import NoSuchElementException
+
+    rows = driver.execute_script(SCRAPE_TABLE_SCRIPT, table)
+    if rows is None:
+        install_shadow_helper(driver)
+        rows = driver.execute_script(SCRAPE_TABLE_SCRIPT, table)
+    if any(row is None for row in rows):
+        raise NoSuchElementException('Results row without sr-cell-name or sr-cell-events.')
+
+    return parse_table_rows(rows)
+
         
-def get_max_offset(shadow):
+def get_num_results(shadow):
     '''
-    Returns the maximum value for the offset query string given the number of results found.
+    Returns the number of results found, as shown by the search criteria of the results page.
     '''
     num_results_element = shadow.find_element(r'p.search-criteria')
     pattern = re.compile(r'of [0-9]+ Results')
     num_results_text = num_results_element.text.replace(',', '')
     num_results = int(pattern.findall(num_results_text)[0][3:-8])
-    max_offset = 100 * math.floor(num_results/100)
+
+    return num_results
+
+
+def get_max_offset(shadow):
+    '''
+    Returns the maximum value for the offset query string given the number of results found.
+    '''
+    max_offset = max_offset_for(get_num_results(shadow))
     
     return max_offset
 
 
-class QuietShadow(Shadow):
+def max_offset_for(num_results):
     '''
-    Modified Shadow object without irritating print('QA--QAQA True') in is_present method.
+    Returns the maximum value for the offset query string for a search with num_results results.
     '''
-    def __init__(self, driver):
-        super().__init__(driver)
-        
-    def is_present(self, element):
-        present = self.executor_get_object("return isVisible(arguments[0]);", element)
-        return present
+    return 100 * math.floor(num_results/100)
+
+
+def year_bounds(year):
+    '''
+    Returns (year_from, year_to) of year: a single year, or a (year_from, year_to) range of years.
+    '''
+    if isinstance(year, tuple):
+        return year
+
+    return year, year
+
+
+def year_label(year):
+    '''
+    Returns year (a single year or a (year_from, year_to) range) as a string, e.g. '1801' or '1801-1810'.
+    '''
+    year_from, year_to = year_bounds(year)
+    if year_from == year_to:
+        return str(year_from)
+
+    return '{}-{}'.format(year_from, year_to)
+
+
+def make_query_params(place_name, year_from, year_to, offset=0, count=100):
+    '''
+    Returns the query string parameters (dict) for a burial search of place_name between year_from and year_to,
+    for a page of count results starting at offset.
+    '''
+    params = {
+            'q.deathLikePlace'                : '{}'.format(place_name),
+            'q.deathLikePlace.exact'          : 'on',
+            'q.deathLikeDate.from'            : '{}'.format(year_from),
+            'q.deathLikeDate.to'              : '{}'.format(year_to),
+            'm.defaultFacets'                 : 'on',
+            'm.queryRequireDefault'           : 'on',
+            'm.facetNestCollectionInCategory' : 'on',
+            'count'                           : '{}'.format(count),
+            'offset'                          : '{}'.format(offset)
+            }
+
+    return params
+
+
+def make_results_url(params):
+    '''
+    Returns the url of the search results page for the query string parameters params.
+    '''
+    return RESULTS_URL + urlencode(params)
+
+
+def load_results_page(driver, params):
+    '''
+    Loads the search results page for the query string parameters params, refreshing (and slowing down)
+    until its results table is displayed.
+    Returns: Tuple (ShadowHelper of driver, results table web element, or None if the table was not displayed).
+    '''
+    limiter = get_limiter('family_search')
+    metrics = get_metrics('family_search')
+    limiter.acquire()
+    with metrics.phase('navigation'):
+        driver.get(make_results_url(params))
+
+    shadow = ShadowHelper(driver)
+    success = False
+    while not success:
+        try:
+            with metrics.phase('wait'):
+                spinner = shadow.find_element(r'fs-spinner')
+                table_displayed = adaptive_wait(driver, 'family_search.results_spinner', 10).until(lambda x : bool(spinner.get_attribute('style')))
+                sr_table = shadow.find_element(r'div.table')
+            success = True
+        except:
+            # An alert page or missing spinner usually means we are being throttled: slow down before refreshing.
+            metrics.increment('refreshes')
+            limiter.penalize()
+            limiter.acquire()
+            with metrics.phase('navigation'):
+                driver.refresh()
+    limiter.reward()
+
+    return shadow, sr_table if table_displayed else None
+
+
+def fetch_results_page(driver, place_name, year, offset=0):
+    '''
+    Fetches one page (up to 100 rows) of burial records for place_name in year (a single year or a
+    (year_from, year_to) range), starting at offset.
+    The number of results is only read from the first page (offset 0).
+    Returns: Tuple (max_offset, table data as returned by scrape_table). Both are None if no results were found.
+    '''
+    metrics = get_metrics('family_search')
+    shadow, sr_table = load_results_page(driver, make_query_params(place_name, *year_bounds(year), offset=offset))
+    metrics.increment('pages')
+
+    max_offset = None
+    if sr_table is None:
+        return max_offset, None
+    with metrics.phase('extraction'):
+        # Try finding the number of results
+        if offset == 0:
+            try:
+                max_offset = get_max_offset(shadow)
+            # If exception thrown, assume no results found.
+            except:
+                return None, None
+
+        table_data = scrape_table_batched(driver, sr_table)
+
+    return max_offset, table_data
+
+
+def scrape_results_page(driver, place_name, year, offset=0):
+    '''
+    Scrapes one page (up to 100 rows) of burial records for place_name in year (a single year or a
+    (year_from, year_to) range), starting at offset.
+    The number of results is only read from the first page (offset 0).
+    Returns: Tuple (max_offset, pandas.DataFrame). Both are None if no results were found.
+    '''
+    import pandas as pd
+
+    max_offset, table_data = fetch_results_page(driver, place_name, year, offset)
+    if table_data is None:
+        return max_offset, None
+    metrics = get_metrics('family_search')
+    with metrics.phase('parse'):
+        df = pd.DataFrame(table_data)
+    metrics.increment('rows', len(df))
+
+    return max_offset, df
+
+
+def scrape_year(driver, place_name, year, page_func=scrape_results_page):
+    '''
+    Scrapes every page of burial records for place_name in year (a single year or a (year_from, year_to) range).
+    page_func fetches a single page: scrape_results_page (browser) or scrape_results_page_http (session).
+    Returns: pandas.DataFrame, or None if no results were found.
+    '''
+    import pandas as pd
+
+    max_offset, df = page_func(driver, place_name, year, 0)
+    if df is None:
+        return None
+    dfs_year = [df]
+    for offset in range(100, max_offset + 1, 100):
+        _, df = page_func(driver, place_name, year, offset)
+        if df is not None:
+            dfs_year.append(df)
+
+    with get_metrics('family_search').phase('concat'):
+        return pd.concat(dfs_year, axis=0, ignore_index=True)
+
+
+def scrape_years_parallel(pool, place_name, years, workers=None, page_func=scrape_results_page, on_year=None):
+    '''
+    Scrapes burial records for place_name in each of years (single years or (year_from, year_to) ranges),
+    sharding the (year, offset) pages over the drivers in pool.
+    First pages are fetched for every year, then the remaining offsets are spread over the pool.
+    If given, on_year(year, DataFrame) is called for each year with results (once all pages are in),
+    and its return value is kept instead of the DataFrame.
+    Returns: list of pandas.DataFrame (one per year with results), in year order.
+    '''
+    import pandas as pd
+
+    years = list(years)
+    first_pages = pool.map(lambda driver, year: page_func(driver, place_name, year, 0), years, workers)
+
+    shards = []
+    for year, (max_offset, df) in zip(years, first_pages):
+        if df is not None:
+            shards += [(year, offset) for offset in range(100, max_offset + 1, 100)]
+    other_pages = pool.map(lambda driver, shard: page_func(driver, place_name, *shard)[1], shards, workers)
+
+    # Merge pages back together in (year, offset) order
+    pages_by_year = {year : [df] for year, (_, df) in zip(years, first_pages) if df is not None}
+    for (year, offset), df in zip(shards, other_pages):
+        if df is not None:
+            pages_by_year[year].append(df)
+    list_dfs = []
+    for year in years:
+        if year in pages_by_year:
+            with get_metrics('family_search').phase('concat'):
+                df_year = pd.concat(pages_by_year.pop(year), axis=0, ignore_index=True)
+            list_dfs.append(on_year(year, df_year) if on_year else df_year)
+
+    return list_dfs
+
+
+def make_http_session(driver, pool_size=10):
+    '''
+    Returns a requests.Session carrying the cookies (and session token) of the authenticated driver.
+    The session's connection pool holds pool_size connections, so it can be shared between worker threads.
+    '''
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    session.headers.update({'User-Agent' : driver.execute_script('return navigator.userAgent;'),
+                            'Accept'     : 'application/json'})
+    session_id = session.cookies.get('fssessionid')
+    if session_id:
+        session.headers['Authorization'] = 'Bearer {}'.format(session_id)
+
+    return session
+
+
+def fetch_results_json(session, params, timeout=30, max_retries=5):
+    '''
+    Fetches the structured search results payload for the query string parameters params.
+    Requests are rate limited (see parish_scraper.throttle) and retried up to max_retries times when throttled.
+    Returns: dict (decoded json).
+    '''
+    import requests
+
+    limiter = get_limiter('family_search')
+    metrics = get_metrics('family_search')
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            with metrics.phase('navigation'):
+                response = session.get(SERVICE_URL + urlencode(params), timeout=timeout)
+        except requests.Timeout:
+            metrics.increment('timeouts')
+            raise
+        if response.status_code not in (429, 503):
+            break
+        # Throttled: slow down (at least for as long as the server asks) and try again
+        metrics.increment('retries')
+        backoff = limiter.penalize()
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit() and int(retry_after) > backoff:
+            time.sleep(int(retry_after) - backoff)
+    if response.status_code in (401, 403):
+        raise AuthenticationError('FamilySearch session has expired. Please authenticate again.')
+    response.raise_for_status()
+    limiter.reward()
+
+    with metrics.phase('extraction'):
+        return response.json()
+
+
+def fetch_results_page_http(session, place_name, year, offset=0):
+    '''
+    Browser-free equivalent of fetch_results_page, fetching the results payload with an authenticated session.
+    Returns: Tuple (max_offset, payload). Both are None if no results were found.
+    '''
+    params = make_query_params(place_name, *year_bounds(year), offset=offset)
+    payload = fetch_results_json(session, params)
+    get_metrics('family_search').increment('pages')
+    num_results = payload.get('results', 0)
+    if not num_results:
+        return None, None
+    max_offset = max_offset_for(num_results) if offset == 0 else None
+
+    return max_offset, payload
+
+
+def scrape_results_page_http(session, place_name, year, offset=0):
+    '''
+    Browser-free equivalent of scrape_results_page, fetching the results payload with an authenticated session.
+    Returns: Tuple (max_offset, pandas.DataFrame). Both are None if no results were found.
+    '''
+    max_offset, payload = fetch_results_page_http(session, place_name, year, offset)
+    if payload is None:
+        return max_offset, None
+    metrics = get_metrics('family_search')
+    with metrics.phase('parse'):
+        df = results_json_frame(payload)
+    metrics.increment('rows', len(df))
+
+    return max_offset, df
+
+
+def iter_year_pages(fetcher, place_name, year, fetch_func=fetch_results_page):
+    '''
+    Yields (offset, unparsed page) for every page of burial records for place_name in year
+    (a single year or a (year_from, year_to) range).
+    fetch_func fetches a single page: fetch_results_page (browser) or fetch_results_page_http (session).
+    '''
+    max_offset, page = fetch_func(fetcher, place_name, year, 0)
+    if page is None:
+        return
+    yield 0, page
+    for offset in range(100, max_offset + 1, 100):
+        _, page = fetch_func(fetcher, place_name, year, offset)
+        yield offset, page
+
+
+def scrape_years_pipelined(pool, place_name, years, backend='browser', parse_workers=None, on_year=None):
+    '''
+    Scrapes burial records for place_name in each of years (single years or (year_from, year_to) ranges)
+    through a ScrapePipeline (see parish_scraper.pipeline):
+    the fetchers in pool (drivers, or sessions for backend='http') fetch one year each at a time,
+    while the pages already fetched are turned into DataFrames in a process pool
+    (so parsing is not timed in get_metrics('family_search'); see the pipeline's statistics).
+    If given, on_year(year, DataFrame) is called as soon as each year with results is complete,
+    and its return value is kept instead of the DataFrame.
+    Returns: Tuple (list of pandas.DataFrame (one per year with results) in year order, the ScrapePipeline).
+    '''
+    import pandas as pd
+
+    if backend == 'http':
+        fetch_func, parse_func = fetch_results_page_http, results_json_frame
+    else:
+        fetch_func, parse_func = fetch_results_page, pd.DataFrame
+    years = list(years)
+    metrics = get_metrics('family_search')
+
+    def year_pages(year):
+        with pool.acquire() as fetcher:
+            yield from iter_year_pages(fetcher, place_name, year, fetch_func)
+
+    def on_source(year, pages):
+        dfs_year = [df for _, df in pages if df is not None]
+        if not dfs_year:
+            return None
+        metrics.increment('rows', sum(len(df) for df in dfs_year))
+        with metrics.phase('concat'):
+            df_year = pd.concat(dfs_year, axis=0, ignore_index=True)
+        return on_year(year, df_year) if on_year else df_year
+
+    pipeline = ScrapePipeline(parse_func, fetch_workers=pool.size, parse_workers=parse_workers)
+    dfs = pipeline.run([(year, functools.partial(year_pages, year)) for year in years], on_source=on_source)
+    list_dfs = [df for df in dfs if df is not None]
+
+    return list_dfs, pipeline
+
+
+def count_results(driver, place_name, year):
+    '''
+    Returns the number of search results for place_name in year (a single year or a (year_from, year_to) range),
+    from a results page of a single row.
+    '''
+    metrics = get_metrics('family_search')
+    shadow, sr_table = load_results_page(driver, make_query_params(place_name, *year_bounds(year), count=1))
+    metrics.increment('probes')
+    if sr_table is None:
+        return 0
+    with metrics.phase('extraction'):
+        try:
+            return get_num_results(shadow)
+        # If exception thrown, assume no results found.
+        except:
+            return 0
+
+
+def count_results_http(session, place_name, year):
+    '''
+    Browser-free equivalent of count_results, fetching a results payload of a single row with an authenticated session.
+    '''
+    payload = fetch_results_json(session, make_query_params(place_name, *year_bounds(year), count=1))
+    get_metrics('family_search').increment('probes')
+
+    return payload.get('results', 0)
+
+
+def plan_date_ranges(count_func, fetcher, place_name, year_from, year_to, max_results=MAX_RESULTS):
+    '''
+    Plans the searches for burial records of place_name between year_from and year_to, so that sparse years
+    share a search and no search has more results than the site will serve.
+    count_func(fetcher, place_name, (year_from, year_to)) counts the results of a search (count_results or
+    count_results_http). The whole range is counted first and, while a range has more than max_results results,
+    it is split in half and each half counted. Neighbouring ranges are then merged while their results fit in one search
+    (ranges without results are dropped).
+    Returns: list of (year_from, year_to) ranges in year order.
+    '''
+    def probe(range_from, range_to):
+        num_results = count_func(fetcher, place_name, (range_from, range_to))
+        if not num_results:
+            return []
+        if num_results <= max_results or range_from == range_to:
+            if num_results > max_results:
+                warnings.warn('{} has {} results in {}: only the first {} can be scraped.'.format(
+                    place_name, num_results, range_from, max_results))
+            return [(range_from, range_to, num_results)]
+        range_mid = (range_from + range_to) // 2
+        return probe(range_from, range_mid) + probe(range_mid + 1, range_to)
+
+    date_ranges = []
+    for range_from, range_to, num_results in probe(year_from, year_to):
+        if date_ranges and date_ranges[-1][2] + num_results <= max_results:
+            date_ranges[-1] = (date_ranges[-1][0], range_to, date_ranges[-1][2] + num_results)
+        else:
+            date_ranges.append((range_from, range_to, num_results))
+
+    return [(range_from, range_to) for range_from, range_to, _ in date_ranges]
+
+
+def split_by_year(df, year):
+    '''
+    Splits the burial records df of a search in year (a single year or a (year_from, year_to) range) by the year
+    of their burial Date (its last four-digit number), keeping the order of the rows within each year.
+    The rows need not be in year order. A search of a single year keeps all its records; in a range, records whose
+    Date has no year in the range cannot be placed, so they are dropped with a warning.
+    Returns: list of (year, pandas.DataFrame) in year order, only for years with records.
+    '''
+    import pandas as pd
+
+    year_from, year_to = year_bounds(year)
+    if year_from == year_to or df.empty:
+        return [(year_from, df)]
+    years = pd.to_numeric(df['Date'].str.extract(r'(\d{4})\D*$', expand=False), errors='coerce')
+    unplaced = ~years.between(year_from, year_to)
+    if unplaced.any():
+        warnings.warn('Dropped {} records without a burial year in {}-{}: {}'.format(
+            unplaced.sum(), year_from, year_to, ', '.join(df.loc[unplaced, 'Date'].fillna('').astype(str).unique()[:5])))
+
+    return [(split_year, df[years == split_year].reset_index(drop=True)) for split_year in range(year_from, year_to + 1)
+            if (years == split_year).any()]
+
+
+def shard_handler(queue, fetcher, sink, backend='browser'):
+    '''
+    Returns a work queue handler (see parish_scraper.workqueue.run_worker) which scrapes the results page of a
+    SEARCH_SHARD item with fetcher (a driver, or a session for backend='http') and writes it to sink, split into
+    years and partitioned by place and year. A range's first page (offset 0) enqueues the range's other pages.
+    Each year of a shard is marked written in queue (see WorkQueue.mark_written) once it is in sink, so a shard
+    scraped again (its lease expired, or its worker died after writing) only writes the years still missing.
+    '''
+    page_func = scrape_results_page_http if backend == 'http' else scrape_results_page
+
+    def handle(item):
+        place_name = item.payload['place_name']
+        year       = (item.payload['year_from'], item.payload['year_to'])
+        offset     = item.payload['offset']
+        max_offset, df = page_func(fetcher, place_name, year, offset)
+        if offset == 0 and max_offset:
+            enqueue_search_shards(queue, place_name, [year], range(100, max_offset + 1, 100))
+        if df is None:
+            return {'rows' : 0}
+        for split_year, df_year in split_by_year(df, year):
+            written_key = '{}|{}'.format(item.key, split_year)
+            if queue.written(written_key) is None:
+                sink.write(df_year, [('place', place_name), ('year', split_year)])
+                queue.mark_written(written_key, len(df_year))
+        return {'rows' : len(df)}
+
+    return handle
+
+
+def is_signed_in(driver):
+    '''
+    Cheap check (a single http request using the driver's cookies) that the driver holds a valid FamilySearch session.
+    '''
+    import requests
+
+    session = make_http_session(driver, pool_size=1)
+    try:
+        response = session.get(r'https://www.familysearch.org/platform/users/current', timeout=10)
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+    finally:
+        session.close()
+
+
+def authenticate_driver(username, password, session_path=None, browser_profile='default'):
+    '''
+    Boots up a chrome webdriver and signs into FamilySearch, dismissing the survey and accepting cookies.
+    If session_path is given, cookies saved there by a previous sign-in are tried first, falling back to signing in
+    (after which the new cookies are saved to session_path).
+    Returns: authenticated webdriver.Chrome object.
+    '''
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver = boot_up_driver(browser_profile)
+
+    url_home = r'https://www.familysearch.org/'
+    if session_path and restore_session(driver, session_path, url_home):
+        driver.get(url_home)
+        if is_signed_in(driver):
+            return driver
+        driver.delete_all_cookies()
+
+    # Go to URL
+    url_signin = r'https://www.familysearch.org/auth/familysearch/login'
+    driver.get(url_signin)
+    driver = sign_in(driver, username, password)
+
+    # Occasionally, an invitation to complete a survey appears now. If so, dismiss it.
+    xpath_survey_button = r'//*[@id="pagekey__home__lihp_arches"]/div[5]/div[2]/div/div[3]/button[2]'
+    try:
+        no_survey_button = WebDriverWait(driver, 3).until(EC.presence_of_element_located((By.XPATH, xpath_survey_button)))
+        no_survey_button.click()
+    except:
+        pass
+    
+    driver = accept_cookies(driver)
+    if session_path:
+        save_session(driver, session_path)
+
+    return driver
+
+
+@functools.lru_cache(maxsize=None)
+def _quiet_shadow_class():
+    from pyshadow.main import Shadow
+
+    class QuietShadow(Shadow):
+        '''
+        Modified Shadow object without irritating print('QA--QAQA True') in is_present method.
+        '''
+        def __init__(self, driver):
+            super().__init__(driver)
+
+        def is_present(self, element):
+            present = self.executor_get_object("return isVisible(arguments[0]);", element)
+            return present
+
+    return QuietShadow
+
+
+def __getattr__(name):
+    # QuietShadow subclasses pyshadow's Shadow, so it is only defined when first used
+    if name == 'QuietShadow':
+        return _quiet_shadow_class()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 class FamilySearchScraper:
@@ -152,8 +788,18 @@ class FamilySearchScraper:
 
     def __init__(self):
         self.authenticated_driver = None
+        self.driver_pool = None
+        self.http_session = None
+        self.session_path = None
+        self.browser_profile = 'default'
+        self.pipeline = None
 
-    def authenticate(self):
+    def authenticate(self, session_path=None, browser_profile='default'):
+        '''
+        Boots up a chrome webdriver and signs into FamilySearch.
+        If session_path is given, the cookies of the last sign-in are saved there and reused on the next start.
+        See boot_up_driver for browser_profile.
+        '''
         # Sign in details
         USERNAME = os.getenv('FS_USERNAME', None)
         PASSWORD = os.getenv('FS_PASSWORD', None)
@@ -161,111 +807,177 @@ class FamilySearchScraper:
         if not (USERNAME and PASSWORD):
             raise AuthenticationError('No username and/or password found in environment variables. Ensure these are set before attempting to authenticate.')
 
-        driver = boot_up_driver()
-
-        # Go to URL
-        url_signin = r'https://www.familysearch.org/auth/familysearch/login'
-        driver.get(url_signin)
-        driver = sign_in(driver, USERNAME, PASSWORD)
-
-        # Occasionally, an invitation to complete a survey appears now. If so, dismiss it.
-        xpath_survey_button = r'//*[@id="pagekey__home__lihp_arches"]/div[5]/div[2]/div/div[3]/button[2]'
-        try:
-            no_survey_button = WebDriverWait(driver, 3).until(EC.presence_of_element_located((By.XPATH, xpath_survey_button)))
-            no_survey_button.click()
-        except:
-            pass
-        
-        driver = accept_cookies(driver)
+        self.session_path = session_path
+        self.browser_profile = browser_profile
+        driver = authenticate_driver(USERNAME, PASSWORD, session_path, browser_profile)
 
         self.is_authenticated = True
         self.authenticated_driver = driver
 
         return driver
 
-    def get_burial_records(self, place_name, year_from, year_to):
+    def get_driver_pool(self, workers):
+        '''
+        Returns a DriverPool of at least workers authenticated drivers, sharing self.authenticated_driver.
+        Extra drivers are signed in with the same credentials as authenticate().
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate FamilySearch account.')
+        if self.driver_pool is None:
+            driver_factory = lambda: authenticate_driver(os.getenv('FS_USERNAME'), os.getenv('FS_PASSWORD'), self.session_path, self.browser_profile)
+            self.driver_pool = DriverPool(driver_factory, size=workers, drivers=[self.authenticated_driver])
+        self.driver_pool.size = max(self.driver_pool.size, workers)
+        self.driver_pool.fill()
+
+        return self.driver_pool
+
+    def get_http_session(self, pool_size=10):
+        '''
+        Returns a requests.Session sharing the cookies of self.authenticated_driver.
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate FamilySearch account.')
+        if self.http_session is None:
+            self.http_session = make_http_session(self.authenticated_driver, pool_size)
+
+        return self.http_session
+
+    def get_burial_records(self, place_name, year_from, year_to, workers=1, backend='browser', pipeline=False, sink=None, profiler=None,
+                           plan=False):
         '''
         Scrapes Name and Burial columns from FamilySearch.org records 
         for place_name, between year_from and year_to inclusive.
-        Returns: pandas.DataFrame with columns ('Name', 'Date')
+        If workers > 1, the (year, offset) pages are scraped in parallel by a pool of that many authenticated drivers.
+        With backend='http', results are fetched with a requests.Session using the driver's cookies
+        (selenium is then only used to sign in).
+        If pipeline, years are scraped by scrape_years_pipelined (workers fetching, a process pool parsing),
+        and self.pipeline holds the run's queue statistics.
+        If a sink (e.g. parish_scraper.sinks.ParquetSink) is given, each year is written to it as soon as it is
+        complete, partitioned by place and year, and nothing is kept in memory.
+        profiler (a directory or parish_scraper.profiling.Profiler) profiles a sample of the years scraped
+        (by the sequential loop only), writing each profile to files named after place_name and the year.
+        If plan, the results are first counted (see plan_date_ranges), so that sparse years are searched together
+        and busy ranges are split to fit the site's result limit, rather than searching every year separately.
+        The records of each search are split back into years, so the output is the same.
+        Returns: pandas.DataFrame with columns ('Name', 'Date'), or None if a sink was given.
         '''
+        import pandas as pd
+
         if self.authenticated_driver:
             driver = self.authenticated_driver
         else:
             raise AuthenticationError('Please authenticate FamilySearch account.')
 
-        list_dfs = []
-        for year in range(year_from, year_to + 1):
-            
-            dfs_year = []
-            more_pages = True
-            offset = 0
-            max_offset = False
-            
-            while more_pages:
-                params = {
-                        'q.deathLikePlace'                : '{}'.format(place_name),
-                        'q.deathLikePlace.exact'          : 'on',
-                        'q.deathLikeDate.from'            : '{}'.format(year),
-                        'q.deathLikeDate.to'              : '{}'.format(year),
-                        'm.defaultFacets'                 : 'on',
-                        'm.queryRequireDefault'           : 'on',
-                        'm.facetNestCollectionInCategory' : 'on',
-                        'count'                           : '100',
-                        'offset'                          : '{}'.format(offset)
-                        }
-                base_results_url  = r'https://www.familysearch.org/search/record/results/?'
-                query_results_url = base_results_url + urlencode(params)
-                driver.get(query_results_url)
-                
-                shadow = QuietShadow(driver)
-                success = False
-                while not success:
-                    try:
-                        spinner = shadow.find_element(r'fs-spinner')
-                        table_displayed = WebDriverWait(driver, 10).until(lambda x : bool(spinner.get_attribute('style')))
-                        sr_table = shadow.find_element(r'div.table')
-                        success = True
-                    except:
-                        driver.refresh()
-
-                if table_displayed:
-                    # Try finding the number of results
-                    if not max_offset:
-                        try:
-                            max_offset = get_max_offset(shadow)
-                        # If exception thrown, assume no results found.
-                        except:
-                            break
-                    
-                    table_data = scrape_table(shadow, sr_table)
-
-                    # Make DataFrame:
-                    df = pd.DataFrame(table_data)
-                    dfs_year.append(df)
-
-                offset += 100
-                more_pages = (offset <= max_offset)
-                
-            # If there are any results for that year, concatenate them and append to list_dfs
-            if dfs_year:
-                df_year = pd.concat(dfs_year, axis=0, ignore_index=True)
-                list_dfs.append(df_year)
+        if backend == 'http':
+            session    = self.get_http_session(max(workers, 10))
+            fetcher    = session
+            page_func  = scrape_results_page_http
+            count_func = count_results_http
+        elif backend == 'browser':
+            fetcher    = driver
+            page_func  = scrape_results_page
+            count_func = count_results
+        else:
+            raise ValueError('backend must be one of \'browser\' or \'http\'.')
+
+        def on_year(year, df_year):
+            # Searches of several years are split back into years (in year order)
+            dfs_years = split_by_year(df_year, year)
+            if sink is None:
+                if len(dfs_years) == 1:
+                    return dfs_years[0][1]
+                return pd.concat([df for _, df in dfs_years] or [df_year.iloc[:0]], axis=0, ignore_index=True)
+            for split_year, df in dfs_years:
+                sink.write(df, [('place', place_name), ('year', split_year)])
+            return None
+
+        if plan:
+            years = plan_date_ranges(count_func, fetcher, place_name, year_from, year_to)
+        else:
+            years = range(year_from, year_to + 1)
+        if workers > 1 or pipeline:
+            if backend == 'http':
+                pool = DriverPool(lambda: session, size=workers, drivers=[session] * workers)
+            else:
+                pool = self.get_driver_pool(workers)
+            if pipeline:
+                list_dfs, self.pipeline = scrape_years_pipelined(pool, place_name, years, backend, on_year=on_year)
+            else:
+                list_dfs = scrape_years_parallel(pool, place_name, years, workers, page_func, on_year)
+        else:
+            profiler = get_profiler(profiler)
+            list_dfs = []
+            for year in years:
+                with profiled(profiler, '{} {}'.format(place_name, year_label(year))):
+                    df_year = scrape_year(fetcher, place_name, year, page_func)
+                # If there are any results for that year, append to list_dfs (or flush them to the sink)
+                if df_year is not None:
+                    list_dfs.append(on_year(year, df_year))
+
+        if sink is not None:
+            return None
 
         # If search query returned any results, concatenate them:
         if list_dfs:    
-            df_all = pd.concat(list_dfs, axis=0, ignore_index=True)
+            with get_metrics('family_search').phase('concat'):
+                df_all = pd.concat(list_dfs, axis=0, ignore_index=True)
         else:
             df_all = pd.DataFrame()
 
         return df_all 
 
+    def enqueue_burial_records(self, queue, place_name, year_from, year_to, plan=False, backend='browser'):
+        '''
+        Adds search shards for the burial records of place_name between year_from and year_to to queue
+        (a parish_scraper.workqueue.WorkQueue): one per year or, if plan, one per date range of plan_date_ranges.
+        Returns: number of shards added.
+        '''
+        if plan:
+            if not self.authenticated_driver:
+                raise AuthenticationError('Please authenticate FamilySearch account.')
+            if backend == 'http':
+                date_ranges = plan_date_ranges(count_results_http, self.get_http_session(), place_name, year_from, year_to)
+            else:
+                date_ranges = plan_date_ranges(count_results, self.authenticated_driver, place_name, year_from, year_to)
+        else:
+            date_ranges = [(year, year) for year in range(year_from, year_to + 1)]
+
+        return enqueue_search_shards(queue, place_name, date_ranges)
+
+    def work_on_queue(self, queue, sink, backend='browser', **kwargs):
+        '''
+        Scrapes search shards claimed from queue, writing them to sink partitioned by place and year,
+        until queue has no shards left. Run in as many processes (or hosts) as there are drivers to share the work.
+        See get_burial_records for backend and parish_scraper.workqueue.run_worker for kwargs.
+        Returns: dict {state : number of shards} of the shards this worker worked on.
+        '''
+        if not self.authenticated_driver:
+            raise AuthenticationError('Please authenticate FamilySearch account.')
+        fetcher = self.get_http_session() if backend == 'http' else self.authenticated_driver
+
+        return run_worker(queue, {SEARCH_SHARD : shard_handler(queue, fetcher, sink, backend)}, **kwargs)
+
+    @property
+    def metrics(self):
+        '''
+        The ScrapeMetrics (see parish_scraper.metrics) of every FamilySearch scrape in this process:
+        time spent navigating, waiting, throttled, extracting, parsing and concatenating, and counts of
+        pages, rows, refreshes, retries, timeouts and penalties.
+        '''
+        return get_metrics('family_search')
+
     def shut_down(self):
         '''
-        Close chromedriver.
+        Close chromedriver (and any other drivers in the pool).
         '''
         driver = self.authenticated_driver
-        if driver:
+        if self.http_session:
+            self.http_session.close()
+            self.http_session = None
+        if self.driver_pool:
+            self.driver_pool.close()
+            self.driver_pool = None
+        elif driver:
             driver.close()
         
         return None
@@ -278,7 +990,10 @@ def get_burial_records(driver, place_name, year_from, year_to):
     for place_name, between year_from and year_to inclusive.
     Returns: pandas.DataFrame with columns ('Name', 'Date')
     '''
+    import pandas as pd
+    from selenium.webdriver.support.ui import WebDriverWait
 
+    QuietShadow = _quiet_shadow_class()
     list_dfs = []
     for year in range(year_from, year_to + 1):
         
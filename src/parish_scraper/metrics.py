@@ -0,0 +1,180 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: ScrapeMetrics
+Per-phase timers and event counters for a site's scrapers, shared by every driver (and session) in the process.
+The scrapers time their phases (navigation, waits, throttling, extraction, parsing and concatenation) and count
+events (pages, rows, refreshes, retries, timeouts, penalties), so a run's wall-clock time can be broken down.
+Metrics can be read in process (snapshot(), report()) or exported as JSON lines or Prometheus text.
+'''
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# Phases timed by the scrapers. Phases do not nest, but with several workers their times add up across threads,
+# so they can total more than the wall-clock time of the run.
+PHASES = ('navigation', 'wait', 'throttle', 'extraction', 'parse', 'concat')
+
+
+class ScrapeMetrics:
+    '''
+    Thread-safe per-phase timers ({phase : count, total and longest seconds}) and counters for site.
+    '''
+
+    def __init__(self, site=None):
+        self.site  = site
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Clears every timer and counter.
+        '''
+        with self._lock:
+            self.started  = time.time()
+            self.phases   = {}
+            self.counters = {}
+
+    def add_time(self, phase, seconds):
+        '''
+        Adds seconds spent in phase.
+        '''
+        with self._lock:
+            timer = self.phases.setdefault(phase, {'count' : 0, 'seconds' : 0.0, 'max' : 0.0})
+            timer['count']   += 1
+            timer['seconds'] += seconds
+            timer['max']      = max(timer['max'], seconds)
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        '''
+        Context manager timing the code it wraps as phase (the time is added even if the code raises).
+        '''
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def increment(self, counter, count=1):
+        '''
+        Adds count to counter.
+        '''
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def snapshot(self):
+        '''
+        Returns: dict {'site', 'time', 'elapsed', 'phases' : {phase : {'count', 'seconds', 'max'}}, 'counters' : {counter : count}}.
+        '''
+        with self._lock:
+            now = time.time()
+            return {'site'     : self.site,
+                    'time'     : now,
+                    'elapsed'  : now - self.started,
+                    'phases'   : {phase : dict(timer) for phase, timer in self.phases.items()},
+                    'counters' : dict(self.counters)}
+
+    def report(self):
+        '''
+        Returns: str table of the time spent in each phase and of the counters.
+        '''
+        snapshot = self.snapshot()
+        lines = ['{} metrics over {:.1f}s'.format(self.site or 'scrape', snapshot['elapsed']),
+                 '{:<12} {:>8} {:>10} {:>9} {:>9}'.format('phase', 'count', 'seconds', 'mean ms', 'max ms')]
+        for phase, timer in sorted(snapshot['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<12} {:>8} {:>10.2f} {:>9.1f} {:>9.1f}'.format(
+                phase, timer['count'], timer['seconds'], 1000 * timer['seconds'] / timer['count'], 1000 * timer['max']))
+        for counter, count in sorted(snapshot['counters'].items()):
+            lines.append('{:<12} {:>8}'.format(counter, count))
+
+        return '\n'.join(lines)
+
+    def write_jsonl(self, path):
+        '''
+        Appends the current snapshot to the JSON-lines file at path.
+        '''
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def to_prometheus(self):
+        '''
+        Returns: str of the metrics in the Prometheus text exposition format.
+        '''
+        return prometheus_text([self])
+
+
+_metrics      = {}
+_metrics_lock = threading.Lock()
+
+
+def get_metrics(site):
+    '''
+    Returns the ScrapeMetrics shared by everything in this process scraping site, creating it if needed.
+    '''
+    with _metrics_lock:
+        if site not in _metrics:
+            _metrics[site] = ScrapeMetrics(site)
+        return _metrics[site]
+
+
+def reset_metrics(site=None):
+    '''
+    Clears the metrics of site (or of every site).
+    '''
+    with _metrics_lock:
+        if site is None:
+            metrics = list(_metrics.values())
+        else:
+            metrics = [_metrics[site]] if site in _metrics else []
+    for site_metrics in metrics:
+        site_metrics.reset()
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def prometheus_text(metrics=None):
+    '''
+    Returns: str of the metrics of every site in metrics (default: every site scraped in this process)
+    in the Prometheus text exposition format, e.g. for the node exporter's textfile collector.
+    '''
+    if metrics is None:
+        with _metrics_lock:
+            metrics = list(_metrics.values())
+    snapshots = [site_metrics.snapshot() for site_metrics in metrics]
+    families  = [('parish_scraper_phase_seconds_total', 'Seconds spent in each scrape phase.',
+                  [(snapshot['site'], 'phase', phase, timer['seconds']) for snapshot in snapshots
+                   for phase, timer in snapshot['phases'].items()]),
+                 ('parish_scraper_phase_calls_total', 'Number of times each scrape phase was timed.',
+                  [(snapshot['site'], 'phase', phase, timer['count']) for snapshot in snapshots
+                   for phase, timer in snapshot['phases'].items()]),
+                 ('parish_scraper_events_total', 'Scrape events (pages, rows, refreshes, retries, timeouts, penalties).',
+                  [(snapshot['site'], 'event', counter, count) for snapshot in snapshots
+                   for counter, count in snapshot['counters'].items()])]
+
+    lines = []
+    for name, description, samples in families:
+        if not samples:
+            continue
+        lines += ['# HELP {} {}'.format(name, description), '# TYPE {} counter'.format(name)]
+        for site, label, label_value, value in samples:
+            lines.append('{}{{site="{}",{}="{}"}} {}'.format(name, _escape(site), label, _escape(label_value), value))
+
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def write_prometheus(path, metrics=None):
+    '''
+    Writes prometheus_text(metrics) to path, replacing the file atomically so a collector never reads half of it.
+    '''
+    tmp_path = os.path.join(os.path.dirname(os.path.abspath(path)), '.{}.tmp'.format(os.path.basename(path)))
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus_text(metrics))
+    os.replace(tmp_path, path)
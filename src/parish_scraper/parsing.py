@@ -0,0 +1,280 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Parsing of Ancestry image viewer index tables (grid containers) and FamilySearch search results into
+pandas.DataFrames. Each grid container is read in a single pass, filling column arrays directly rather than building a tree.
+Nothing here imports selenium (or any other browser dependency), and numpy and pandas are only imported once a
+frame is built, so parse-only processes (and the scrapers, which import the row parsers) start quickly.
+'''
+
+import re
+
+from html.parser import HTMLParser
+
+
+# Elements whose contents are not part of a cell's text
+HIDDEN_TAGS = ('script', 'style', 'template')
+
+
+class GridRowParser(HTMLParser):
+    '''
+    Streaming parser collecting the text of every div (cell) within each div.grid-row of a grid container.
+    As with BeautifulSoup's findChildren('div'), nested divs are cells too and a cell's text includes
+    the text of all its descendants, except the contents of script, style and template elements (as with lxml, whose
+    parser drops them). Divs within a template are not cells either.
+    '''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows        = []
+        self._row        = None
+        self._open_divs  = []
+        self._open_cells = []
+        self._hidden     = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAGS:
+            self._hidden += 1
+        if tag != 'div' or self._hidden:
+            return
+        if self._row is None:
+            classes = (dict(attrs).get('class') or '').split()
+            if 'grid-row' in classes:
+                self._row = []
+                self.rows.append(self._row)
+                self._open_divs.append('row')
+            else:
+                self._open_divs.append(None)
+        else:
+            cell = []
+            self._row.append(cell)
+            self._open_cells.append(cell)
+            self._open_divs.append('cell')
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAGS:
+            self._hidden = max(0, self._hidden - 1)
+        if tag != 'div' or self._hidden or not self._open_divs:
+            return
+        kind = self._open_divs.pop()
+        if kind == 'cell':
+            self._open_cells.pop()
+        elif kind == 'row':
+            self._row = None
+
+    def handle_data(self, data):
+        if self._hidden:
+            return
+        for cell in self._open_cells:
+            cell.append(data)
+
+
+def parse_grid_rows(grid_container, parser='html.parser'):
+    '''
+    Returns the cell texts of every div.grid-row in the grid_container html, as a list of lists.
+    The first row holds the column names.
+    parser is either 'html.parser' (standard library, streaming) or 'lxml' (requires lxml).
+    '''
+    if parser == 'lxml':
+        from lxml import html as lxml_html
+        root = lxml_html.fragment_fromstring(grid_container, create_parent='div')
+        for element in root.xpath('.//script | .//style | .//template'):
+            element.drop_tree()
+        rows = root.xpath(r".//div[contains(concat(' ', normalize-space(@class), ' '), ' grid-row ')]")
+        return [[cell.text_content() for cell in row.iterdescendants('div')] for row in rows]
+    elif parser == 'html.parser':
+        grid_parser = GridRowParser()
+        grid_parser.feed(grid_container)
+        grid_parser.close()
+        return [[''.join(cell) for cell in row] for row in grid_parser.rows]
+    else:
+        raise ValueError('parser must be one of \'html.parser\' or \'lxml\'.')
+
+
+def _pad_rows(rows, width):
+    '''
+    Pads rows shorter than width with None, as pandas does for ragged lists of rows.
+    '''
+    if any(len(row) > width for row in rows):
+        raise ValueError('{} columns passed, passed data had {} columns'.format(width, max(len(row) for row in rows)))
+
+    return [row if len(row) == width else row + [None] * (width - len(row)) for row in rows]
+
+
+def rows_to_frame(rows):
+    '''
+    Returns pandas.DataFrame built column-wise from rows (the first row holding the column names).
+    '''
+    import pandas as pd
+
+    columns = rows[0]
+    body    = _pad_rows(rows[1:], len(columns))
+    if not body:
+        return pd.DataFrame([], columns = columns)
+    df = pd.DataFrame(dict(zip(range(len(columns)), zip(*body))))
+    df.columns = columns
+
+    return df
+
+
+def parse_grid_container(grid_container, parser='html.parser'):
+    '''
+    Returns pandas.DataFrame containing the data within grid_container html.
+    '''
+    rows = parse_grid_rows(grid_container, parser)
+
+    return rows_to_frame(rows)
+
+
+def parse_grid_containers(grid_containers, parser='html.parser'):
+    '''
+    Returns one pandas.DataFrame containing the data of several pages' grid_containers (None entries are skipped).
+    Equivalent to concatenating parse_grid_container of each page, but the frame is only built once.
+    '''
+    import numpy as np
+    import pandas as pd
+
+    pages = [parse_grid_rows(grid_container, parser) for grid_container in grid_containers if grid_container]
+    pages = [rows for rows in pages if rows]
+    if not pages:
+        return pd.DataFrame([], columns = [])
+    # Duplicate column names within a page cannot be aligned by name, so fall back to concatenation.
+    if any(len(set(rows[0])) != len(rows[0]) for rows in pages):
+        return pd.concat([rows_to_frame(rows) for rows in pages], ignore_index=True)
+
+    columns = list(dict.fromkeys(column for rows in pages for column in rows[0]))
+    arrays  = {column : [] for column in columns}
+    for rows in pages:
+        header = rows[0]
+        body   = _pad_rows(rows[1:], len(header))
+        page_arrays = dict(zip(header, zip(*body))) if body else {}
+        for column in columns:
+            arrays[column].extend(page_arrays.get(column, [np.nan] * len(body)))
+
+    return pd.DataFrame(arrays, columns = columns)
+
+
+def label_column(value, length):
+    '''
+    Returns a categorical column of length rows all holding value (one category, int8 codes).
+    '''
+    import numpy as np
+    import pandas as pd
+
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), [value])
+
+
+def concat_labelled(frames, labels):
+    '''
+    Returns frames concatenated into one pandas.DataFrame, preceded by a categorical column for each label.
+    labels holds, for each frame, a list of (column name, value) tuples in column order (e.g. the browse labels
+    and date range of a record). Each label value is stored once, with a small integer code per row, instead of
+    as a Python string per row; frames without a value for a label get NaN.
+    '''
+    import numpy as np
+    import pandas as pd
+
+    frames  = list(frames)
+    labels  = [list(frame_labels) for frame_labels in labels]
+    lengths = np.array([len(df) for df in frames], dtype=np.int64)
+    label_names = list(dict.fromkeys(name for frame_labels in labels for name, _ in frame_labels))
+    df_data = pd.concat(frames, axis=0, ignore_index=True) if frames else pd.DataFrame()
+
+    label_columns = {}
+    for name in label_names:
+        values     = [dict(frame_labels).get(name) for frame_labels in labels]
+        categories = {value : code for code, value in enumerate(dict.fromkeys(value for value in values if value is not None))}
+        codes      = [categories[value] if value is not None else -1 for value in values]
+        dtype      = np.int8 if len(categories) < 127 else np.int32
+        label_columns[name] = pd.Categorical.from_codes(np.repeat(np.array(codes, dtype=dtype), lengths), list(categories))
+    df_labels = pd.DataFrame(label_columns, index=df_data.index, columns=label_names)
+
+    return pd.concat([df_labels, df_data], axis=1)
+
+
+def get_burial_info(cell_event_texts, cell_date_texts, cell_place_texts):
+    '''
+    Returns (date, place) of the first burial event in a results row, or None if the row has no burial event.
+    '''
+    cell_info = list(zip(cell_event_texts, cell_date_texts, cell_place_texts))
+    pattern = re.compile(r'(B|b)urial')
+    burial_info = [info for info in cell_info if pattern.match(info[0])]
+    if burial_info:
+        return burial_info[0][1], burial_info[0][2]
+
+    return None
+
+
+def normalize_text(text):
+    '''
+    Returns an element's innerText with its whitespace normalized as selenium's WebElement.text does: runs of
+    whitespace within a line become one space, lines are trimmed, empty lines dropped and non-breaking spaces
+    turned into spaces.
+    '''
+    lines = [re.sub(r'[^\S\n\xa0]+', ' ', line).strip(' ') for line in re.split(r'\r\n?|\n', text or '')]
+
+    return '\n'.join(line for line in lines if line).replace('\xa0', ' ')
+
+
+def parse_table_rows(rows):
+    '''
+    Returns Name, Date and Place burial data of FamilySearch results table rows, in the same form as
+    parish_scraper.family_search.scrape_table. Each row is [name, event type texts, event date texts, event place texts],
+    as read by family_search.SCRAPE_TABLE_SCRIPT; the texts are innerText, normalized here (see normalize_text).
+    '''
+    names = []
+    dates = []
+    places = []
+    for cell_name_text, cell_event_texts, cell_date_texts, cell_place_texts in rows:
+        burial_info = get_burial_info(*[[normalize_text(text) for text in texts]
+                                        for texts in (cell_event_texts, cell_date_texts, cell_place_texts)])
+        if burial_info:
+            burial_date, burial_place = burial_info
+            dates.append(burial_date)
+            places.append(burial_place)
+            names.append(cell_name_text)
+
+    table_data = {'Name' : names, 'Date' : dates, 'Place' : places}
+
+    return table_data
+
+
+def parse_results_json(payload):
+    '''
+    Returns Name, Date and Place burial data contained within a search results payload,
+    in the same form as parish_scraper.family_search.scrape_table.
+    '''
+    names = []
+    dates = []
+    places = []
+    for entry in payload.get('entries', []):
+        persons = entry.get('content', {}).get('gedcomx', {}).get('persons', [])
+        principals = [person for person in persons if person.get('principal')] or persons[:1]
+        if not principals:
+            continue
+        person = principals[0]
+        try:
+            name = person['names'][0]['nameForms'][0]['fullText']
+        except (KeyError, IndexError):
+            name = ''
+        # Take only burial info
+        burials = [fact for fact in person.get('facts', []) if fact.get('type', '').endswith('Burial')]
+        if burials:
+            burial = burials[0]
+            dates.append(burial.get('date', {}).get('original', ''))
+            places.append(burial.get('place', {}).get('original', ''))
+            names.append(name)
+
+    table_data = {'Name' : names, 'Date' : dates, 'Place' : places}
+
+    return table_data
+
+
+def results_json_frame(payload):
+    '''
+    Returns the burial data of a search results payload as a pandas.DataFrame.
+    '''
+    import pandas as pd
+
+    return pd.DataFrame(parse_results_json(payload))
@@ -0,0 +1,244 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: ScrapePipeline
+An asyncio pipeline which overlaps fetching pages (blocking selenium or requests calls, run in threads) with
+parsing them (CPU-bound, run in a process pool), so that parsing never stalls navigation.
+
+    sources --> [fetch x fetch_workers] --> pages --> [parse x parse_workers] --> frames --> [collect]
+
+Stages are connected by bounded queues, whose depths are recorded (see ScrapePipeline.stats): a full 'pages'
+queue means parsing is the bottleneck, an empty one means fetching is.
+'''
+
+import asyncio
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# Markers passed down the pipeline
+_DONE = object()
+_END  = object()
+
+
+class MonitoredQueue(asyncio.Queue):
+    '''
+    asyncio.Queue which records its depth after every put and get, and how long producers were blocked
+    (queue full) and consumers starved (queue empty).
+    '''
+
+    def __init__(self, name, maxsize=0):
+        super().__init__(maxsize)
+        self.name       = name
+        self.items      = 0
+        self.max_depth  = 0
+        self.put_wait   = 0.0
+        self.get_wait   = 0.0
+        self._samples   = 0
+        self._depth_sum = 0
+
+    def _sample(self):
+        depth = self.qsize()
+        self.max_depth   = max(self.max_depth, depth)
+        self._samples   += 1
+        self._depth_sum += depth
+
+    def _put(self, item):
+        super()._put(item)
+        if item is not _DONE:
+            self.items += 1
+        self._sample()
+
+    def _get(self):
+        item = super()._get()
+        self._sample()
+        return item
+
+    async def put(self, item):
+        start = time.perf_counter()
+        await super().put(item)
+        self.put_wait += time.perf_counter() - start
+
+    async def get(self):
+        start = time.perf_counter()
+        item = await super().get()
+        self.get_wait += time.perf_counter() - start
+        return item
+
+    def stats(self):
+        '''
+        Returns {'maxsize', 'depth', 'max_depth', 'mean_depth', 'items', 'put_wait', 'get_wait'}.
+        '''
+        return {'maxsize'    : self.maxsize,
+                'depth'      : self.qsize(),
+                'max_depth'  : self.max_depth,
+                'mean_depth' : self._depth_sum / self._samples if self._samples else 0.0,
+                'items'      : self.items,
+                'put_wait'   : self.put_wait,
+                'get_wait'   : self.get_wait}
+
+
+class ScrapePipeline:
+    '''
+    Runs sources through fetch, parse and collect stages.
+    Each source is a (key, pages) pair, where pages is a callable taking no arguments which returns an iterable of
+    (meta, payload) pairs; it is iterated in a thread, so it may block (e.g. drive a browser). Each payload is
+    parsed in a process by parse_func(payload), which must therefore be picklable (a module-level function);
+    payloads which are None are passed on as None without being parsed.
+    parse_executor replaces the default ProcessPoolExecutor(parse_workers) (e.g. with a thread pool).
+    '''
+
+    def __init__(self, parse_func, fetch_workers=1, parse_workers=None, queue_size=16, parse_executor=None):
+        self.parse_func     = parse_func
+        self.fetch_workers  = fetch_workers
+        self.parse_workers  = parse_workers
+        self.queue_size     = queue_size
+        self.parse_executor = parse_executor
+        self.queues         = {}
+        self.elapsed        = None
+
+    async def _fetch(self, loop, executor, sources, pages):
+        while True:
+            source = await sources.get()
+            if source is _DONE:
+                break
+            index, (key, make_pages) = source
+            iterator = await loop.run_in_executor(executor, lambda: iter(make_pages()))
+            page_index = 0
+            try:
+                while True:
+                    item = await loop.run_in_executor(executor, next, iterator, _DONE)
+                    if item is _DONE:
+                        break
+                    meta, payload = item
+                    await pages.put((index, page_index, meta, payload))
+                    page_index += 1
+            finally:
+                if hasattr(iterator, 'close'):
+                    await loop.run_in_executor(executor, iterator.close)
+            await pages.put((index, page_index, _END, None))
+
+    async def _parse(self, loop, executor, pages, frames):
+        while True:
+            item = await pages.get()
+            if item is _DONE:
+                break
+            index, page_index, meta, payload = item
+            if meta is not _END and payload is not None:
+                payload = await loop.run_in_executor(executor, self.parse_func, payload)
+            await frames.put((index, page_index, meta, payload))
+
+    async def _collect(self, frames, keys, on_page, on_source):
+        results  = [None] * len(keys)
+        pending  = {index : {} for index in range(len(keys))}
+        pages    = {index : [] for index in range(len(keys))}
+        expected = {}
+        while True:
+            item = await frames.get()
+            if item is _DONE:
+                break
+            index, page_index, meta, result = item
+            if meta is _END:
+                expected[index] = page_index
+            else:
+                pending[index][page_index] = (meta, result)
+                # Hand pages over in page order, whatever order they were parsed in
+                while len(pages[index]) in pending[index]:
+                    meta, result = pending[index].pop(len(pages[index]))
+                    if on_page:
+                        on_page(keys[index], meta, result)
+                    pages[index].append((meta, result))
+            if expected.get(index) == len(pages[index]):
+                source_pages = pages.pop(index)
+                results[index] = on_source(keys[index], source_pages) if on_source else source_pages
+                del expected[index]
+
+        return results
+
+    async def _run(self, sources, on_page, on_source):
+        loop = asyncio.get_running_loop()
+        self.queues = {'sources' : MonitoredQueue('sources'),
+                       'pages'   : MonitoredQueue('pages', self.queue_size),
+                       'frames'  : MonitoredQueue('frames', self.queue_size)}
+        queue_sources, queue_pages, queue_frames = self.queues['sources'], self.queues['pages'], self.queues['frames']
+        for index, source in enumerate(sources):
+            queue_sources.put_nowait((index, source))
+        fetch_workers = max(1, min(self.fetch_workers, len(sources)))
+        parse_workers = self.parse_workers or os.cpu_count() or 1
+        for _ in range(fetch_workers):
+            queue_sources.put_nowait(_DONE)
+
+        fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+        parse_executor = self.parse_executor or ProcessPoolExecutor(max_workers=parse_workers)
+        try:
+            async def _stage(workers, worker, downstream, count):
+                # Runs workers copies of a stage, then tells the next stage's count workers to stop
+                await asyncio.gather(*[worker() for _ in range(workers)])
+                for _ in range(count):
+                    await downstream.put(_DONE)
+
+            tasks = [asyncio.ensure_future(_stage(fetch_workers, lambda: self._fetch(loop, fetch_executor, queue_sources, queue_pages), queue_pages, parse_workers)),
+                     asyncio.ensure_future(_stage(parse_workers, lambda: self._parse(loop, parse_executor, queue_pages, queue_frames), queue_frames, 1)),
+                     asyncio.ensure_future(self._collect(queue_frames, [key for key, _ in sources], on_page, on_source))]
+            # Stop everything as soon as any stage fails
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+
+            return tasks[-1].result()
+        finally:
+            fetch_executor.shutdown(wait=False)
+            if self.parse_executor is None:
+                parse_executor.shutdown()
+
+    def run(self, sources, on_page=None, on_source=None):
+        '''
+        Fetches, parses and collects every source (a list of (key, pages) pairs).
+        on_page(key, meta, result) is called for every parsed page, and on_source(key, pages) once all of a source's
+        (meta, result) pages have been parsed, both in page order and from the pipeline's thread (keep them quick).
+        If called while an event loop is running in this thread (e.g. in Jupyter), the pipeline runs its own loop
+        in a worker thread, blocking until it is done; from a coroutine, await run_async instead.
+        Returns: list of on_source(key, pages) (or of pages if on_source is None), in the same order as sources.
+        '''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run_async(sources, on_page, on_source))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.run_async(sources, on_page, on_source)).result()
+
+    async def run_async(self, sources, on_page=None, on_source=None):
+        '''
+        Coroutine equivalent of run, running the pipeline on the current event loop.
+        '''
+        sources = list(sources)
+        if not sources:
+            return []
+        start = time.perf_counter()
+        try:
+            return await self._run(sources, on_page, on_source)
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def stats(self):
+        '''
+        Returns {queue name : queue statistics (see MonitoredQueue.stats)} for the last run.
+        '''
+        return {name : queue.stats() for name, queue in self.queues.items()}
+
+    def report(self):
+        '''
+        Returns the statistics of stats() as a printable table.
+        '''
+        lines = ['{:<10} {:>8} {:>8} {:>10} {:>8} {:>10} {:>10}'.format('queue', 'maxsize', 'max', 'mean', 'items', 'put wait', 'get wait')]
+        for name, stat in self.stats().items():
+            lines.append('{:<10} {:>8} {:>8} {:>10.2f} {:>8} {:>10.2f} {:>10.2f}'.format(
+                name, stat['maxsize'], stat['max_depth'], stat['mean_depth'], stat['items'], stat['put_wait'], stat['get_wait']))
+
+        return '\n'.join(lines)
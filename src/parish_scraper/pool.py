@@ -0,0 +1,136 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: DriverPool
+A thread-safe pool of authenticated webdrivers shared between worker threads.
+'''
+
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class DriverPool:
+    '''
+    A fixed-size pool of authenticated webdrivers.
+    driver_factory is a callable taking no arguments which returns a new authenticated driver.
+    Drivers already authenticated elsewhere can be handed over with drivers.
+    '''
+
+    def __init__(self, driver_factory, size=1, drivers=None):
+        self.driver_factory = driver_factory
+        self.size           = size
+        self.drivers        = list(drivers or [])[:size]
+        self._idle          = queue.Queue()
+        self._lock          = threading.Lock()
+        self._signing_in    = 0
+        self._discarded     = set()
+        for driver in self.drivers:
+            self._idle.put(driver)
+
+    def _sign_in(self, number):
+        # Slots are reserved under the lock, but drivers are signed in outside it, so other threads are not held up.
+        with self._lock:
+            number = min(number, self.size - len(self.drivers) - self._signing_in)
+            if number <= 0:
+                return
+            self._signing_in += number
+        try:
+            with ThreadPoolExecutor(max_workers=number) as executor:
+                new_drivers = list(executor.map(lambda _: self.driver_factory(), range(number)))
+        finally:
+            with self._lock:
+                self._signing_in -= number
+        with self._lock:
+            for driver in new_drivers:
+                self.drivers.append(driver)
+                self._idle.put(driver)
+
+    def fill(self):
+        '''
+        Authenticates new drivers (in parallel) until the pool holds (or is signing in) self.size drivers.
+        '''
+        self._sign_in(self.size)
+
+    def grow(self):
+        '''
+        Authenticates one more driver if no driver is idle and the pool holds fewer than self.size,
+        so that drivers are only signed in when there is work waiting for them.
+        '''
+        if self._idle.empty():
+            self._sign_in(1)
+
+    def discard(self, driver):
+        '''
+        Quits driver (e.g. after its browser crashed) and removes it from the pool, leaving its slot
+        to be signed in again by fill or grow. A lent driver is then not returned to the pool.
+        '''
+        with self._lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+                self._discarded.add(id(driver))
+        try:
+            driver.quit()
+        except:
+            pass
+
+    @contextmanager
+    def acquire(self, grow=False):
+        '''
+        Context manager which lends an idle driver, blocking until one is free.
+        If grow, a driver is signed in (see grow) whenever none is idle, so that a driver discarded
+        or failing to sign in elsewhere does not leave the caller waiting forever.
+        '''
+        while True:
+            if grow:
+                self.grow()
+            try:
+                driver = self._idle.get(timeout=1.0 if grow else None)
+                break
+            except queue.Empty:
+                continue
+        try:
+            yield driver
+        finally:
+            with self._lock:
+                discarded = id(driver) in self._discarded
+                self._discarded.discard(id(driver))
+            if not discarded:
+                self._idle.put(driver)
+
+    def map(self, func, items, workers=None):
+        '''
+        Calls func(driver, item) for every item, spreading the calls over (at most workers of) the pool's drivers.
+        Returns: list of results, in the same order as items.
+        '''
+        self.fill()
+        items = list(items)
+        if not items:
+            return []
+
+        def _run(item):
+            with self.acquire() as driver:
+                return func(driver, item)
+
+        with ThreadPoolExecutor(max_workers=min(workers or self.size, self.size, len(items))) as executor:
+            results = list(executor.map(_run, items))
+
+        return results
+
+    def close(self):
+        '''
+        Quits every driver in the pool.
+        '''
+        with self._lock:
+            for driver in self.drivers:
+                try:
+                    driver.quit()
+                except:
+                    pass
+            self.drivers = []
+            self._idle = queue.Queue()
+
+        return None
@@ -0,0 +1,120 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: Profiler
+Opt-in CPU (cProfile) and allocation (tracemalloc) profiles of single units of work: an Ancestry record or a
+FamilySearch year. Only a sample_rate fraction of units is profiled, so profiling can be left on in production,
+and each profiled unit is written to files named after it:
+    <name>.prof           cProfile stats (load with pstats.Stats or snakeviz)
+    <name>.tracemalloc    allocation snapshot (load with tracemalloc.Snapshot.load)
+    <name>.txt            the slowest functions and the largest allocation sites
+'''
+
+import contextlib
+import cProfile
+import hashlib
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import tracemalloc
+
+
+def profile_name(key):
+    '''
+    Returns a file name (without extension) for the unit of work key, e.g. a record url or 'Canterbury 1801'.
+    '''
+    name = re.sub(r'^[a-z]+://', '', str(key))
+    name = re.sub(r'[^A-Za-z0-9.-]+', '_', name).strip('_.')
+    if len(name) > 100:
+        # Keep long urls unique once shortened
+        name = name[:100] + '-' + hashlib.blake2b(str(key).encode('utf-8'), digest_size=4).hexdigest()
+
+    return name or 'unit'
+
+
+class Profiler:
+    '''
+    Profiles a random sample_rate fraction (by default 1%) of the units of work it is given, writing their profiles
+    to directory; pass sample_rate=1.0 to profile every unit.
+    If memory, allocations are traced (with tracemalloc, keeping frames frames per allocation) while a unit is profiled.
+    One unit is profiled at a time per process; units starting while another is being profiled are not profiled.
+    '''
+
+    def __init__(self, directory, sample_rate=0.01, memory=True, frames=1, top=25):
+        self.directory   = directory
+        self.sample_rate = sample_rate
+        self.memory      = memory
+        self.frames      = frames
+        self.top         = top
+        self.profiled    = []
+        self._lock       = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, name, profile, snapshot):
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path + '.prof')
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(self.top)
+        if snapshot is not None:
+            snapshot.dump(path + '.tracemalloc')
+            summary.write('Largest allocation sites:\n')
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                summary.write('{}\n'.format(stat))
+        with open(path + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        self.profiled.append(path)
+
+    @contextlib.contextmanager
+    def profile(self, key):
+        '''
+        Context manager profiling the code it wraps as the unit of work key, if the unit is sampled.
+        '''
+        if random.random() >= self.sample_rate or not self._lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is already running in this process (python 3.12+)
+                yield None
+                return
+            started_tracing = self.memory and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(self.frames)
+            try:
+                yield profile
+            finally:
+                profile.disable()
+                snapshot = None
+                if self.memory:
+                    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+                if started_tracing:
+                    tracemalloc.stop()
+                self._write(profile_name(key), profile, snapshot)
+        finally:
+            self._lock.release()
+
+
+def get_profiler(profiler):
+    '''
+    Returns profiler as a Profiler: a directory is profiled with the default settings (1% of units sampled),
+    None stays None.
+    '''
+    if isinstance(profiler, str):
+        return Profiler(profiler)
+    return profiler
+
+
+def profiled(profiler, key):
+    '''
+    Returns profiler.profile(key), or a context manager that does nothing if profiler is None.
+    '''
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.profile(key)
@@ -0,0 +1,75 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Saving and restoring the cookies of an authenticated webdriver, so that a new driver can skip signing in.
+'''
+
+import os
+import pickle
+import time
+
+
+def save_session(driver, path):
+    '''
+    Pickles the cookies of the (authenticated) driver to path.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    session = {'saved' : time.time(), 'cookies' : driver.get_cookies()}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(session, f)
+    os.replace(tmp_path, path)
+
+    return None
+
+
+def load_session(path, max_age=None):
+    '''
+    Returns the cookies saved at path, or None if there are none or they are older than max_age seconds.
+    '''
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            session = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if max_age is not None and time.time() - session['saved'] > max_age:
+        return None
+    # Drop cookies which have already expired
+    now = time.time()
+    cookies = [cookie for cookie in session['cookies'] if cookie.get('expiry', now + 1) > now]
+
+    return cookies or None
+
+
+def restore_session(driver, path, url, max_age=None):
+    '''
+    Adds the cookies saved at path to driver. Cookies are set through the devtools protocol where possible,
+    which avoids loading a page first; otherwise url (on the cookies' domain) is opened so they can be added.
+    Returns: True if cookies were restored (they may still have been revoked by the site).
+    '''
+    cookies = load_session(path, max_age)
+    if not cookies:
+        return False
+    try:
+        for cookie in cookies:
+            cdp_cookie = {key : cookie[key] for key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly') if key in cookie}
+            if 'expiry' in cookie:
+                cdp_cookie['expires'] = cookie['expiry']
+            driver.execute_cdp_cmd('Network.setCookie', cdp_cookie)
+    except:
+        driver.get(url)
+        for cookie in cookies:
+            cookie = {key : value for key, value in cookie.items() if key != 'sameSite'}
+            if 'expiry' in cookie:
+                cookie['expiry'] = int(cookie['expiry'])
+            try:
+                driver.add_cookie(cookie)
+            except:
+                continue
+
+    return True
@@ -0,0 +1,204 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Classes: MemorySink, CsvSink, ParquetSink, LabelledSink
+Destinations for scraped DataFrames, written to page by page (or record by record) as they are scraped.
+File sinks are append-only: every chunk goes to a new numbered part file, optionally under hive-style partition
+directories (e.g. collection=1234/County=Kent/date_range=1800-1850/), and part files appear atomically, so
+downstream jobs can read a directory while a scrape is still writing to it.
+'''
+
+import os
+import re
+import threading
+import urllib.parse
+
+import pandas as pd
+
+from .parsing import label_column
+
+
+class Sink:
+    '''
+    Base class for scrape output destinations.
+    Subclasses implement write(df, partition=()), which is called once for each chunk of scraped rows.
+    partition is a list of (name, value) tuples locating the chunk (e.g. collection, labels, date range);
+    sinks which do not partition their output ignore it.
+    '''
+
+    def write(self, df, partition=()):
+        raise NotImplementedError
+
+    def close(self):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MemorySink(Sink):
+    '''
+    Keeps every chunk written to it in memory (the behaviour of scrapers without a sink).
+    '''
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, df, partition=()):
+        self.frames.append(df)
+
+    def to_frame(self):
+        '''
+        Returns all chunks concatenated into one pandas.DataFrame.
+        '''
+        if self.frames:
+            return pd.concat(self.frames, ignore_index=True)
+        return pd.DataFrame([], columns = [])
+
+
+class PartitionedSink(Sink):
+    '''
+    Base class for sinks writing each chunk to its own numbered part file (part-00000.<extension>, ...) in directory,
+    or in a subdirectory name=value/... for each (name, value) of the chunk's partition.
+    Numbering carries on from the part files already in directory, so reruns append rather than overwrite,
+    and parts are never overwritten by other processes writing to the same directory.
+    Subclasses implement _write_part(df, path) and _read_part(path).
+    '''
+
+    extension = None
+
+    def __init__(self, directory, prefix='part'):
+        self.directory = directory
+        self.prefix    = prefix
+        self._lock     = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        part_numbers   = [self._part_number(path) for path in self.part_paths()]
+        self.num_parts = max(part_numbers) + 1 if part_numbers else 0
+
+    def _part_number(self, path):
+        return int(re.match(r'{}-(\d+)\.'.format(re.escape(self.prefix)), os.path.basename(path)).group(1))
+
+    def part_paths(self):
+        '''
+        Returns the paths of every part file in directory (and its partitions), in the order they were written.
+        '''
+        pattern = re.compile(r'{}-\d+\.{}$'.format(re.escape(self.prefix), re.escape(self.extension)))
+        paths = [os.path.join(root, name) for root, _, names in os.walk(self.directory) for name in names if pattern.match(name)]
+
+        return sorted(paths, key=self._part_number)
+
+    def partition_directory(self, partition=()):
+        '''
+        Returns the directory of the chunks of partition (values are percent-encoded, as hive-style readers expect).
+        '''
+        segments = ['{}={}'.format(name, urllib.parse.quote(str(value), safe=' ,-()&\'')) for name, value in partition]
+
+        return os.path.join(self.directory, *segments)
+
+    def _next_part(self, after=-1):
+        with self._lock:
+            part = max(self.num_parts, after + 1)
+            self.num_parts = part + 1
+            return part
+
+    def write(self, df, partition=()):
+        part = self._next_part()
+        directory = self.partition_directory(partition)
+        os.makedirs(directory, exist_ok=True)
+        # Write under a hidden name first, so readers never see half-written parts
+        tmp_path = os.path.join(directory, '.{}-{}-{}.tmp'.format(self.prefix, os.getpid(), part))
+        self._write_part(df, tmp_path)
+        # Other processes may write to the same directory (e.g. work queue workers): linking fails rather than
+        # replacing a part they have written, and the next free number is tried
+        while True:
+            path = os.path.join(directory, '{}-{:05d}.{}'.format(self.prefix, part, self.extension))
+            try:
+                os.link(tmp_path, path)
+                break
+            except FileExistsError:
+                part = self._next_part(part)
+        os.remove(tmp_path)
+
+    def read(self):
+        '''
+        Returns every part written to directory concatenated into one pandas.DataFrame.
+        Partition names which are not already columns of a part are added as columns.
+        '''
+        frames = []
+        for path in self.part_paths():
+            df = self._read_part(path)
+            relative_directory = os.path.relpath(os.path.dirname(path), self.directory)
+            segments = [] if relative_directory == os.curdir else relative_directory.split(os.sep)
+            for segment in segments[::-1]:
+                name, _, value = segment.partition('=')
+                if name not in df.columns:
+                    df.insert(0, name, urllib.parse.unquote(value))
+            frames.append(df)
+        if frames:
+            return pd.concat(frames, ignore_index=True)
+        return pd.DataFrame([], columns = [])
+
+    def _write_part(self, df, path):
+        raise NotImplementedError
+
+    def _read_part(self, path):
+        raise NotImplementedError
+
+
+class CsvSink(PartitionedSink):
+    '''
+    Writes each chunk to its own numbered csv file (part-00000.csv, part-00001.csv, ...) in directory.
+    Chunks may have different columns; read() aligns them.
+    '''
+
+    extension = 'csv'
+
+    def _write_part(self, df, path):
+        df.to_csv(path, index=False)
+
+    def _read_part(self, path):
+        return pd.read_csv(path, dtype=str)
+
+
+class ParquetSink(PartitionedSink):
+    '''
+    Writes each chunk to its own numbered parquet file (part-00000.parquet, ...) in directory. Requires pyarrow.
+    With partitions, directory can be read as a hive-partitioned dataset (e.g. pyarrow.dataset or spark).
+    '''
+
+    extension = 'parquet'
+
+    def __init__(self, directory, prefix='part', compression='snappy'):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('ParquetSink requires pyarrow: pip install parish_scraper[parquet]')
+        self.compression = compression
+        super().__init__(directory, prefix)
+
+    def _write_part(self, df, path):
+        df.to_parquet(path, index=False, compression=self.compression)
+
+    def _read_part(self, path):
+        return pd.read_parquet(path)
+
+
+class LabelledSink(Sink):
+    '''
+    Wraps another sink, prepending constant categorical columns (e.g. browse labels) to every chunk before forwarding it.
+    labels is a list of (column name, value) tuples, in column order.
+    '''
+
+    def __init__(self, sink, labels):
+        self.sink   = sink
+        self.labels = list(labels)
+
+    def write(self, df, partition=()):
+        df = df.copy()
+        for label_name, label_value in self.labels[::-1]:
+            df.insert(0, label_name, label_column(label_value, len(df)))
+        self.sink.write(df, partition)
@@ -0,0 +1,174 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: RateLimiter
+A token-bucket rate limiter with automatic slow-down, shared by every driver (and session) scraping the same site.
+Every page load or page change takes a token. When a site shows signs of throttling (alert pages, missing
+spinners, HTTP 429/503) the rate is halved and requests pause for an exponentially growing back-off; each
+successful page then raises the rate again a little, up to the site's budget.
+With a state_path, the bucket is kept in a locked file so that processes on the same host share it.
+Waits for tokens and penalties are recorded in the site's metrics (see parish_scraper.metrics).
+'''
+
+import json
+import os
+import threading
+import time
+
+from .metrics import get_metrics
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: limiters are then shared within a process only.
+    fcntl = None
+
+
+# Default budgets (requests per second and burst size) for each site.
+SITE_BUDGETS = {'ancestry'      : {'rate' : 1.0, 'burst' : 5},
+                'family_search' : {'rate' : 2.0, 'burst' : 10}}
+
+
+class RateLimiter:
+    '''
+    Token bucket refilled at rate tokens per second, holding at most burst tokens.
+    penalize() halves the rate (down to min_rate) and blocks acquire() for a back-off of
+    backoff * 2 ** (consecutive penalties - 1) seconds (at most max_backoff); reward() adds
+    increase to the rate (up to max_rate, the site's budget).
+    If site is given, waits and penalties are recorded in get_metrics(site).
+    '''
+
+    def __init__(self, rate=1.0, burst=5, min_rate=0.05, max_rate=None, increase=0.02,
+                 backoff=2.0, max_backoff=300.0, state_path=None, site=None):
+        self.burst       = burst
+        self.min_rate    = min_rate
+        self.max_rate    = max_rate or rate
+        self.increase    = increase
+        self.backoff     = backoff
+        self.max_backoff = max_backoff
+        self.state_path  = state_path if fcntl else None
+        self.site        = site
+        self._lock       = threading.Lock()
+        self._state      = {'rate' : rate, 'tokens' : burst, 'updated' : time.time(), 'blocked_until' : 0.0, 'penalties' : 0}
+
+    def _update(self, func):
+        '''
+        Calls func(state) with exclusive access to the bucket's state and returns its result.
+        '''
+        with self._lock:
+            if not self.state_path:
+                return func(self._state)
+            with open(self.state_path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    state = json.loads(content) if content else dict(self._state)
+                    result = func(state)
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            return result
+
+    def _refill(self, state, now):
+        state['tokens']  = min(self.burst, state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+
+    def acquire(self, tokens=1):
+        '''
+        Blocks until tokens are available (and any back-off has passed), then takes them.
+        Returns: seconds spent waiting.
+        '''
+        waited = 0.0
+        while True:
+            def _take(state):
+                now = time.time()
+                self._refill(state, now)
+                if now < state['blocked_until']:
+                    return state['blocked_until'] - now
+                if state['tokens'] >= tokens:
+                    state['tokens'] -= tokens
+                    return 0.0
+                return (tokens - state['tokens']) / state['rate']
+            wait = self._update(_take)
+            if wait <= 0:
+                if waited and self.site:
+                    get_metrics(self.site).add_time('throttle', waited)
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self):
+        '''
+        Signals that the site is throttling: halves the rate and starts a back-off.
+        Returns: length of the back-off (seconds).
+        '''
+        def _penalize(state):
+            now = time.time()
+            self._refill(state, now)
+            state['penalties'] += 1
+            state['rate']   = max(self.min_rate, state['rate'] / 2)
+            state['tokens'] = 0
+            backoff = min(self.max_backoff, self.backoff * 2 ** (state['penalties'] - 1))
+            state['blocked_until'] = max(state['blocked_until'], now + backoff)
+            return backoff
+
+        if self.site:
+            get_metrics(self.site).increment('penalties')
+
+        return self._update(_penalize)
+
+    def reward(self):
+        '''
+        Signals a successful request: slowly raises the rate back towards max_rate.
+        '''
+        def _reward(state):
+            state['penalties'] = 0
+            state['rate'] = min(self.max_rate, state['rate'] + self.increase)
+
+        self._update(_reward)
+
+    @property
+    def rate(self):
+        return self._update(lambda state: state['rate'])
+
+
+_limiters      = {}
+_limiters_lock = threading.Lock()
+
+
+def _build_limiter(site, **kwargs):
+    settings = dict(SITE_BUDGETS.get(site, {}), site=site)
+    settings.update(kwargs)
+    state_directory = os.getenv('PARISH_SCRAPER_RATE_DIR')
+    if 'state_path' not in settings and state_directory:
+        os.makedirs(state_directory, exist_ok=True)
+        settings['state_path'] = os.path.join(state_directory, '{}.json'.format(site))
+
+    return RateLimiter(**settings)
+
+
+def configure_limiter(site, **kwargs):
+    '''
+    Replaces the limiter for site with RateLimiter(**kwargs), starting from the site's default budget.
+    If state_path is not given and $PARISH_SCRAPER_RATE_DIR is set, the limiter's state is kept in
+    that directory and shared by every process using it.
+    Returns: the new RateLimiter.
+    '''
+    with _limiters_lock:
+        _limiters[site] = _build_limiter(site, **kwargs)
+        return _limiters[site]
+
+
+def get_limiter(site):
+    '''
+    Returns the RateLimiter shared by everything in this process scraping site, creating it with the site's default budget.
+    '''
+    with _limiters_lock:
+        if site not in _limiters:
+            _limiters[site] = _build_limiter(site)
+        return _limiters[site]
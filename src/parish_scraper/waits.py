@@ -0,0 +1,153 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: LatencyTracker
+Adaptive replacement for fixed WebDriverWait timeouts. The time each wait takes to succeed is recorded per key
+(a selector or page type), and the timeout of the next wait is derived from the observed latencies:
+a high percentile, scaled and plus a margin. Fast pages therefore fail fast, while slow pages are not
+refreshed too early. Timeouts are counted but not sampled, as some waits are for elements which may
+legitimately never appear (e.g. a leaf without urls); they must not lengthen the timeout.
+'''
+
+import collections
+import math
+import threading
+import time
+
+
+class LatencyTracker:
+    '''
+    Records wait latencies per key and derives per-key timeouts from them.
+    timeout = clamp(percentile(latencies) * factor + margin, min_timeout, max_timeout),
+    using only the last window samples, and the caller's default timeout until min_samples have been recorded.
+    Waits which time out are only counted: the timeout of a key only grows if its waits succeed slowly.
+    '''
+
+    def __init__(self, percentile=95, factor=1.5, margin=1.0, min_timeout=2, max_timeout=60, min_samples=5, window=200):
+        self.percentile  = percentile
+        self.factor      = factor
+        self.margin      = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+        self.window      = window
+        self.latencies   = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.timeouts    = collections.Counter()
+        self._lock       = threading.Lock()
+
+    @staticmethod
+    def _percentile(values, percentile):
+        values = sorted(values)
+        index  = max(0, math.ceil(percentile / 100 * len(values)) - 1)
+        return values[index]
+
+    def record(self, key, seconds, timed_out=False):
+        '''
+        Records that a wait for key took seconds (and whether it timed out).
+        '''
+        with self._lock:
+            if timed_out:
+                self.timeouts[key] += 1
+            else:
+                self.latencies[key].append(seconds)
+
+    def timeout(self, key, default):
+        '''
+        Returns the timeout (seconds) to use for the next wait for key.
+        '''
+        with self._lock:
+            latencies = list(self.latencies.get(key, ()))
+        if len(latencies) < self.min_samples:
+            return default
+        timeout = self._percentile(latencies, self.percentile) * self.factor + self.margin
+
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def stats(self):
+        '''
+        Returns {key : {'samples', 'timeouts', 'p50', 'p95', 'max', 'timeout'}} of the waits recorded so far.
+        The latencies ('p50', 'p95', 'max') are None for keys whose waits have all timed out, and 'timeout' is None
+        for keys which still use their default timeout.
+        '''
+        with self._lock:
+            latencies = {key : list(values) for key, values in self.latencies.items()}
+            timeouts  = dict(self.timeouts)
+        stats = {}
+        for key in set(latencies) | set(timeouts):
+            values = latencies.get(key, [])
+            if not values and not timeouts.get(key):
+                continue
+            stats[key] = {'samples'  : len(values),
+                          'timeouts' : timeouts.get(key, 0),
+                          'p50'      : self._percentile(values, 50) if values else None,
+                          'p95'      : self._percentile(values, 95) if values else None,
+                          'max'      : max(values) if values else None,
+                          'timeout'  : self.timeout(key, None)}
+
+        return stats
+
+    def report(self):
+        '''
+        Returns the statistics of stats() as a printable table.
+        '''
+        lines = ['{:<40} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format('key', 'samples', 'timeouts', 'p50', 'p95', 'max', 'timeout')]
+        seconds = lambda value: '{:.2f}'.format(value) if value is not None else '-'
+        for key, stat in sorted(self.stats().items()):
+            timeout = seconds(stat['timeout']) if stat['timeout'] is not None else 'default'
+            lines.append('{:<40} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+                key, stat['samples'], stat['timeouts'], seconds(stat['p50']), seconds(stat['p95']), seconds(stat['max']), timeout))
+
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.latencies.clear()
+            self.timeouts.clear()
+
+
+# Shared by every driver in the process
+latency_tracker = LatencyTracker()
+
+
+class AdaptiveWait:
+    '''
+    Drop-in replacement for WebDriverWait(driver, timeout, ignored_exceptions=...) whose timeout is chosen by
+    a LatencyTracker for key, with default_timeout used until enough latencies have been observed.
+    '''
+
+    def __init__(self, driver, key, default_timeout, ignored_exceptions=None, tracker=None):
+        self.driver             = driver
+        self.key                = key
+        self.tracker            = tracker or latency_tracker
+        self.timeout            = self.tracker.timeout(key, default_timeout)
+        self.ignored_exceptions = ignored_exceptions
+
+    def until(self, method, message=''):
+        # selenium is only imported once a wait is made, so the latency statistics can be used without it
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(self.driver, self.timeout, ignored_exceptions=self.ignored_exceptions).until(method, message)
+        except TimeoutException:
+            self.tracker.record(self.key, time.perf_counter() - start, timed_out=True)
+            raise
+        self.tracker.record(self.key, time.perf_counter() - start)
+
+        return result
+
+
+def adaptive_wait(driver, key, default_timeout, ignored_exceptions=None):
+    '''
+    Returns an AdaptiveWait for key using the process-wide latency_tracker.
+    '''
+    return AdaptiveWait(driver, key, default_timeout, ignored_exceptions)
+
+
+def wait_stats():
+    '''
+    Returns the wait latency statistics recorded in this process (see LatencyTracker.stats).
+    '''
+    return latency_tracker.stats()
@@ -0,0 +1,326 @@
+'''
+Author: Henry Yeomans
+Created: 2021-03
+
+Class: WorkQueue
+A durable queue of scraping work (Ancestry record urls, FamilySearch search shards) in a SQLite file, shared by
+any number of worker processes or hosts. Workers claim an item under a lease, heartbeat while they work on it
+and mark it done (or failed); an item whose lease expires (its worker crashed or hung) is claimed again by
+another worker. The file must be on a disk whose file locking SQLite can rely on (local disk, or a shared
+filesystem with working locks).
+'''
+
+import collections
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+
+WorkItem = collections.namedtuple('WorkItem', ['id', 'kind', 'key', 'payload', 'attempts', 'worker'])
+
+# Kinds of work item
+ANCESTRY_RECORD = 'ancestry_record'
+SEARCH_SHARD    = 'family_search_shard'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    id            INTEGER PRIMARY KEY,
+    kind          TEXT NOT NULL,
+    key           TEXT NOT NULL,
+    payload       TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    worker        TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    result        TEXT,
+    error         TEXT,
+    updated       REAL NOT NULL,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires);
+CREATE TABLE IF NOT EXISTS written (
+    key     TEXT PRIMARY KEY,
+    result  TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+'''
+
+
+def make_worker_id():
+    '''
+    Returns a worker id unique across hosts and processes: <host>:<pid>:<random>.
+    '''
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+class WorkQueue:
+    '''
+    Work queue in the SQLite file at path. Items are (kind, key) pairs (enqueued at most once) with a json payload.
+    A claimed item is leased for lease_seconds; a worker which does not heartbeat or complete it in that time
+    loses it. Items which have failed max_attempts times stay failed.
+    '''
+
+    def __init__(self, path, lease_seconds=300.0, max_attempts=3, timeout=30.0):
+        self.path          = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts  = max_attempts
+        self.timeout       = timeout
+        with contextlib.closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per operation, so the queue can be used from any thread (e.g. a heartbeat thread)
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def put(self, kind, key, payload=None):
+        '''
+        Enqueues the item (kind, key), unless it is already in the queue.
+        Returns: True if the item was added.
+        '''
+        return self.put_many([(kind, key, payload)]) == 1
+
+    def put_many(self, items):
+        '''
+        Enqueues (kind, key, payload) items in one transaction, skipping those already in the queue.
+        Returns: number of items added.
+        '''
+        now = time.time()
+        rows = [(kind, key, json.dumps(payload), now) for kind, key, payload in items]
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany('INSERT OR IGNORE INTO items (kind, key, payload, updated) VALUES (?, ?, ?, ?)', rows)
+            return connection.total_changes - before
+
+    def claim(self, worker, kinds=None):
+        '''
+        Leases the oldest pending item (or item whose lease has expired) of one of kinds (default: any kind) to worker.
+        Items whose lease expired on their last attempt are marked failed.
+        Returns: WorkItem, or None if there is nothing to claim.
+        '''
+        now = time.time()
+        kind_filter = ''
+        params = [now]
+        if kinds:
+            kind_filter = ' AND kind IN ({})'.format(', '.join('?' * len(kinds)))
+            params += list(kinds)
+        with self._transaction() as connection:
+            connection.execute('UPDATE items SET state = \'failed\', error = \'Lease expired.\', updated = ?'
+                               ' WHERE state = \'leased\' AND lease_expires < ? AND attempts >= ?', (now, now, self.max_attempts))
+            row = connection.execute('SELECT * FROM items WHERE (state = \'pending\' OR (state = \'leased\' AND lease_expires < ?))'
+                                     + kind_filter + ' ORDER BY id LIMIT 1', params).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE items SET state = \'leased\', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ?'
+                               ' WHERE id = ?', (worker, now + self.lease_seconds, now, row['id']))
+
+        return WorkItem(row['id'], row['kind'], row['key'], json.loads(row['payload']), row['attempts'] + 1, worker)
+
+    def _update_leased(self, item, assignments, params):
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE items SET {}, updated = ? WHERE id = ? AND state = \'leased\' AND worker = ?'.format(assignments),
+                                        list(params) + [time.time(), item.id, item.worker])
+            return cursor.rowcount == 1
+
+    def heartbeat(self, item):
+        '''
+        Extends the lease of item by lease_seconds.
+        Returns: False if the worker no longer holds the lease (it expired and the item was claimed again).
+        '''
+        return self._update_leased(item, 'lease_expires = ?', [time.time() + self.lease_seconds])
+
+    def complete(self, item, result=None):
+        '''
+        Marks item as done, saving result (json serialisable) with it.
+        Returns: False if the worker no longer holds the lease.
+        '''
+        return self._update_leased(item, 'state = \'done\', lease_expires = NULL, result = ?', [json.dumps(result)])
+
+    def fail(self, item, error):
+        '''
+        Records error for item and puts it back in the queue (or marks it failed after max_attempts attempts).
+        Returns: False if the worker no longer holds the lease.
+        '''
+        state = 'failed' if item.attempts >= self.max_attempts else 'pending'
+        return self._update_leased(item, 'state = ?, lease_expires = NULL, error = ?', [state, error])
+
+    def mark_written(self, key, result=True):
+        '''
+        Records that the output keyed key (e.g. an item's key, or one of several partitions it writes) has been written
+        to an append-only sink, with result (json serialisable), so that a worker claiming the item again (its lease
+        expired, or its worker died after writing) does not write it twice. Kept however the item ends.
+        '''
+        with self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO written (key, result, updated) VALUES (?, ?, ?)', (key, json.dumps(result), time.time()))
+
+    def written(self, key):
+        '''
+        Returns: the result recorded by mark_written for key, or None if key has not been written.
+        '''
+        with contextlib.closing(self._connect()) as connection:
+            row = connection.execute('SELECT result FROM written WHERE key = ?', (key,)).fetchone()
+
+        return None if row is None else json.loads(row['result'])
+
+    def counts(self, kind=None):
+        '''
+        Returns: dict {state : number of items} (states are pending, leased, done and failed).
+        '''
+        query, params = 'SELECT state, COUNT(*) FROM items', []
+        if kind:
+            query, params = query + ' WHERE kind = ?', [kind]
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(query + ' GROUP BY state', params).fetchall()
+
+        return {state : count for state, count in rows}
+
+    def results(self, kind=None):
+        '''
+        Returns: dict {key : result} of the items done.
+        '''
+        query, params = 'SELECT key, result FROM items WHERE state = \'done\'', []
+        if kind:
+            query, params = query + ' AND kind = ?', [kind]
+        with contextlib.closing(self._connect()) as connection:
+            rows = connection.execute(query + ' ORDER BY id', params).fetchall()
+
+        return {key : json.loads(result) for key, result in rows}
+
+    def is_finished(self, kinds=None):
+        '''
+        Returns True if no item (of kinds) is waiting or being worked on.
+        '''
+        counts = collections.Counter()
+        for kind in kinds or [None]:
+            counts.update(self.counts(kind))
+        return not (counts['pending'] or counts['leased'])
+
+
+class _Transaction:
+    '''
+    Context manager holding a write lock (BEGIN IMMEDIATE) on connection, committing on success, rolling back on error.
+    '''
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, *exc_info):
+        try:
+            self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.connection.close()
+
+
+class Heartbeat:
+    '''
+    Context manager heartbeating item in queue from a background thread every interval seconds
+    (default: a third of the lease). lost is set if the lease was lost.
+    '''
+
+    def __init__(self, queue, item, interval=None):
+        self.queue    = queue
+        self.item     = item
+        self.interval = interval or queue.lease_seconds / 3
+        self.lost     = False
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.item):
+                    self.lost = True
+                    return
+            except sqlite3.OperationalError:
+                # The file is busy: try again at the next beat, the lease has time left
+                continue
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, handlers, worker=None, poll_interval=5.0, stop_when_finished=True, max_items=None):
+    '''
+    Claims and works on items of queue until none are left (or max_items have been worked on).
+    handlers is a dict {kind : handler}; handler(item) does the work and returns a json serialisable result.
+    Items whose handler raises are put back in the queue (see WorkQueue.fail).
+    While other workers hold leases, the worker waits poll_interval seconds and tries again, in case a lease expires.
+    If not stop_when_finished, the worker keeps polling for new items.
+    Returns: dict {state : number of items} of the items this worker worked on: 'done', 'pending' or 'failed'
+    (its handler raised) or 'lost' (the lease expired before it was done).
+    '''
+    worker  = worker or make_worker_id()
+    kinds   = list(handlers)
+    summary = collections.Counter()
+    while max_items is None or sum(summary.values()) < max_items:
+        item = queue.claim(worker, kinds)
+        if item is None:
+            if stop_when_finished and queue.is_finished(kinds):
+                break
+            time.sleep(poll_interval)
+            continue
+        try:
+            with Heartbeat(queue, item):
+                result = handlers[item.kind](item)
+        except Exception:
+            queue.fail(item, traceback.format_exc())
+            summary['failed' if item.attempts >= queue.max_attempts else 'pending'] += 1
+            continue
+        if queue.complete(item, result):
+            summary['done'] += 1
+        else:
+            summary['lost'] += 1
+
+    return dict(summary)
+
+
+def enqueue_records(queue, collection_urls, collection_code=None):
+    '''
+    Enqueues the Ancestry record urls of collection_urls (as set by AncestryScraper.get_parish_urls).
+    Each item's payload holds the record's labels and date range, so workers can partition their output.
+    Returns: number of records added.
+    '''
+    items = []
+    for labels, url_dict in collection_urls.items():
+        for date_range, url in url_dict.items():
+            payload = {'collection' : collection_code, 'labels' : [list(label) for label in labels], 'date_range' : date_range}
+            items.append((ANCESTRY_RECORD, url, payload))
+
+    return queue.put_many(items)
+
+
+def shard_key(place_name, year_from, year_to, offset):
+    return '{}|{}-{}|{}'.format(place_name, year_from, year_to, offset)
+
+
+def enqueue_search_shards(queue, place_name, date_ranges, offsets=(0,)):
+    '''
+    Enqueues FamilySearch (place, year range, offset) search shards for place_name, for each (year_from, year_to)
+    of date_ranges (e.g. from family_search.plan_date_ranges, or single years (year, year)) at each of offsets.
+    Workers scraping a first page (offset 0) enqueue the range's other offsets once they know the number of results.
+    Returns: number of shards added.
+    '''
+    items = [(SEARCH_SHARD, shard_key(place_name, year_from, year_to, offset),
+              {'place_name' : place_name, 'year_from' : year_from, 'year_to' : year_to, 'offset' : offset})
+             for year_from, year_to in date_ranges for offset in offsets]
+
+    return queue.put_many(items)
@@ -0,0 +1,83 @@
+'''
+Benchmark of page-load time and resident memory per browser for the 'default' and 'performance' browser profiles.
+A local page with many images, web fonts and a video is served with tests.conftest.WebServer (pass --url to
+load real pages instead). Requires chrome and chromedriver.
+
+Run from src/:  python -m tests.benchmarks.bench_browser_profile
+'''
+
+import argparse
+import statistics
+import time
+
+from flask import Flask, Response
+from parish_scraper.drivers import BROWSER_PROFILES, boot_up_chrome
+from tests.benchmarks.resources import driver_pid, process_tree_rss
+from tests.conftest import WebServer
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36"
+
+
+def make_heavy_site(num_images=60, asset_kb=200, latency=0.02):
+    '''
+    Returns a Flask app serving a page (/) with an index table and many slow, large images, fonts and a video.
+    '''
+    app = Flask('bench_browser_profile')
+    payload = b'\0' * (asset_kb * 1024)
+
+    @app.route('/')
+    def page():
+        images = ''.join('<img src="/asset/{}.png">'.format(i) for i in range(num_images))
+        rows = ''.join('<div class="grid-row"><div>Name {0}</div><div>{0}</div></div>'.format(i) for i in range(100))
+        return '''
+               <html><head><style>
+               @font-face {{ font-family: bench; src: url("/asset/font.woff2"); }}
+               body {{ font-family: bench; }}
+               </style></head><body>
+               <div class="grid-container">{}</div>{}
+               <video src="/asset/video.mp4" autoplay muted></video>
+               </body></html>
+               '''.format(rows, images)
+
+    @app.route('/asset/<name>')
+    def asset(name):
+        time.sleep(latency)
+        return Response(payload, mimetype='application/octet-stream')
+
+    return app
+
+
+def bench_profile(browser_profile, urls, repeat):
+    driver = boot_up_chrome(USER_AGENT, browser_profile)
+    try:
+        load_times = []
+        for _ in range(repeat):
+            for url in urls:
+                start = time.perf_counter()
+                driver.get(url)
+                load_times.append(time.perf_counter() - start)
+        rss = process_tree_rss(driver_pid(driver))
+    finally:
+        driver.quit()
+
+    return statistics.median(load_times), rss
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--url', nargs='*', default=None)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    server = WebServer(make_heavy_site())
+    with server.run():
+        urls = args.url or [server.url + '/']
+        print('{:>12} {:>16} {:>14}'.format('profile', 'median load (s)', 'RSS (MiB)'))
+        for browser_profile in BROWSER_PROFILES:
+            load_time, rss = bench_profile(browser_profile, urls, args.repeat)
+            print('{:>12} {:>16.3f} {:>14.1f}'.format(browser_profile, load_time, rss / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+'''
+Memory benchmark of building the collection frame of scrape_collection on a synthetic collection.
+Compares the original construction (a string column inserted per label, concatenated per label and then per
+collection) with parish_scraper.parsing.concat_labelled (one concatenation, categorical label columns).
+
+Run from src/:  python -m tests.benchmarks.bench_collection_memory
+'''
+
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from parish_scraper.parsing import concat_labelled
+
+
+def make_collection(num_parishes, records_per_parish, rows_per_record):
+    '''
+    Returns {labels : {date range : DataFrame}} for a synthetic collection, shaped like AncestryScraper.collection_urls.
+    '''
+    collection = {}
+    for parish in range(num_parishes):
+        labels = (('County', 'County {}'.format(parish % 12)),
+                  ('Parish', 'Parish of St Mary the Virgin {}'.format(parish)),
+                  ('Record Type', 'Burials'))
+        records = {}
+        for record in range(records_per_parish):
+            date_range = '{}-{}'.format(1700 + 25 * record, 1724 + 25 * record)
+            records[date_range] = pd.DataFrame({'Name'        : ['Name {} {}'.format(record, row) for row in range(rows_per_record)],
+                                                'Burial Date' : ['{} Jan {}'.format(row % 28 + 1, 1700 + 25 * record) for row in range(rows_per_record)],
+                                                'Age'         : [str(row % 90) for row in range(rows_per_record)]})
+        collection[labels] = records
+
+    return collection
+
+
+def legacy_collection_df(collection):
+    '''
+    The original construction in scrape_collection, kept as the reference implementation.
+    '''
+    collection_dfs = []
+    for labels, records in collection.items():
+        record_dfs = []
+        for date_range, df_record in records.items():
+            df_record = df_record.copy()
+            df_record.insert(0, 'Record Date Range', date_range)
+            record_dfs.append(df_record)
+        if record_dfs:
+            df_label = pd.concat(record_dfs, axis=0, ignore_index=True)
+        else:
+            df_label = pd.DataFrame()
+        for label_name, label_value in labels[::-1]:
+            df_label.insert(0, label_name, label_value)
+        collection_dfs.append(df_label)
+    if collection_dfs:
+        df_collection = pd.concat(collection_dfs, axis=0, ignore_index=True)
+    else:
+        df_collection = pd.DataFrame()
+
+    return df_collection
+
+
+def categorical_collection_df(collection):
+    frames = [df_record for records in collection.values() for df_record in records.values()]
+    labels = [list(labels) + [('Record Date Range', date_range)] for labels, records in collection.items() for date_range in records]
+
+    return concat_labelled(frames, labels)
+
+
+def measure(func, collection):
+    '''
+    Returns (DataFrame, seconds, peak bytes allocated while building it).
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func(collection)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return df, seconds, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--parishes', type=int, default=200)
+    arg_parser.add_argument('--records', type=int, default=8)
+    arg_parser.add_argument('--rows', type=int, default=500)
+    args = arg_parser.parse_args()
+
+    collection = make_collection(args.parishes, args.records, args.rows)
+    print('{} parishes x {} records x {} rows'.format(args.parishes, args.records, args.rows))
+    print('{:>12} {:>10} {:>14} {:>14} {:>14}'.format('build', 'seconds', 'peak MB', 'frame MB', 'label MB'))
+    results = {}
+    for name, func in [('legacy', legacy_collection_df), ('categorical', categorical_collection_df)]:
+        df, seconds, peak = measure(func, collection)
+        usage = df.memory_usage(deep=True)
+        label_columns = ['County', 'Parish', 'Record Type', 'Record Date Range']
+        print('{:>12} {:>10.3f} {:>14.1f} {:>14.1f} {:>14.1f}'.format(
+            name, seconds, peak / 1e6, usage.sum() / 1e6, usage[label_columns].sum() / 1e6))
+        results[name] = df
+    legacy, categorical = results['legacy'], results['categorical']
+    assert list(legacy.columns) == list(categorical.columns)
+    assert legacy.astype(str).equals(categorical.astype(str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+'''
+Benchmark of scraping FamilySearch search results, against the local stand-in site of tests.mock_family_search
+(results pages built from shadow-DOM web components, and the json search service behind them).
+
+1. Per-page and per-row cost of reading a results table: scrape_table (WebDriver calls per row) against
+   scrape_table_batched (one script call per page), as the number of rows per page grows.
+2. FamilySearchScraper.get_burial_records over growing year ranges, with the browser backend (sequential,
+   with a driver pool, and through the pipeline) and the http backend, with and without the date-range planner.
+Requires chrome and chromedriver.
+
+Run from src/:  python -m tests.benchmarks.bench_family_search
+'''
+
+import argparse
+import timeit
+import time
+
+from parish_scraper import family_search
+from parish_scraper.drivers import boot_up_chrome
+from parish_scraper.family_search import USER_AGENT, FamilySearchScraper, QuietShadow, scrape_results_page, scrape_table, scrape_table_batched
+from parish_scraper.metrics import get_metrics
+from parish_scraper.pool import DriverPool
+from parish_scraper.throttle import configure_limiter
+from tests.conftest import WebServer
+from tests.mock_family_search import expected_records, make_family_search_site, results_url, service_url
+
+
+PLACE_NAME = 'Canterbury, Kent, England'
+
+
+def use_site(server):
+    family_search.RESULTS_URL = results_url(server)
+    family_search.SERVICE_URL = service_url(server)
+
+
+def bench_table(rows_per_page, browser_profile, repeat):
+    '''
+    Returns (seconds per page with scrape_table, seconds per page with scrape_table_batched) for a page of rows_per_page rows.
+    '''
+    # Years divisible by 5 have exactly results_per_year results
+    server = WebServer(make_family_search_site(results_per_year=rows_per_page))
+    with server.run():
+        use_site(server)
+        driver = boot_up_chrome(USER_AGENT, browser_profile)
+        try:
+            scrape_results_page(driver, PLACE_NAME, 1800)
+            shadow = QuietShadow(driver)
+            table  = shadow.find_element(r'div.table')
+            per_row = min(timeit.repeat(lambda: scrape_table(shadow, table), number=1, repeat=repeat))
+            batched = min(timeit.repeat(lambda: scrape_table_batched(driver, table), number=1, repeat=repeat))
+            assert scrape_table(shadow, table) == scrape_table_batched(driver, table)
+        finally:
+            driver.quit()
+
+    return per_row, batched
+
+
+def expected_rows(years, results_per_year, empty_every):
+    '''
+    Returns the number of burial rows get_burial_records should scrape for years.
+    '''
+    return sum(len(expected_records(PLACE_NAME, year, results_per_year, empty_every)) for year in years)
+
+
+def bench_burial_records(year_from, year_to, browser_profile, backend='browser', workers=1, pipeline=False, plan=False):
+    '''
+    Returns seconds taken by get_burial_records (with fresh browsers), the DataFrame it returned and the number
+    of pages it loaded (including the planner's count probes).
+    '''
+    driver_factory = lambda: boot_up_chrome(USER_AGENT, browser_profile)
+    scraper = FamilySearchScraper()
+    scraper.authenticated_driver = driver_factory()
+    # Extra drivers are started without signing in
+    scraper.driver_pool = DriverPool(driver_factory, size=workers, drivers=[scraper.authenticated_driver])
+    scraper.driver_pool.fill()
+    metrics = get_metrics('family_search')
+    try:
+        metrics.reset()
+        start = time.perf_counter()
+        df = scraper.get_burial_records(PLACE_NAME, year_from, year_to, workers=workers, backend=backend, pipeline=pipeline,
+                                        plan=plan)
+        seconds = time.perf_counter() - start
+        page_loads = metrics.counters.get('pages', 0) + metrics.counters.get('probes', 0)
+    finally:
+        scraper.shut_down()
+
+    return seconds, df, page_loads
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10, 50, 100])
+    arg_parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10])
+    arg_parser.add_argument('--results-per-year', type=int, default=250)
+    arg_parser.add_argument('--empty-every', type=int, default=7)
+    arg_parser.add_argument('--latency', type=float, default=0.05)
+    arg_parser.add_argument('--render-delay', type=float, default=0.1)
+    arg_parser.add_argument('--workers', type=int, default=3)
+    arg_parser.add_argument('--browser-profile', default='performance')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    # The local site does not need to be rate limited
+    configure_limiter('family_search', rate=1000.0, burst=1000)
+
+    print('Reading one results table')
+    print('{:>6} {:>14} {:>14} {:>14} {:>14} {:>9}'.format('rows', 'per-row ms', 'per-row ms/row', 'batched ms', 'batched ms/row', 'speedup'))
+    for rows_per_page in args.rows:
+        per_row, batched = bench_table(rows_per_page, args.browser_profile, args.repeat)
+        rows = min(rows_per_page, 100)
+        print('{:>6} {:>14.1f} {:>14.2f} {:>14.1f} {:>14.2f} {:>8.1f}x'.format(
+            rows, 1000 * per_row, 1000 * per_row / rows, 1000 * batched, 1000 * batched / rows, per_row / batched))
+
+    configurations = [('browser', {'backend' : 'browser'}),
+                      ('pool', {'backend' : 'browser', 'workers' : args.workers}),
+                      ('pipeline', {'backend' : 'browser', 'workers' : args.workers, 'pipeline' : True}),
+                      ('http', {'backend' : 'http'}),
+                      ('planned', {'backend' : 'http', 'plan' : True})]
+    server = WebServer(make_family_search_site(args.results_per_year, args.empty_every, args.latency, args.render_delay))
+    with server.run():
+        use_site(server)
+        print('\nget_burial_records, {} results per year, {:.0f}ms latency, {:.0f}ms render delay'.format(
+            args.results_per_year, 1000 * args.latency, 1000 * args.render_delay))
+        print('{:>6} {:>10} {:>7} {:>7} {:>9} {:>9} {:>10} {:>9}'.format('years', 'config', 'pages', 'rows', 'seconds', 'pages/s', 'rows/s', 'ms/page'))
+        for num_years in args.years:
+            year_from, year_to = 1801, 1800 + num_years
+            rows = expected_rows(range(year_from, year_to + 1), args.results_per_year, args.empty_every)
+            for name, kwargs in configurations:
+                seconds, df, pages = bench_burial_records(year_from, year_to, args.browser_profile, **kwargs)
+                if len(df) != rows:
+                    raise AssertionError('{}: scraped {} rows, expected {}.'.format(name, len(df), rows))
+                print('{:>6} {:>10} {:>7} {:>7} {:>9.2f} {:>9.2f} {:>10.1f} {:>9.1f}'.format(
+                    num_years, name, pages, rows, seconds, pages / seconds, rows / seconds, 1000 * seconds / pages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Micro-benchmark of grid container parsing on large synthetic index tables.
+Compares the original BeautifulSoup implementation of make_grid_container_df with parish_scraper.parsing.
+
+Run from src/:  python -m tests.benchmarks.bench_grid_parser
+'''
+
+import argparse
+import importlib.util
+import timeit
+
+import pandas as pd
+
+from bs4 import BeautifulSoup
+from parish_scraper.parsing import parse_grid_container, parse_grid_containers
+
+
+def legacy_make_grid_container_df(grid_container):
+    '''
+    The original make_grid_container_df, kept as the reference implementation.
+    '''
+    soup = BeautifulSoup(grid_container, 'html.parser')
+    rows          = soup.find_all('div', {'class':'grid-row'})
+    columns_html  = rows[0].findChildren('div')
+    elements_html = [row.findChildren('div') for i, row in enumerate(rows) if i >= 1]
+    columns       = [column.text for column in columns_html]
+    elements      = []
+    for i in range(len(elements_html)):
+        element_row_html = elements_html[i]
+        row_elements     = [element.text for element in element_row_html]
+        elements.append(row_elements)
+        df = pd.DataFrame(elements, columns=columns)
+    
+    return df
+
+
+def make_grid_html(num_rows, num_columns=8):
+    '''
+    Returns the inner html of a synthetic grid container with a header row and num_rows rows.
+    '''
+    header = ''.join('<div class="grid-cell">Column {}</div>'.format(j) for j in range(num_columns))
+    rows   = ['<div class="grid-row">{}</div>'.format(header)]
+    for i in range(num_rows):
+        cells = ''.join('<div class="grid-cell"><span>Value {} &amp; {}</span></div>'.format(i, j) for j in range(num_columns))
+        rows.append('<div class="grid-row">{}</div>'.format(cells))
+
+    return ''.join(rows)
+
+
+def time_call(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[50, 200, 1000])
+    arg_parser.add_argument('--pages', type=int, default=20)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    parsers = ['html.parser', 'lxml'] if importlib.util.find_spec('lxml') else ['html.parser']
+
+    print('{:>6} {:>12} {:>12} {:>9}'.format('rows', 'parser', 'seconds', 'speedup'))
+    for num_rows in args.rows:
+        html   = make_grid_html(num_rows)
+        legacy = legacy_make_grid_container_df(html)
+        legacy_time = time_call(lambda: legacy_make_grid_container_df(html), args.repeat)
+        print('{:>6} {:>12} {:>12.4f} {:>9}'.format(num_rows, 'legacy', legacy_time, '1.0x'))
+        for parser in parsers:
+            assert parse_grid_container(html, parser).equals(legacy)
+            seconds = time_call(lambda: parse_grid_container(html, parser), args.repeat)
+            print('{:>6} {:>12} {:>12.4f} {:>8.1f}x'.format(num_rows, parser, seconds, legacy_time / seconds))
+
+    # Batches of pages: one frame per batch versus one frame per page plus concat
+    htmls = [make_grid_html(100) for _ in range(args.pages)]
+    legacy_time = time_call(lambda: pd.concat([legacy_make_grid_container_df(html) for html in htmls], ignore_index=True), args.repeat)
+    print('\n{} pages x 100 rows'.format(args.pages))
+    print('{:>30} {:>10.4f}s'.format('legacy + concat', legacy_time))
+    for parser in parsers:
+        seconds = time_call(lambda: parse_grid_containers(htmls, parser), args.repeat)
+        print('{:>30} {:>10.4f}s {:>6.1f}x'.format('parse_grid_containers ' + parser, seconds, legacy_time / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+'''
+Throughput benchmark of scraping the Ancestry image viewer, against a local stand-in site.
+A synthetic collection of image viewers (records) is served with tests.conftest.WebServer, with a configurable
+number of pages per record, rows per page and response latency. The real AncestryScraper.scrape_collection
+(and so scrape_record) is run against it with polling, with the page observer, and through the pipeline,
+reporting pages/sec, rows/sec, CPU time and peak RSS of python and of the browsers (python CPU time excludes
+the pipeline's parse processes). Requires chrome and chromedriver (Linux, for /proc).
+
+Pages change in place (the next page is fetched by script, as on ancestry.co.uk) unless --navigation reload,
+in which case every page is a full page load.
+--min-pages-per-sec makes the benchmark exit with status 1 if any configuration is slower, so it can gate
+performance regressions.
+
+Run from src/:  python -m tests.benchmarks.bench_image_viewer
+'''
+
+import argparse
+import json
+import resource
+import sys
+import threading
+import time
+
+from flask import Flask, Response, request
+from parish_scraper.ancestry import USER_AGENT, AncestryScraper
+from parish_scraper.drivers import boot_up_chrome
+from parish_scraper.pool import DriverPool
+from parish_scraper.throttle import configure_limiter
+from tests.benchmarks.resources import driver_pid, process_tree_cpu, process_tree_rss
+from tests.conftest import WebServer
+
+
+COLUMNS = ['Name', 'Burial Date', 'Burial Place', 'Age', 'Abode']
+
+VIEWER_SCRIPT = '''
+<script>
+var record = {record};
+var page = {page};
+function nextPage() {{
+    fetch('/viewer/' + record + '/page/' + (page + 1)).then(function(response) {{ return response.json(); }}).then(function(data) {{
+        page = data.page;
+        history.pushState(null, '', '/viewer/' + record + '?page=' + page);
+        document.getElementById('tableButton').disabled = !data.indexed;
+        document.getElementById('nextButton').disabled = data.last;
+        document.querySelector('div.grid-container').innerHTML = data.grid;
+    }});
+}}
+</script>
+'''
+
+
+def make_grid_html(record, page, rows_per_page):
+    '''
+    Returns the grid container html of a page: a header row and rows_per_page rows, unique to (record, page).
+    '''
+    header = ''.join('<div class="grid-cell">{}</div>'.format(column) for column in COLUMNS)
+    rows   = ['<div class="grid-row">{}</div>'.format(header)]
+    for row in range(rows_per_page):
+        values = ['Name {}-{}-{}'.format(record, page, row), '{} Jan 18{:02d}'.format(row % 28 + 1, page % 100),
+                  'St Mary, Parish {}'.format(record), str(row % 90), 'Abode {}'.format(row)]
+        rows.append('<div class="grid-row">{}</div>'.format(''.join('<div class="grid-cell"><span>{}</span></div>'.format(value) for value in values)))
+
+    return ''.join(rows)
+
+
+def is_indexed(page, unindexed_every):
+    # Every unindexed_every-th page has no index (its table button is disabled), as on the real viewer
+    return not (unindexed_every and page % unindexed_every == unindexed_every - 1)
+
+
+def make_image_viewer_site(num_pages=20, rows_per_page=50, latency=0.05, unindexed_every=0, navigation='script'):
+    '''
+    Returns a Flask app serving image viewers at /viewer/<record>?page=<n> (pages 0 to num_pages - 1).
+    '''
+    app = Flask('bench_image_viewer')
+
+    def page_state(record, page):
+        return {'page'    : page,
+                'indexed' : is_indexed(page, unindexed_every),
+                'last'    : page >= num_pages - 1,
+                'grid'    : make_grid_html(record, page, rows_per_page) if is_indexed(page, unindexed_every) else ''}
+
+    @app.route('/viewer/<int:record>')
+    def viewer(record):
+        time.sleep(latency)
+        state = page_state(record, int(request.args.get('page', 0)))
+        if navigation == 'reload':
+            on_click = 'onclick="location.href=\'/viewer/{}?page={}\'"'.format(record, state['page'] + 1)
+        else:
+            on_click = 'onclick="nextPage()"'
+        return '''
+               <html><body>
+               <div class="paging-wrapper" id="buttonsPanel">
+               <button id="tableButton" {table}>Table</button>
+               <span class="imageCountText middle">{num_pages}</span>
+               </div>
+               <button class="page" id="nextButton" {on_click} {next}>Next Page</button>
+               <div class="index-panel">Index Panel<div class="grid-container">{grid}</div></div>
+               {script}
+               </body></html>
+               '''.format(table='' if state['indexed'] else 'disabled', num_pages=num_pages, on_click=on_click,
+                          next='disabled' if state['last'] else '', grid=state['grid'],
+                          script=VIEWER_SCRIPT.format(record=record, page=state['page']))
+
+    @app.route('/viewer/<int:record>/page/<int:page>')
+    def viewer_page(record, page):
+        time.sleep(latency)
+        return Response(json.dumps(page_state(record, page)), mimetype='application/json')
+
+    return app
+
+
+def make_collection_urls(base_url, num_records, records_per_parish=4):
+    '''
+    Returns collection urls (as set by AncestryScraper.get_parish_urls) for num_records viewers of the site.
+    '''
+    collection_urls = {}
+    for record in range(num_records):
+        labels = (('County', 'County {}'.format(record // (4 * records_per_parish))),
+                  ('Parish', 'Parish {}'.format(record // records_per_parish)))
+        date_range = '{}-{}'.format(1700 + 25 * (record % records_per_parish), 1724 + 25 * (record % records_per_parish))
+        collection_urls.setdefault(labels, {})[date_range] = '{}/viewer/{}?page=0'.format(base_url, record)
+
+    return collection_urls
+
+
+def own_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+class PeakSampler:
+    '''
+    Samples the RSS of this process and of the browsers behind drivers every interval seconds, keeping the peaks.
+    '''
+
+    def __init__(self, drivers, interval=0.2):
+        self.drivers      = drivers
+        self.interval     = interval
+        self.python_peak  = 0
+        self.browser_peak = 0
+        self._stop        = threading.Event()
+        self._thread      = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.python_peak  = max(self.python_peak, own_rss())
+        self.browser_peak = max(self.browser_peak, sum(process_tree_rss(driver_pid(driver)) for driver in list(self.drivers)))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def bench_configuration(name, collection_urls, expected_pages, expected_rows, browser_profile, event_driven=False, pipeline=False, workers=1):
+    '''
+    Runs scrape_collection over collection_urls with fresh browsers.
+    Returns: dict of the configuration's measurements.
+    '''
+    driver_factory = lambda: boot_up_chrome(USER_AGENT, browser_profile)
+    scraper = AncestryScraper()
+    scraper.authenticated_driver = driver_factory()
+    scraper.collection_urls = collection_urls
+    # Extra drivers are started without signing in
+    scraper.driver_pool = DriverPool(driver_factory, size=workers, drivers=[scraper.authenticated_driver])
+    scraper.driver_pool.fill()
+    drivers = scraper.driver_pool.drivers
+    try:
+        browser_cpu = sum(process_tree_cpu(driver_pid(driver)) for driver in drivers)
+        python_cpu  = time.process_time()
+        with PeakSampler(drivers) as sampler:
+            start = time.perf_counter()
+            df = scraper.scrape_collection(event_driven=event_driven, pipeline=pipeline, workers=workers)
+            seconds = time.perf_counter() - start
+        python_cpu  = time.process_time() - python_cpu
+        browser_cpu = sum(process_tree_cpu(driver_pid(driver)) for driver in drivers) - browser_cpu
+    finally:
+        scraper.shut_down()
+    if len(df) != expected_rows:
+        raise AssertionError('{}: scraped {} rows, expected {}.'.format(name, len(df), expected_rows))
+
+    return {'name'          : name,
+            'seconds'       : seconds,
+            'pages_per_sec' : expected_pages / seconds,
+            'rows_per_sec'  : expected_rows / seconds,
+            'python_cpu'    : python_cpu,
+            'browser_cpu'   : browser_cpu,
+            'python_rss'    : sampler.python_peak / 2**20,
+            'browser_rss'   : sampler.browser_peak / 2**20}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--records', type=int, default=4)
+    arg_parser.add_argument('--pages', type=int, default=20)
+    arg_parser.add_argument('--rows', type=int, default=50)
+    arg_parser.add_argument('--latency', type=float, default=0.05)
+    arg_parser.add_argument('--unindexed-every', type=int, default=0)
+    arg_parser.add_argument('--navigation', choices=['script', 'reload'], default='script')
+    arg_parser.add_argument('--browser-profile', default='performance')
+    arg_parser.add_argument('--workers', type=int, default=2)
+    arg_parser.add_argument('--configurations', nargs='+', default=['poll', 'event', 'pipeline'],
+                            choices=['poll', 'event', 'pipeline'])
+    arg_parser.add_argument('--min-pages-per-sec', type=float, default=None)
+    args = arg_parser.parse_args()
+
+    # The local site does not need to be rate limited
+    configure_limiter('ancestry', rate=1000.0, burst=1000)
+    indexed_pages  = sum(is_indexed(page, args.unindexed_every) for page in range(args.pages))
+    expected_pages = args.records * args.pages
+    expected_rows  = args.records * indexed_pages * args.rows
+    configurations = {'poll'     : {'event_driven' : False},
+                      'event'    : {'event_driven' : True},
+                      'pipeline' : {'event_driven' : True, 'pipeline' : True, 'workers' : args.workers}}
+
+    server = WebServer(make_image_viewer_site(args.pages, args.rows, args.latency, args.unindexed_every, args.navigation))
+    with server.run():
+        collection_urls = make_collection_urls(server.url, args.records)
+        print('{} records x {} pages x {} rows, {:.0f}ms latency, {} navigation'.format(
+            args.records, args.pages, args.rows, 1000 * args.latency, args.navigation))
+        print('{:>10} {:>9} {:>9} {:>10} {:>11} {:>12} {:>11} {:>12}'.format(
+            'config', 'seconds', 'pages/s', 'rows/s', 'python cpu', 'browser cpu', 'python MiB', 'browser MiB'))
+        results = []
+        for name in args.configurations:
+            result = bench_configuration(name, collection_urls, expected_pages, expected_rows, args.browser_profile, **configurations[name])
+            results.append(result)
+            print('{name:>10} {seconds:>9.2f} {pages_per_sec:>9.2f} {rows_per_sec:>10.1f} {python_cpu:>11.2f} {browser_cpu:>12.2f} {python_rss:>11.1f} {browser_rss:>12.1f}'.format(**result))
+
+    if args.min_pages_per_sec is not None:
+        slow = [result['name'] for result in results if result['pages_per_sec'] < args.min_pages_per_sec]
+        if slow:
+            print('Slower than {} pages/s: {}'.format(args.min_pages_per_sec, ', '.join(slow)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
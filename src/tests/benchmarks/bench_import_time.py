@@ -0,0 +1,74 @@
+'''
+Benchmark of import times, as paid by every short-lived process (e.g. pipeline parse workers started with spawn).
+Each import is timed in fresh interpreters (less the interpreter's own start-up), and the heavy dependencies it
+loaded are listed. 'scrapers' is what 'import parish_scraper' used to import before the scrapers were lazy.
+Also times starting a spawned process pool and parsing one page in it.
+
+Run from src/:  python -m tests.benchmarks.bench_import_time
+'''
+
+import argparse
+import multiprocessing
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from parish_scraper.parsing import results_json_frame
+
+
+IMPORTS = {'package'  : 'import parish_scraper',
+           'parsing'  : 'import parish_scraper.parsing',
+           'sinks'    : 'import parish_scraper.sinks',
+           'pipeline' : 'import parish_scraper.pipeline',
+           'fs'       : 'import parish_scraper.family_search',
+           'scrapers' : 'import parish_scraper.ancestry, parish_scraper.family_search'}
+
+HEAVY_MODULES = ['selenium', 'pyshadow', 'requests', 'bs4', 'pandas', 'numpy']
+
+REPORT_HEAVY = '; import sys; print(" ".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES)
+
+
+def time_interpreter(code, repeat):
+    '''
+    Returns: Tuple (fastest wall time of running code in a new interpreter, its stdout).
+    '''
+    times = []
+    for _ in range(repeat):
+        start  = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        times.append(time.perf_counter() - start)
+
+    return min(times), output.strip()
+
+
+def time_spawned_pool(workers):
+    '''
+    Returns seconds to start a spawned pool of workers processes and parse one results payload in each.
+    '''
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        list(executor.map(results_json_frame, [{'entries' : []}] * workers))
+
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--workers', type=int, default=4)
+    args = arg_parser.parse_args()
+
+    baseline, _ = time_interpreter('pass', args.repeat)
+    print('interpreter start-up {:.3f}s (subtracted below)\n'.format(baseline))
+    print('{:>10} {:>9}  {}'.format('import', 'seconds', 'heavy modules loaded'))
+    for name, statement in IMPORTS.items():
+        seconds, loaded = time_interpreter(statement + REPORT_HEAVY, args.repeat)
+        print('{:>10} {:>9.3f}  {}'.format(name, seconds - baseline, loaded or '-'))
+
+    print('\nspawned pool of {} parse workers: {:.3f}s'.format(args.workers, time_spawned_pool(args.workers)))
+
+
+if __name__ == '__main__':
+    main()
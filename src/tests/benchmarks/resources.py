@@ -0,0 +1,83 @@
+'''
+Helpers for measuring the CPU time and resident memory of a process and its children (e.g. chromedriver and chrome).
+Uses psutil if it is installed, otherwise reads /proc (Linux only).
+'''
+
+import os
+import resource
+
+
+def _children_from_proc(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    descendants = list(children)
+    for child in children:
+        descendants += _children_from_proc(child)
+    return descendants
+
+
+def process_tree(pid):
+    '''
+    Returns the pids of process pid and all its descendants.
+    '''
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        return [pid] + [child.pid for child in process.children(recursive=True)]
+    except ImportError:
+        return [pid] + _children_from_proc(pid)
+
+
+def process_tree_rss(pid):
+    '''
+    Returns the summed resident set size (bytes) of process pid and all its descendants.
+    '''
+    total = 0
+    for tree_pid in process_tree(pid):
+        try:
+            with open('/proc/{}/statm'.format(tree_pid)) as f:
+                total += int(f.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            try:
+                import psutil
+                total += psutil.Process(tree_pid).memory_info().rss
+            except Exception:
+                continue
+    return total
+
+
+def process_tree_cpu(pid):
+    '''
+    Returns the summed user + system CPU time (seconds) of process pid and all its descendants.
+    '''
+    total = 0.0
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    for tree_pid in process_tree(pid):
+        try:
+            with open('/proc/{}/stat'.format(tree_pid)) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except OSError:
+            try:
+                import psutil
+                times = psutil.Process(tree_pid).cpu_times()
+                total += times.user + times.system
+            except Exception:
+                continue
+    return total
+
+
+def driver_pid(driver):
+    '''
+    Returns the pid of the chromedriver process behind a selenium webdriver.
+    '''
+    return driver.service.process.pid
@@ -0,0 +1,184 @@
+'''
+A local stand-in for FamilySearch search results, for tests and benchmarks of parish_scraper.family_search.
+Serves results pages (/search/record/results/) built from web components with shadow roots (fs-spinner,
+sr-cell-name, sr-cell-events) and the equivalent json search service (/service/search/hr/v2/personas),
+for searches of a single year or of a range of years.
+Point the scraper at it by setting family_search.RESULTS_URL and SERVICE_URL to results_url() and service_url().
+'''
+
+import json
+import time
+
+from flask import Flask, Response, request
+
+
+RESULTS_SCRIPT = '''
+<script>
+var attribute = function(text) { return text.replace(/&/g, '&amp;').replace(/"/g, '&quot;'); };
+var renderEvents = function(events) {
+    return events.map(function(event) {
+        return '<p><span class="event-type">' + event[0] + '</span> <span class="event-date">' + event[1] +
+               '</span> <span class="event-place">' + event[2] + '</span></p>';
+    }).join('');
+};
+customElements.define('sr-cell-name', class extends HTMLElement {
+    connectedCallback() {
+        if (this.shadowRoot) { return; }
+        this.attachShadow({mode : 'open'}).innerHTML = '<a>' + this.getAttribute('name') + '</a>';
+    }
+});
+customElements.define('sr-cell-events', class extends HTMLElement {
+    connectedCallback() {
+        if (this.shadowRoot) { return; }
+        this.attachShadow({mode : 'open'}).innerHTML = renderEvents(JSON.parse(this.getAttribute('data-events')));
+    }
+});
+customElements.define('fs-spinner', class extends HTMLElement {
+    connectedCallback() {
+        if (this.shadowRoot) { return; }
+        this.attachShadow({mode : 'open'}).innerHTML = '<span class="spinner">Loading</span>';
+    }
+});
+customElements.define('fs-search-results', class extends HTMLElement {
+    connectedCallback() {
+        if (this.shadowRoot) { return; }
+        var root = this.attachShadow({mode : 'open'});
+        root.innerHTML = '<fs-spinner></fs-spinner><div class="results"></div>';
+        var page = JSON.parse(document.getElementById('results-data').textContent);
+        setTimeout(function() {
+            var html = '';
+            if (page.count !== null) {
+                html += '<p class="search-criteria">' + (page.offset + 1) + '-' + (page.offset + page.rows.length) +
+                        ' of ' + page.count.toLocaleString('en-GB') + ' Results</p>';
+            }
+            html += '<div class="table"><div class="header">Name Events</div>' + page.rows.map(function(row) {
+                return '<div class="row"><span><sr-cell-name name="' + attribute(row[0]) + '"></sr-cell-name></span>' +
+                       '<span><sr-cell-events data-events="' + attribute(JSON.stringify(row[1])) + '"></sr-cell-events></span></div>';
+            }).join('') + '</div>';
+            root.querySelector('div.results').innerHTML = html;
+            root.querySelector('fs-spinner').setAttribute('style', 'display: none;');
+        }, page.render_delay);
+    }
+});
+</script>
+'''
+
+
+def num_results_for(year, results_per_year=250, empty_every=0):
+    '''
+    Returns the number of search results for year (none for every empty_every-th year).
+    '''
+    if empty_every and year % empty_every == 0:
+        return 0
+    # Vary the counts a little from year to year
+    return results_per_year + (year % 5) * 7
+
+
+def make_rows(place_name, year, offset, count, results_per_year=250, empty_every=0):
+    '''
+    Returns up to count results rows [name, [[event type, date, place], ...]] starting at offset.
+    Every tenth row has no burial event, and some burials are listed after another event.
+    '''
+    num_results = num_results_for(year, results_per_year, empty_every)
+    rows = []
+    for index in range(offset, min(offset + count, num_results)):
+        name = 'Person {}-{}'.format(year, index)
+        burial = ['Burial', '{} March {}'.format(index % 28 + 1, year), place_name]
+        if index % 10 == 9:
+            events = [['Christening', '1 May {}'.format(year - 60), place_name]]
+        elif index % 3 == 0:
+            events = [['Christening', '1 May {}'.format(year - 60), place_name], burial]
+        else:
+            events = [burial]
+        rows.append([name, events])
+
+    return rows
+
+
+def make_range_rows(place_name, year_from, year_to, offset, count, results_per_year=250, empty_every=0):
+    '''
+    Returns up to count results rows starting at offset of a search between year_from and year_to:
+    the results of each year, in year order.
+    '''
+    rows = []
+    for year in range(year_from, year_to + 1):
+        num_results = num_results_for(year, results_per_year, empty_every)
+        if offset < num_results and len(rows) < count:
+            rows += make_rows(place_name, year, offset, count - len(rows), results_per_year, empty_every)
+        offset = max(0, offset - num_results)
+
+    return rows
+
+
+def expected_records(place_name, year, results_per_year=250, empty_every=0):
+    '''
+    Returns the (Name, Date, Place) burial records get_burial_records should find for place_name in year.
+    '''
+    rows = make_rows(place_name, year, 0, num_results_for(year, results_per_year, empty_every), results_per_year, empty_every)
+
+    return [(name, event[1], event[2]) for name, events in rows for event in events if event[0] == 'Burial']
+
+
+def rows_to_payload(rows, num_results):
+    '''
+    Returns the search service payload (gedcomx) of results rows.
+    '''
+    entries = []
+    for name, events in rows:
+        facts = [{'type'  : 'http://gedcomx.org/{}'.format(event_type),
+                  'date'  : {'original' : date},
+                  'place' : {'original' : place}} for event_type, date, place in events]
+        person = {'principal' : True, 'names' : [{'nameForms' : [{'fullText' : name}]}], 'facts' : facts}
+        entries.append({'content' : {'gedcomx' : {'persons' : [person]}}})
+
+    return {'results' : num_results, 'entries' : entries}
+
+
+def make_family_search_site(results_per_year=250, empty_every=0, latency=0.0, render_delay=0.0):
+    '''
+    Returns a Flask app serving results pages and the search service. Each response takes latency seconds,
+    and results pages take a further render_delay seconds to replace their spinner with the results table.
+    '''
+    app = Flask('mock_family_search')
+
+    def query():
+        place_name  = request.args.get('q.deathLikePlace', '')
+        year_from   = int(request.args.get('q.deathLikeDate.from'))
+        year_to     = int(request.args.get('q.deathLikeDate.to', year_from))
+        offset      = int(request.args.get('offset', 0))
+        count       = int(request.args.get('count', 100))
+        num_results = sum(num_results_for(year, results_per_year, empty_every) for year in range(year_from, year_to + 1))
+        rows        = make_range_rows(place_name, year_from, year_to, offset, count, results_per_year, empty_every)
+        return num_results, rows
+
+    @app.route('/search/record/results/')
+    def results_page():
+        time.sleep(latency)
+        num_results, rows = query()
+        page = {'offset'       : int(request.args.get('offset', 0)),
+                'count'        : num_results or None,
+                'rows'         : rows,
+                'render_delay' : int(1000 * render_delay)}
+        # The data goes before the results element, so it has been parsed when the element is upgraded
+        return '''
+               <html><head>{script}</head><body>
+               <script id="results-data" type="application/json">{data}</script>
+               <fs-search-results></fs-search-results>
+               </body></html>
+               '''.format(script=RESULTS_SCRIPT, data=json.dumps(page).replace('</', '<\\/'))
+
+    @app.route('/service/search/hr/v2/personas')
+    def service():
+        time.sleep(latency)
+        num_results, rows = query()
+        return Response(json.dumps(rows_to_payload(rows, num_results)), mimetype='application/json')
+
+    return app
+
+
+def results_url(server):
+    return server.url + '/search/record/results/?'
+
+
+def service_url(server):
+    return server.url + '/service/search/hr/v2/personas?'
@@ -0,0 +1,72 @@
+import pytest
+
+from selenium.common.exceptions import TimeoutException
+
+from parish_scraper import ancestry, throttle
+from parish_scraper.ancestry import *
+
+
+class Store:
+#==============================================================================
+#============================test_observe_record_pages=========================
+    mock_pages = ['<div class="grid-row">page {}</div>'.format(page) for page in range(4)]
+#==============================================================================
+
+
+# Stands in for a driver with the page observer installed on an image viewer showing pages.
+# late_clicks holds the pages whose next page click lands only after the wait for it has timed out.
+class MockViewer:
+    def __init__(self, pages, late_clicks=()):
+        self.pages       = pages
+        self.late_clicks = set(late_clicks)
+        self.index       = 0
+        self.clicks      = 0
+        self.timeouts    = []
+
+    def _page(self):
+        return ['page {}'.format(self.index), self.pages[self.index], self.index < len(self.pages) - 1]
+
+    def set_script_timeout(self, timeout):
+        self.timeouts.append(timeout)
+
+    def execute_script(self, script, *args):
+        assert script == PAGE_STATE_SCRIPT
+        return self._page()
+
+    def execute_async_script(self, script, known_signature, click_next):
+        if click_next:
+            self.clicks += 1
+            self.index = min(self.index + 1, len(self.pages) - 1)
+            if self.index - 1 in self.late_clicks:
+                self.late_clicks.remove(self.index - 1)
+                raise TimeoutException('Timed out waiting for the script')
+        page = self._page()
+        if page[0] == known_signature:
+            raise TimeoutException('Timed out waiting for the script')
+        return page
+
+
+@pytest.fixture(autouse=True)
+def fast_limiter(monkeypatch):
+    monkeypatch.setitem(throttle._limiters, 'ancestry', throttle.RateLimiter(rate=1000.0, burst=1000, backoff=0.0))
+    monkeypatch.setattr(ancestry, 'install_page_observer', lambda driver: driver)
+
+
+def test_wait_for_page_timeout():
+    driver = MockViewer(Store.mock_pages)
+    assert wait_for_page(driver, None, timeout=5)[1] == Store.mock_pages[0]
+    with pytest.raises(TimeoutException):
+        wait_for_page(driver, 'page 0', timeout=5)
+    # The shared driver's script timeout is put back after each wait, even one that timed out
+    assert driver.timeouts == [5, DEFAULT_SCRIPT_TIMEOUT, 5, DEFAULT_SCRIPT_TIMEOUT]
+    set_script_timeout(driver, 60)
+    wait_for_page(driver, None, timeout=5)
+    assert driver.timeouts[-2:] == [5, 60]
+
+
+def test_observe_record_pages():
+    assert list(observe_record_pages(MockViewer(Store.mock_pages), timeout=5)) == Store.mock_pages
+    # A click which lands after its wait timed out is not repeated, so no page is skipped
+    driver = MockViewer(Store.mock_pages, late_clicks=[1])
+    assert list(observe_record_pages(driver, timeout=5)) == Store.mock_pages
+    assert driver.clicks == 3
@@ -0,0 +1,125 @@
+import re
+import time
+
+import pytest
+import pandas as pd
+
+from selenium.webdriver.common.keys import Keys
+
+from parish_scraper import ancestry
+from parish_scraper.ancestry import AncestryScraper
+
+
+class Store:
+#==============================================================================
+#============================test_get_parish_urls_workers======================
+    mock_browse_tree = {'Kent'   : ['Canterbury', 'Dover', 'Ashford'],
+                        'Sussex' : ['Chichester', 'Lewes'],
+                        'Surrey' : ['Guildford'],
+                        'Essex'  : ['Colchester', 'Harwich']}
+    mock_labels      = ('County', 'Parish')
+#==============================================================================
+#============================test_scrape_collection_workers====================
+    def generate_table_html(record_url, page):
+        rows = [('Name', 'Burial Date')] + [('{} {}-{}'.format(record_url, page, row), '1 Jan 1800') for row in range(2)]
+        return ''.join('<div class="grid-row">{}</div>'.format(''.join('<div>{}</div>'.format(cell) for cell in row)) for row in rows)
+#==============================================================================
+
+
+class Option:
+    def __init__(self, text):
+        self.text = text
+
+
+# Stands in for an authenticated driver on a collection's browse page: selected holds the option chosen
+# at each browse level (-1 for the placeholder)
+class StubDriver:
+    def __init__(self):
+        self.selected = [-1, -1]
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        pass
+
+
+def browse_level(xpath):
+    return int(re.search(r'div\[(\d+)\]', xpath).group(1)) - 1
+
+
+def open_browse_controls(driver, collection_code):
+    driver.selected = [-1, -1]
+    return [r'//*[@id="browseControls"]/div[{}]'.format(i) for i in (1, 2)]
+
+
+def get_level_options(driver, xpath_bl):
+    counties = list(Store.mock_browse_tree)
+    if browse_level(xpath_bl) == 0:
+        return [Option(county) for county in counties]
+    return [Option(parish) for parish in Store.mock_browse_tree[counties[driver.selected[0]]]]
+
+
+def when_dom_static(driver, xpath, timeout=15, to_send='click'):
+    if to_send == Keys.DOWN:
+        level = browse_level(xpath)
+        driver.selected[level] += 1
+        driver.selected[level + 1:] = [-1] * len(driver.selected[level + 1:])
+    # Let the other drivers' branches interleave with this one
+    time.sleep(0.001)
+    return driver
+
+
+def collect_urls(driver, option_names):
+    # The urls are those of the options the driver has selected, whatever option_names says
+    county = list(Store.mock_browse_tree)[driver.selected[0]]
+    parish = Store.mock_browse_tree[county][driver.selected[1]]
+    return driver, tuple(option_names), {'1800-1850' : 'https://a/{}/{}/1'.format(county, parish),
+                                         '1851-1900' : 'https://a/{}/{}/2'.format(county, parish)}
+
+
+def iter_record_pages(driver, record_url, event_driven=False, journal=None):
+    for page in range(3):
+        # Later records are quicker to scrape, so they tend to finish out of order
+        time.sleep(0.002 * (len(record_url) % 5))
+        yield '{}?page={}'.format(record_url, page), Store.generate_table_html(record_url, page) if page != 1 else None
+
+
+@pytest.fixture
+def stub_browser(monkeypatch):
+    for func in (open_browse_controls, get_level_options, when_dom_static, collect_urls, iter_record_pages):
+        monkeypatch.setattr(ancestry, func.__name__, func)
+    monkeypatch.setattr(ancestry, 'get_browse_labels', lambda driver: Store.mock_labels)
+    monkeypatch.setattr(ancestry, 'authenticate_driver', lambda *args: StubDriver())
+
+
+def make_scraper():
+    scraper = AncestryScraper()
+    scraper.authenticated_driver = StubDriver()
+    return scraper
+
+
+def test_get_parish_urls_workers(stub_browser):
+    urls = make_scraper().get_parish_urls('1234')
+    assert len(urls) == 8 and urls[(('County', 'Kent'), ('Parish', 'Dover'))]['1851-1900'] == 'https://a/Kent/Dover/2'
+    scraper = make_scraper()
+    urls_parallel = scraper.get_parish_urls('1234', workers=3)
+    # The same tree, in the same order, as explored by one driver
+    assert list(urls_parallel.items()) == list(urls.items())
+    assert len(scraper.driver_pool.drivers) == 3
+
+
+def test_scrape_collection_workers(stub_browser):
+    dfs = []
+    for workers in (1, 3):
+        scraper = make_scraper()
+        scraper.get_parish_urls('1234', workers=workers)
+        dfs.append(scraper.scrape_collection(pipeline=True, workers=workers))
+    # Without the pipeline, records are scraped one after another by the authenticated driver
+    scraper = make_scraper()
+    scraper.get_parish_urls('1234')
+    dfs.append(scraper.scrape_collection())
+    assert len(dfs[0]) == 8 * 2 * 2 * 2
+    assert dfs[0]['Name'].iloc[-1] == 'https://a/Essex/Harwich/2 2-1'
+    for df in dfs[1:]:
+        pd.testing.assert_frame_equal(df, dfs[0])
@@ -0,0 +1,119 @@
+import itertools
+import json
+import threading
+
+import pytest
+import pandas as pd
+
+from parish_scraper import batch
+from parish_scraper.batch import *
+from parish_scraper.pool import DriverPool
+from parish_scraper.sinks import CsvSink
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+
+class Store:
+#==============================================================================
+#============================test_run_manifest=================================
+    mock_manifest = {'workers'       : 3,
+                     'ancestry'      : [{'collection_code' : '1234'}, {'collection_code' : 'bad'}],
+                     'family_search' : [{'place_name' : 'Canterbury', 'year_from' : 1800, 'year_to' : 1802}]}
+    expected_jobs = [('ancestry 1234', 'done', 2), ('ancestry bad', 'failed', 0), ('family_search Canterbury 1800-1802', 'done', 3)]
+#==============================================================================
+
+
+def test_load_manifest(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    with open(path, 'w') as f:
+        json.dump(Store.mock_manifest, f)
+    assert load_manifest(path) == Store.mock_manifest
+    with open(path, 'w') as f:
+        json.dump({'family_search' : [{'place_name' : 'Canterbury', 'year_from' : 1800}]}, f)
+    with pytest.raises(ValueError, match='year_to'):
+        load_manifest(path)
+
+
+@pytest.fixture
+def mock_runners(monkeypatch):
+    def run_ancestry_job(driver, job, sink):
+        if job['collection_code'] == 'bad':
+            raise ValueError('No such collection')
+        return pd.DataFrame({'Name' : ['a', 'b'], 'driver' : driver})
+
+    def run_family_search_job(driver, job, sink):
+        df = pd.DataFrame({'Name' : ['c', 'd', 'e'], 'Date' : ['1800', '1801', '1802']})
+        if sink is None:
+            return df
+        sink.write(df, [('place', job['place_name'])])
+
+    monkeypatch.setattr(batch, 'JOB_RUNNERS', {'ancestry' : run_ancestry_job, 'family_search' : run_family_search_job})
+
+
+def test_run_manifest(mock_runners):
+    pools = {'ancestry' : DriverPool(lambda: 'ancestry driver', size=2), 'family_search' : DriverPool(lambda: 'fs driver')}
+    results = run_manifest(Store.mock_manifest, pools)
+    assert [(result['job'], result['status'], result['rows']) for result in results] == Store.expected_jobs
+    assert 'No such collection' in results[1]['error']
+    assert list(results[0]['df']['driver']) == ['ancestry driver'] * 2
+    # Drivers were only signed in when no idle driver was left
+    assert len(pools['ancestry'].drivers) <= 2 and len(pools['family_search'].drivers) == 1
+    assert format_summary(results).splitlines()[-1] == '2 of 3 jobs done, 5 rows'
+
+
+def test_run_manifest_output(tmp_path, mock_runners):
+    manifest = dict(Store.mock_manifest, output=str(tmp_path / 'burials'))
+    results = run_manifest(manifest, {'ancestry' : DriverPool(lambda: None), 'family_search' : DriverPool(lambda: None)})
+    assert results[2]['rows'] == 3 and results[2]['df'] is None
+    assert list(CsvSink(str(tmp_path / 'burials' / 'family_search')).read()['Name']) == ['c', 'd', 'e']
+
+
+class MockDriver:
+    def __init__(self, number):
+        self.number  = number
+        self.crashed = False
+
+    @property
+    def current_url(self):
+        if self.crashed:
+            raise WebDriverException('chrome not reachable')
+        return 'https://www.ancestry.co.uk/'
+
+    def quit(self):
+        self.crashed = True
+
+
+def test_crashed_driver_replaced(monkeypatch):
+    def run_ancestry_job(driver, job, sink):
+        if job['collection_code'] == 'crash':
+            driver.crashed = True
+            raise WebDriverException('chrome not reachable')
+        if job['collection_code'] == 'slow':
+            raise TimeoutException('Page took too long')
+        return pd.DataFrame({'driver' : [driver.number]})
+
+    monkeypatch.setattr(batch, 'JOB_RUNNERS', {'ancestry' : run_ancestry_job})
+    numbers = itertools.count()
+    pool = DriverPool(lambda: MockDriver(next(numbers)))
+    manifest = {'workers' : 1, 'ancestry' : [{'collection_code' : code} for code in ('1', 'slow', '2', 'crash', '3')]}
+    results = run_manifest(manifest, {'ancestry' : pool})
+    assert [result['status'] for result in results] == ['done', 'failed', 'done', 'failed', 'done']
+    # A timed out page kept its driver; the crashed browser was dropped, and the next job was lent a new driver
+    assert [list(results[i]['df']['driver']) for i in (0, 2, 4)] == [[0], [0], [1]]
+    assert [driver.number for driver in pool.drivers] == [1]
+
+
+def test_grow_signs_in_outside_lock():
+    started = threading.Barrier(2, timeout=5)
+
+    def driver_factory():
+        # Both sign-ins must be under way at once
+        started.wait()
+        return MockDriver(0)
+
+    pool = DriverPool(driver_factory, size=2)
+    threads = [threading.Thread(target=pool.grow) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pool.drivers) == 2
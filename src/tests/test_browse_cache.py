@@ -0,0 +1,64 @@
+import json
+
+from parish_scraper import browse_cache
+from parish_scraper.browse_cache import *
+
+
+class Store:
+#==============================================================================
+#============================test_save_load====================================
+    mock_tree = {(('County', 'Kent'), ('Parish', 'Canterbury'))   : {'1800-1850' : 'https://a/1', '1851-1900' : 'https://a/2'},
+                 (('County', 'Kent'), ('Parish', 'Dover'))        : {'1800-1850' : 'https://a/3'},
+                 (('County', 'Sussex'), ('Parish', 'Chichester')) : {'1800-1850' : 'https://a/4'}}
+#==============================================================================
+#============================test_update_branches==============================
+    mock_branch   = {(('County', 'Kent'), ('Parish', 'Ashford')) : {'1800-1850' : 'https://a/5'}}
+    expected_tree = {(('County', 'Kent'), ('Parish', 'Ashford'))      : {'1800-1850' : 'https://a/5'},
+                     (('County', 'Sussex'), ('Parish', 'Chichester')) : {'1800-1850' : 'https://a/4'}}
+#==============================================================================
+
+
+def test_save_load(tmp_path):
+    cache = BrowseTreeCache(str(tmp_path))
+    assert cache.load('1234') is None
+    cache.save('1234', Store.mock_tree)
+    # Tuple keys are stored as lists in json and come back as tuples
+    with open(str(tmp_path / '1234.json')) as f:
+        assert json.load(f)['tree'][0][0] == [['County', 'Kent'], ['Parish', 'Canterbury']]
+    assert BrowseTreeCache(str(tmp_path)).load('1234') == Store.mock_tree
+
+
+def test_expired(tmp_path, monkeypatch):
+    cache = BrowseTreeCache(str(tmp_path), ttl=60)
+    cache.save('1234', Store.mock_tree)
+    now = browse_cache.time.time()
+    monkeypatch.setattr(browse_cache.time, 'time', lambda: now + 61)
+    assert cache.load('1234') is None
+    assert BrowseTreeCache(str(tmp_path), ttl=None).load('1234') == Store.mock_tree
+
+
+def test_invalidate(tmp_path):
+    cache = BrowseTreeCache(str(tmp_path))
+    for collection_code in ('1234', '5678', '9012'):
+        cache.save(collection_code, Store.mock_tree)
+    cache.invalidate('1234')
+    assert cache.load('1234') is None and cache.load('5678') == Store.mock_tree
+    cache.invalidate()
+    assert cache.load('5678') is None and cache.load('9012') is None
+    # Invalidating a collection that is not cached is not an error
+    cache.invalidate('1234')
+
+
+def test_update_branches(tmp_path):
+    cache = BrowseTreeCache(str(tmp_path))
+    cache.save('1234', Store.mock_tree)
+    saved = cache._read('1234')['saved']
+    # Only the entries below the Kent branch are replaced
+    cache.update_branches('1234', Store.mock_branch, ['Kent'])
+    assert cache.load('1234') == Store.expected_tree
+    assert cache._read('1234')['saved'] == saved
+    assert replace_branch(Store.mock_tree, Store.mock_branch, ['Kent']) == Store.expected_tree
+    assert replace_branch(Store.mock_tree, Store.mock_branch) == Store.mock_branch
+    # A branch of a collection that is not cached starts a new tree
+    cache.update_branches('5678', Store.mock_branch, ['Kent'])
+    assert cache.load('5678') == Store.mock_branch
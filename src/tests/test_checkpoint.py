@@ -0,0 +1,92 @@
+import os
+
+import pandas as pd
+
+from parish_scraper import ancestry
+from parish_scraper.checkpoint import *
+from parish_scraper.sinks import CsvSink
+
+
+class Store:
+#==============================================================================
+#============================test_record_page==================================
+    mock_pages = [('https://a/1?page=1', pd.DataFrame({'Name' : ['John Smith'], 'Burial Date' : ['1 Jan 1800']})),
+                  ('https://a/1?page=2', None),
+                  ('https://a/1?page=3', pd.DataFrame({'Name' : ['Mary Ann'], 'Burial Date' : ['2 Feb 1801']}))]
+    expected_df = pd.DataFrame({'Name' : ['John Smith', 'Mary Ann'], 'Burial Date' : ['1 Jan 1800', '2 Feb 1801']})
+#==============================================================================
+#============================test_resume_collection============================
+    mock_collection_urls = {(('County', 'Kent'), ('Parish', 'Canterbury')) : {'1800-1850' : 'https://a/1', '1851-1900' : 'https://a/2'}}
+#==============================================================================
+
+
+def record_pages(journal, record_url, pages):
+    for page_url, df in pages:
+        journal.record_page(record_url, page_url, df)
+
+
+def test_record_page(tmp_path):
+    journal = ProgressJournal(str(tmp_path))
+    assert journal.resume_point('https://a/1') is None
+    record_pages(journal, 'https://a/1', Store.mock_pages)
+    assert journal.resume_point('https://a/1') == (3, 'https://a/1?page=3')
+    assert not journal.is_complete('https://a/1')
+    journal.complete_record('https://a/1')
+    # A new journal over the same directory picks up where the last run stopped
+    journal = ProgressJournal(str(tmp_path))
+    assert journal.is_complete('https://a/1') and journal.resume_point('https://a/1') is None
+    pd.testing.assert_frame_equal(journal.load_record('https://a/1'), Store.expected_df, check_dtype=False)
+    journal.reset()
+    assert not journal.is_complete('https://a/1')
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_half_written_event(tmp_path):
+    journal = ProgressJournal(str(tmp_path))
+    record_pages(journal, 'https://a/1', Store.mock_pages[:2])
+    log_path = os.path.join(journal._record_directory('https://a/1'), LOG_NAME)
+    with open(log_path, 'ab') as f:
+        f.write(b'{"page" : 2, "page_u')
+    # The half-written event is ignored, then overwritten by the next one
+    journal = ProgressJournal(str(tmp_path))
+    assert journal.resume_point('https://a/1') == (2, 'https://a/1?page=2')
+    record_pages(journal, 'https://a/1', Store.mock_pages[2:])
+    assert ProgressJournal(str(tmp_path)).resume_point('https://a/1') == (3, 'https://a/1?page=3')
+
+
+def test_shared_directory(tmp_path):
+    journal_a, journal_b = ProgressJournal(str(tmp_path)), ProgressJournal(str(tmp_path))
+    journal_a.record_page('rec-A', 'rec-A?page=1', None)
+    journal_b.record_page('rec-B', 'rec-B?page=1', None)
+    reader = ProgressJournal(str(tmp_path))
+    assert (reader.resume_point('rec-A'), reader.resume_point('rec-B')) == ((1, 'rec-A?page=1'), (1, 'rec-B?page=1'))
+    # A record whose worker died resumes from its last page in another worker
+    record_pages(journal_a, 'https://a/1', Store.mock_pages[:2])
+    assert journal_b.resume_point('https://a/1') == (2, 'https://a/1?page=2')
+    record_pages(journal_b, 'https://a/1', Store.mock_pages[2:])
+    journal_b.complete_record('https://a/1')
+    assert journal_a.is_complete('https://a/1')
+    pd.testing.assert_frame_equal(journal_a.load_record('https://a/1'), Store.expected_df, check_dtype=False)
+
+
+def test_resume_collection(tmp_path, monkeypatch):
+    scraped = []
+
+    def scrape_record(driver, record_url, event_driven=False, sink=None, journal=None, profiler=None):
+        scraped.append(record_url)
+        journal.record_page(record_url, record_url + '?page=1', Store.expected_df)
+        journal.complete_record(record_url)
+        return driver, journal.load_record(record_url)
+
+    monkeypatch.setattr(ancestry, 'scrape_record', scrape_record)
+    scraper = ancestry.AncestryScraper()
+    scraper.authenticated_driver = 'driver'
+    scraper.collection_urls, scraper.collection_code = Store.mock_collection_urls, '1234'
+    sink = CsvSink(str(tmp_path / 'burials'))
+    # Records completed and written by the first run are not written again when the run is resumed
+    for pipeline in (False, False, True):
+        scraper.scrape_collection(journal=str(tmp_path / 'journal'), pipeline=pipeline, sink=sink)
+    assert scraped == ['https://a/1', 'https://a/2']
+    assert len(sink.read()) == 4
+    # Without a sink, completed records are read back from the journal
+    assert len(scraper.scrape_collection(journal=str(tmp_path / 'journal'))) == 4
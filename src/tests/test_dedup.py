@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from parish_scraper.dedup import *
+
+
+class Store:
+#==============================================================================
+#============================test_row_deduplicator=============================
+    mock_pages = [pd.DataFrame({'Name' : ['John Smith', 'Mary Jones', 'John Smith'], 'Age' : ['70', '', '70']}),
+                  pd.DataFrame({'Name' : ['Mary Jones', 'Peter Brown'], 'Age' : ['', np.nan]}),
+                  pd.DataFrame({'Name' : ['Peter Brown'], 'Spouse' : [np.nan]})]
+#==============================================================================
+
+
+def test_row_deduplicator():
+    dedup = RowDeduplicator()
+    actual_df = pd.concat([dedup.filter(df) for df in Store.mock_pages[:2]], ignore_index=True)
+    expected_df = pd.concat(Store.mock_pages[:2], ignore_index=True).drop_duplicates().reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual_df, expected_df)
+    # The last page has different columns, so its row is not a duplicate of the second page's
+    assert len(dedup.filter(Store.mock_pages[2])) == 1
+    assert len(dedup) == 4
+
+
+def test_is_new_page():
+    dedup = RowDeduplicator()
+    assert dedup.is_new_page('<div class="grid-row"></div>')
+    assert not dedup.is_new_page('<div class="grid-row"></div>')
+    assert dedup.is_new_page('<div class="grid-row"> </div>')
@@ -0,0 +1,150 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+import requests
+import pandas as pd
+
+from parish_scraper import family_search, throttle
+from parish_scraper.family_search import *
+from parish_scraper.drivers import find_chromedriver
+from parish_scraper.metrics import get_metrics
+from tests.conftest import WebServer
+from tests.mock_family_search import *
+
+
+class Store:
+#==============================================================================
+#============================test_get_burial_info==============================
+    mock_events = (['Christening', 'Burial'], ['1 May 1740', '2 March 1801'], ['Kent', 'Canterbury'])
+    expected_burial_info = ('2 March 1801', 'Canterbury')
+#==============================================================================
+#============================test_parse_results_json===========================
+    mock_payload = rows_to_payload(make_rows('Canterbury', 1801, 0, 12), 257)
+    expected_table_data = {'Name'  : [name for name, _, _ in expected_records('Canterbury', 1801)[:11]],
+                           'Date'  : [date for _, date, _ in expected_records('Canterbury', 1801)[:11]],
+                           'Place' : ['Canterbury'] * 11}
+#==============================================================================
+#============================test_scrape_year==================================
+    place_name = "St Mary's, Canterbury"
+    expected_year_df = pd.DataFrame(expected_records(place_name, 1801), columns=['Name', 'Date', 'Place'])
+#==============================================================================
+#============================test_plan_date_ranges=============================
+    mock_counts = {1800 : 0, 1801 : 3, 1802 : 4000, 1803 : 2500, 1804 : 0, 1805 : 7000, 1806 : 1, 1807 : 2}
+    expected_date_ranges = [(1800, 1802), (1803, 1803), (1805, 1805), (1806, 1807)]
+#==============================================================================
+#============================test_split_by_year================================
+    mock_range_df = pd.DataFrame({'Name' : ['a', 'b', 'c', 'd', 'e', 'f', 'g'],
+                                  'Date' : ['3 Mar 1802', '1 Jan 1800', 'Unknown', '2 Feb 1802', '5 May 1799', '4 Apr 1800', None]})
+    expected_split = [(1800, pd.DataFrame({'Name' : ['b', 'f'], 'Date' : ['1 Jan 1800', '4 Apr 1800']})),
+                      (1802, pd.DataFrame({'Name' : ['a', 'd'], 'Date' : ['3 Mar 1802', '2 Feb 1802']}))]
+#==============================================================================
+store = Store()
+
+
+def chrome_available():
+    driver_path = find_chromedriver()
+    return bool(shutil.which(driver_path) or os.path.exists(driver_path))
+
+
+@pytest.fixture(scope="module")
+def family_search_server():
+    server = WebServer(make_family_search_site(empty_every=4))
+    with server.run():
+        yield server
+
+
+@pytest.fixture
+def local_urls(family_search_server, monkeypatch):
+    monkeypatch.setattr(family_search, 'RESULTS_URL', results_url(family_search_server))
+    monkeypatch.setattr(family_search, 'SERVICE_URL', service_url(family_search_server))
+    # The local site does not need to be rate limited
+    monkeypatch.setitem(throttle._limiters, 'family_search', throttle.RateLimiter(rate=1000.0, burst=1000))
+
+
+def test_import_is_lazy():
+    # The browser, http and dataframe libraries are only imported by the functions which use them
+    code = 'import sys, parish_scraper.family_search; print(sorted(m for m in ("selenium", "pyshadow", "requests", "pandas") if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_get_burial_info():
+    assert get_burial_info(*store.mock_events) == store.expected_burial_info
+    assert get_burial_info(['Christening'], ['1 May 1740'], ['Kent']) is None
+
+
+def test_parse_results_json():
+    assert parse_results_json(store.mock_payload) == store.expected_table_data
+
+
+def test_plan_date_ranges():
+    count_func = lambda fetcher, place_name, year: sum(Store.mock_counts[y] for y in range(year[0], year[1] + 1))
+    with pytest.warns(UserWarning):
+        assert plan_date_ranges(count_func, None, 'Canterbury', 1800, 1807) == Store.expected_date_ranges
+    assert plan_date_ranges(count_func, None, 'Canterbury', 1806, 1807, max_results=2) == [(1806, 1806), (1807, 1807)]
+    assert plan_date_ranges(count_func, None, 'Canterbury', 1800, 1800) == []
+
+
+def test_split_by_year():
+    # Records out of year order; records without a year in the range are not put in any year
+    with pytest.warns(UserWarning, match='Dropped 3 records'):
+        split = split_by_year(Store.mock_range_df, (1800, 1802))
+    assert [year for year, _ in split] == [year for year, _ in Store.expected_split]
+    for (_, df), (_, expected_df) in zip(split, Store.expected_split):
+        pd.testing.assert_frame_equal(df, expected_df, check_dtype=False)
+    # A search of one year keeps all its records
+    assert split_by_year(Store.mock_range_df, 1801)[0][1] is Store.mock_range_df
+
+
+def test_get_burial_records_planned(local_urls):
+    scraper = FamilySearchScraper()
+    scraper.authenticated_driver = object()
+    scraper.http_session = requests.Session()
+    metrics = get_metrics('family_search')
+    try:
+        metrics.reset()
+        expected_df = scraper.get_burial_records(store.place_name, 1801, 1812, backend='http')
+        expected_pages = metrics.counters['pages']
+        metrics.reset()
+        df = scraper.get_burial_records(store.place_name, 1801, 1812, backend='http', plan=True)
+        # The years with results fit in one search
+        assert metrics.counters['probes'] == 1
+        assert metrics.counters['pages'] < expected_pages
+        pd.testing.assert_frame_equal(df, expected_df)
+        assert len(df) == sum(len(expected_records(store.place_name, year, empty_every=4)) for year in range(1801, 1813))
+    finally:
+        scraper.http_session.close()
+
+
+def test_scrape_results_page_http(local_urls):
+    with requests.Session() as session:
+        max_offset, df = scrape_results_page_http(session, store.place_name, 1801)
+        assert max_offset == 200
+        assert df.equals(store.expected_year_df.iloc[:90].reset_index(drop=True))
+        # No results
+        assert scrape_results_page_http(session, store.place_name, 1800) == (None, None)
+
+
+def test_scrape_year_http(local_urls):
+    with requests.Session() as session:
+        df = scrape_year(session, store.place_name, 1801, scrape_results_page_http)
+    assert df.equals(store.expected_year_df)
+
+
+@pytest.mark.skipif(not chrome_available(), reason='chromedriver not found')
+def test_scrape_results_page(local_urls):
+    driver = boot_up_driver('performance')
+    try:
+        max_offset, df = scrape_results_page(driver, store.place_name, 1801)
+        assert max_offset == 200
+        assert df.equals(store.expected_year_df.iloc[:90].reset_index(drop=True))
+        # The per-row implementation reads the same table
+        shadow = family_search.QuietShadow(driver)
+        table = shadow.find_element(r'div.table')
+        assert scrape_table(shadow, table) == scrape_table_batched(driver, table)
+        assert scrape_results_page(driver, store.place_name, 1800) == (None, None)
+    finally:
+        driver.quit()
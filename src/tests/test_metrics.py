@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from parish_scraper.metrics import *
+from parish_scraper.throttle import RateLimiter
+
+
+class Store:
+#==============================================================================
+#============================test_to_prometheus================================
+    expected_prometheus = ['# HELP parish_scraper_phase_seconds_total Seconds spent in each scrape phase.',
+                           '# TYPE parish_scraper_phase_seconds_total counter',
+                           'parish_scraper_phase_seconds_total{site="test",phase="parse"} 1.5',
+                           '# HELP parish_scraper_phase_calls_total Number of times each scrape phase was timed.',
+                           '# TYPE parish_scraper_phase_calls_total counter',
+                           'parish_scraper_phase_calls_total{site="test",phase="parse"} 2',
+                           '# HELP parish_scraper_events_total Scrape events (pages, rows, refreshes, retries, timeouts, penalties).',
+                           '# TYPE parish_scraper_events_total counter',
+                           'parish_scraper_events_total{site="test",event="refreshes"} 3']
+#==============================================================================
+
+
+def test_phase():
+    metrics = ScrapeMetrics('test')
+    with pytest.raises(ValueError):
+        with metrics.phase('navigation'):
+            raise ValueError
+    with metrics.phase('navigation'):
+        pass
+    metrics.increment('pages')
+    metrics.increment('rows', 50)
+    snapshot = metrics.snapshot()
+    assert snapshot['phases']['navigation']['count'] == 2
+    assert snapshot['counters'] == {'pages' : 1, 'rows' : 50}
+    metrics.reset()
+    assert metrics.snapshot()['phases'] == {}
+
+
+def test_to_prometheus():
+    metrics = ScrapeMetrics('test')
+    metrics.add_time('parse', 1.0)
+    metrics.add_time('parse', 0.5)
+    metrics.increment('refreshes', 3)
+    assert metrics.to_prometheus().splitlines() == Store.expected_prometheus
+
+
+def test_write_jsonl(tmp_path):
+    metrics = ScrapeMetrics('test')
+    metrics.add_time('wait', 0.25)
+    metrics.write_jsonl(tmp_path / 'metrics.jsonl')
+    metrics.write_jsonl(tmp_path / 'metrics.jsonl')
+    lines = [json.loads(line) for line in (tmp_path / 'metrics.jsonl').read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]['site'] == 'test' and lines[0]['phases']['wait']['max'] == 0.25
+
+
+def test_limiter_metrics():
+    reset_metrics('throttle_test')
+    limiter = RateLimiter(rate=100.0, burst=1, site='throttle_test')
+    limiter.acquire()
+    limiter.acquire()
+    limiter.penalize()
+    snapshot = get_metrics('throttle_test').snapshot()
+    assert snapshot['phases']['throttle']['count'] == 1
+    assert snapshot['counters'] == {'penalties' : 1}
@@ -0,0 +1,109 @@
+import subprocess
+import sys
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from parish_scraper.parsing import *
+
+
+class Store:
+#==============================================================================
+#============================test_parse_grid_container=========================
+    def generate_table_html(data):
+        rows = []
+        for row in data:
+            cells = ''.join('<div>{}</div>'.format(cell) for cell in row)
+            rows.append('<div class="grid-row">{}</div>'.format(cells))
+        return ''.join(rows)
+
+    mock_table_html = generate_table_html((('Name', 'Burial Date'),
+                                           ('<span>John</span> Smith', '1 Jan 1800'),
+                                           ('Mary &amp; Ann', '2 Feb 1801')))
+    expected_table_df = pd.DataFrame({'Name'        : ['John Smith', 'Mary & Ann'],
+                                      'Burial Date' : ['1 Jan 1800', '2 Feb 1801']})
+#==============================================================================
+#============================test_parse_grid_container_hidden_text=============
+    mock_hidden_table_html = generate_table_html((('Name', 'Burial Date'),
+                                                  ('<script>var a=1;</script>John Smith<template><div>Row template</div></template>',
+                                                   '<style>.b{}</style><template>Unknown</template>1 Jan 1800'),
+                                                  ('<span>Mary <script>var a="</div>";</script>&amp; Ann</span>', '2 Feb 1801')))
+#==============================================================================
+#============================test_parse_grid_containers========================
+    mock_p2_table_html = generate_table_html((('Name', 'Burial Date', 'Age'),
+                                              ('Peter Jones', '3 Mar 1802', '70')))
+    expected_df_concat = pd.DataFrame({'Name'        : ['John Smith', 'Mary & Ann', 'Peter Jones'],
+                                       'Burial Date' : ['1 Jan 1800', '2 Feb 1801', '3 Mar 1802'],
+                                       'Age'         : [np.nan, np.nan, '70']})
+#==============================================================================
+#============================test_concat_labelled==============================
+    mock_labels = [[('County', 'Kent'), ('Record Date Range', '1800-1850')],
+                   [('County', 'Kent'), ('Record Date Range', '1851-1900')],
+                   [('Record Date Range', '1800-1850')]]
+    expected_df_labelled = pd.DataFrame({'County'            : ['Kent', 'Kent', 'Kent', np.nan],
+                                         'Record Date Range' : ['1800-1850', '1800-1850', '1851-1900', '1800-1850'],
+                                         'Name'              : ['John Smith', 'Mary & Ann', 'Peter Jones', 'John Smith']})
+#==============================================================================
+#============================test_parse_table_rows=============================
+    # innerText, as read by family_search.SCRAPE_TABLE_SCRIPT
+    mock_table_rows = [['John Smith', ['Christening', ' Burial\n'], ['1 May 1740', '2\xa0March   1801'], ['Kent', "St Mary's,\n\n   Canterbury\t"]],
+                       ['Mary Ann', ['Christening'], ['1 May 1740'], ['Kent']]]
+    expected_table_data = {'Name' : ['John Smith'], 'Date' : ['2 March 1801'], 'Place' : ["St Mary's,\nCanterbury"]}
+#==============================================================================
+store = Store()
+
+
+@pytest.mark.parametrize('parser', ['html.parser', 'lxml'])
+def test_parse_grid_container(parser):
+    pytest.importorskip(parser.split('.')[0])
+    actual_df = parse_grid_container(store.mock_table_html, parser)
+    assert actual_df.equals(store.expected_table_df)
+
+
+@pytest.mark.parametrize('parser', ['html.parser', 'lxml'])
+def test_parse_grid_containers(parser):
+    pytest.importorskip(parser.split('.')[0])
+    actual_df = parse_grid_containers([store.mock_table_html, None, store.mock_p2_table_html], parser)
+    assert actual_df.equals(store.expected_df_concat)
+
+
+@pytest.mark.parametrize('parser', ['html.parser', 'lxml'])
+def test_parse_grid_container_hidden_text(parser):
+    # Script, style and template contents are not cell text, and divs within a template are not cells
+    pytest.importorskip(parser.split('.')[0])
+    actual_df = parse_grid_container(store.mock_hidden_table_html, parser)
+    assert actual_df.equals(store.expected_table_df)
+
+
+def test_parse_grid_container_header_only():
+    actual_df = parse_grid_container(Store.generate_table_html((('Name', 'Burial Date'),)))
+    assert list(actual_df.columns) == ['Name', 'Burial Date']
+    assert actual_df.empty
+
+
+def test_concat_labelled():
+    frames = [store.expected_table_df, store.expected_df_concat.iloc[2:, :2], store.expected_table_df.iloc[:1]]
+    actual_df = concat_labelled(frames, store.mock_labels)
+    assert actual_df['County'].dtype == 'category'
+    assert list(actual_df['County'].cat.categories) == ['Kent']
+    pd.testing.assert_frame_equal(actual_df[['County', 'Record Date Range', 'Name']].astype(object),
+                                  store.expected_df_labelled.astype(object))
+
+
+def test_normalize_text():
+    # As selenium's WebElement.text
+    assert normalize_text(' \t2 March\r\n\n  1801  ') == '2 March\n1801'
+    assert normalize_text('2\xa0\xa0March') == '2  March'
+    assert normalize_text(None) == ''
+
+
+def test_parse_table_rows():
+    assert parse_table_rows(store.mock_table_rows) == store.expected_table_data
+
+
+def test_import_without_selenium():
+    # Parse-only processes (e.g. pipeline parse workers) must not pay for importing the scrapers
+    code = 'import sys, parish_scraper, parish_scraper.parsing; print(sorted(m for m in ("selenium", "pyshadow", "requests", "bs4") if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+import pandas as pd
+
+from parish_scraper.pipeline import *
+
+
+class Store:
+#==============================================================================
+#============================test_pipeline_run=================================
+    def make_pages(key, num_pages):
+        def pages():
+            for page in range(num_pages):
+                # Later pages arrive faster, so they tend to be parsed out of order
+                time.sleep(0.01 * (num_pages - page))
+                yield page, ({'Name' : ['{}-{}'.format(key, page)]} if page != 1 else None)
+        return pages
+
+    mock_sources = [('a', make_pages('a', 4)), ('b', make_pages('b', 0)), ('c', make_pages('c', 3))]
+    expected_pages = [[0, 1, 2, 3], [], [0, 1, 2]]
+#==============================================================================
+#============================test_pipeline_run_error===========================
+    def failing_pages():
+        yield 0, {'Name' : ['a']}
+        raise RuntimeError('page did not load')
+#==============================================================================
+
+
+def test_pipeline_run():
+    pipeline = ScrapePipeline(pd.DataFrame, fetch_workers=2, parse_workers=2, queue_size=2)
+    seen = []
+    results = pipeline.run(Store.mock_sources,
+                           on_page=lambda key, page, df: seen.append((key, page, df is None)),
+                           on_source=lambda key, pages: [page for page, _ in pages])
+    assert results == Store.expected_pages
+    assert [page for key, page, _ in seen if key == 'a'] == Store.expected_pages[0]
+    assert ('a', 1, True) in seen
+    stats = pipeline.stats()
+    assert stats['pages']['items'] == 7 + 3
+    assert stats['pages']['max_depth'] <= 2
+
+
+def test_pipeline_run_error():
+    pipeline = ScrapePipeline(pd.DataFrame)
+    with pytest.raises(RuntimeError):
+        pipeline.run([('a', Store.failing_pages)])
+
+
+def test_pipeline_run_in_event_loop():
+    # As in Jupyter, where an event loop is already running in the main thread
+    async def main():
+        results = ScrapePipeline(pd.DataFrame, parse_workers=2).run(Store.mock_sources, on_source=lambda key, pages: len(pages))
+        results_async = await ScrapePipeline(pd.DataFrame, parse_workers=2).run_async(Store.mock_sources, on_source=lambda key, pages: len(pages))
+        return results, results_async
+
+    assert asyncio.run(main()) == ([4, 0, 3], [4, 0, 3])
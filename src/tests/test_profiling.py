@@ -0,0 +1,54 @@
+import os
+import pstats
+import tracemalloc
+
+from parish_scraper import profiling
+from parish_scraper.profiling import *
+
+
+class Store:
+#==============================================================================
+#============================test_profile_name=================================
+    mock_keys = ['https://www.ancestry.co.uk/imageviewer/collections/1234/images/abc?pId=5', "St Mary's, Canterbury 1801"]
+    expected_names = ['www.ancestry.co.uk_imageviewer_collections_1234_images_abc_pId_5', 'St_Mary_s_Canterbury_1801']
+#==============================================================================
+
+
+def test_profile_name():
+    assert [profile_name(key) for key in Store.mock_keys] == Store.expected_names
+    long_names = [profile_name('https://example.com/' + 'a' * 200 + suffix) for suffix in ('1', '2')]
+    assert long_names[0] != long_names[1]
+    assert all(len(name) < 120 for name in long_names)
+
+
+def test_profile(tmp_path):
+    profiler = Profiler(str(tmp_path), sample_rate=1.0)
+    with profiler.profile('Canterbury 1801') as profile:
+        assert profile is not None
+        rows = [list(range(100)) for _ in range(100)]
+    path = os.path.join(str(tmp_path), 'Canterbury_1801')
+    assert profiler.profiled == [path]
+    assert pstats.Stats(path + '.prof').total_calls > 0
+    assert tracemalloc.Snapshot.load(path + '.tracemalloc').traces
+    assert not tracemalloc.is_tracing()
+
+
+def test_sample_rate(tmp_path):
+    profiler = Profiler(str(tmp_path), sample_rate=0.0)
+    with profiler.profile('Canterbury 1801') as profile:
+        assert profile is None
+    with profiled(None, 'Canterbury 1801') as profile:
+        assert profile is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_default_sample_rate(tmp_path, monkeypatch):
+    draws = iter([0.005, 0.5, 0.0101, 0.0099])
+    monkeypatch.setattr(profiling.random, 'random', lambda: next(draws))
+    profiler = get_profiler(str(tmp_path))
+    assert profiler.sample_rate == 0.01
+    # Only units drawn below the sample rate are profiled
+    for key in ('a', 'b', 'c', 'd'):
+        with profiler.profile(key):
+            pass
+    assert [os.path.basename(path) for path in profiler.profiled] == ['a', 'd']
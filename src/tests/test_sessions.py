@@ -0,0 +1,82 @@
+import time
+
+from parish_scraper import sessions
+from parish_scraper.sessions import *
+
+
+class Store:
+#==============================================================================
+#============================test_save_load_session============================
+    mock_cookies = [{'name' : 'session', 'value' : 'abc', 'domain' : '.ancestry.co.uk', 'path' : '/', 'sameSite' : 'Lax'},
+                    {'name' : 'remember', 'value' : 'def', 'domain' : '.ancestry.co.uk', 'path' : '/', 'expiry' : time.time() + 3600.5},
+                    {'name' : 'expired', 'value' : 'ghi', 'domain' : '.ancestry.co.uk', 'path' : '/', 'expiry' : time.time() - 60}]
+#==============================================================================
+
+
+class MockDriver:
+    def __init__(self, cookies=(), cdp=True, rejected=()):
+        self.cookies     = list(cookies)
+        self.cdp         = cdp
+        self.rejected    = rejected
+        self.cdp_cookies = []
+        self.added       = []
+        self.urls        = []
+
+    def get_cookies(self):
+        return self.cookies
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        if not self.cdp:
+            raise AttributeError("'WebDriver' object has no attribute 'execute_cdp_cmd'")
+        assert cmd == 'Network.setCookie'
+        self.cdp_cookies.append(cmd_args)
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def add_cookie(self, cookie):
+        if cookie['name'] in self.rejected:
+            raise Exception('invalid cookie domain')
+        self.added.append(cookie)
+
+
+def test_save_load_session(tmp_path):
+    path = str(tmp_path / 'sessions' / 'ancestry.pkl')
+    assert load_session(path) is None
+    save_session(MockDriver(Store.mock_cookies), path)
+    # Expired cookies are dropped
+    assert [cookie['name'] for cookie in load_session(path)] == ['session', 'remember']
+    save_session(MockDriver(Store.mock_cookies[2:]), path)
+    assert load_session(path) is None
+
+
+def test_max_age(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ancestry.pkl')
+    save_session(MockDriver(Store.mock_cookies), path)
+    assert load_session(path, max_age=60) is not None
+    now = time.time()
+    monkeypatch.setattr(sessions.time, 'time', lambda: now + 61)
+    assert load_session(path, max_age=60) is None
+    assert not restore_session(MockDriver(), path, 'https://www.ancestry.co.uk/', max_age=60)
+
+
+def test_restore_session(tmp_path):
+    path = str(tmp_path / 'ancestry.pkl')
+    save_session(MockDriver(Store.mock_cookies), path)
+    driver = MockDriver()
+    assert restore_session(driver, path, 'https://www.ancestry.co.uk/')
+    # Cookies are set through the devtools protocol, without opening a page
+    assert driver.urls == [] and driver.added == []
+    assert [cookie['name'] for cookie in driver.cdp_cookies] == ['session', 'remember']
+    assert 'sameSite' not in driver.cdp_cookies[0] and driver.cdp_cookies[1]['expires'] == Store.mock_cookies[1]['expiry']
+
+
+def test_restore_session_fallback(tmp_path):
+    path = str(tmp_path / 'ancestry.pkl')
+    save_session(MockDriver(Store.mock_cookies), path)
+    driver = MockDriver(cdp=False, rejected=['session'])
+    assert restore_session(driver, path, 'https://www.ancestry.co.uk/')
+    # Without the devtools protocol, a page on the cookies' domain is opened and each cookie added to it;
+    # a rejected cookie does not stop the others being added
+    assert driver.urls == ['https://www.ancestry.co.uk/']
+    assert driver.added == [dict(Store.mock_cookies[1], expiry=int(Store.mock_cookies[1]['expiry']))]
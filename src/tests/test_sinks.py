@@ -0,0 +1,34 @@
+import os
+
+import pytest
+import pandas as pd
+
+from parish_scraper.sinks import *
+
+
+class Store:
+#==============================================================================
+#============================test_partitioned_sink=============================
+    mock_chunks = [(pd.DataFrame({'Name' : ['John Smith']}),  [('County', 'Kent'), ('date_range', '1800-1850')]),
+                   (pd.DataFrame({'Name' : ['Mary Jones']}),  [('County', 'Kent'), ('date_range', '1851-1900')]),
+                   (pd.DataFrame({'Name' : ['Peter Brown']}), [('County', 'Isle of Man / Ellan Vannin'), ('date_range', '1800-1850')])]
+    expected_df = pd.DataFrame({'County'     : ['Kent', 'Kent', 'Isle of Man / Ellan Vannin'],
+                                'date_range' : ['1800-1850', '1851-1900', '1800-1850'],
+                                'Name'       : ['John Smith', 'Mary Jones', 'Peter Brown']})
+#==============================================================================
+
+
+@pytest.mark.parametrize('sink_class', [CsvSink, ParquetSink])
+def test_partitioned_sink(sink_class, tmp_path):
+    if sink_class is ParquetSink:
+        pytest.importorskip('pyarrow')
+    sink = sink_class(str(tmp_path))
+    for df, partition in Store.mock_chunks[:2]:
+        sink.write(df, partition)
+    assert os.path.exists(os.path.join(str(tmp_path), 'County=Kent', 'date_range=1851-1900',
+                                       'part-00001.{}'.format(sink_class.extension)))
+    # A new sink on the same directory appends
+    sink = sink_class(str(tmp_path))
+    sink.write(*Store.mock_chunks[2])
+    assert sink.num_parts == 3
+    pd.testing.assert_frame_equal(sink.read(), Store.expected_df)
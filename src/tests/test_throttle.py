@@ -0,0 +1,79 @@
+import pytest
+
+from parish_scraper import throttle
+from parish_scraper.throttle import *
+
+
+# Stands in for the time module in parish_scraper.throttle: sleeping advances the clock at once
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now   = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle, 'time', clock)
+    return clock
+
+
+def test_acquire(clock):
+    limiter = RateLimiter(rate=2.0, burst=3)
+    # The burst is taken without waiting, then tokens come at the rate
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == 0.5
+    clock.now += 10
+    # Tokens refilled while idle never exceed the burst
+    assert limiter.acquire(3) == 0.0
+    assert limiter.acquire(2) == 1.0
+    assert clock.slept == [0.5, 1.0]
+
+
+def test_penalize_and_reward(clock):
+    limiter = RateLimiter(rate=2.0, burst=3, increase=0.5, backoff=2.0)
+    assert limiter.penalize() == 2.0
+    assert limiter.rate == 1.0
+    # Requests pause for the back-off, which doubles while the site keeps throttling
+    assert limiter.acquire() == 2.0
+    assert limiter.penalize() == 4.0
+    assert limiter.rate == 0.5
+    assert limiter.acquire() == 4.0
+    limiter.reward()
+    assert limiter.rate == 1.0
+    # A success resets the back-off
+    assert limiter.penalize() == 2.0
+
+
+def test_rate_limits(clock):
+    limiter = RateLimiter(rate=2.0, burst=3, min_rate=0.5, increase=0.1, backoff=2.0, max_backoff=60.0)
+    backoffs = [limiter.penalize() for _ in range(10)]
+    assert limiter.rate == 0.5
+    assert backoffs[:3] == [2.0, 4.0, 8.0] and max(backoffs) == 60.0
+    for _ in range(100):
+        limiter.reward()
+    # The rate recovers no further than the site's budget
+    assert limiter.rate == 2.0
+
+
+@pytest.mark.skipif(throttle.fcntl is None, reason='Limiter state is only shared between processes with fcntl')
+def test_shared_state(clock, tmp_path, monkeypatch):
+    monkeypatch.setenv('PARISH_SCRAPER_RATE_DIR', str(tmp_path / 'rates'))
+    monkeypatch.setattr(throttle, '_limiters', {})
+    limiter = get_limiter('family_search')
+    # A second limiter over the same directory, as built by another process
+    other = throttle._build_limiter('family_search')
+    assert other is not limiter and other.state_path == limiter.state_path == str(tmp_path / 'rates' / 'family_search.json')
+    assert limiter.acquire(10) == 0.0
+    # The burst taken by one limiter is gone for the other
+    assert other.acquire() == 0.5
+    other.penalize()
+    assert limiter.rate == 1.0
+    assert limiter.acquire() == 2.0
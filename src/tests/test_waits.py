@@ -0,0 +1,25 @@
+from parish_scraper.waits import *
+
+
+def test_timeout():
+    tracker = LatencyTracker(min_samples=3)
+    assert tracker.timeout('ancestry.welcome', 20) == 20
+    for seconds in (0.5, 1.0, 2.0):
+        tracker.record('ancestry.welcome', seconds)
+    # p95 of 2.0s * 1.5 + 1.0s margin
+    assert tracker.timeout('ancestry.welcome', 20) == 4.0
+
+
+def test_timeouts_not_sampled():
+    # Waits for elements which may never appear must not lengthen their timeout as they miss
+    tracker = LatencyTracker(min_samples=3)
+    for _ in range(10):
+        tracker.record('ancestry.browse_urls', 20, timed_out=True)
+    assert tracker.timeout('ancestry.browse_urls', 20) == 20
+    for seconds in (0.5, 1.0, 2.0):
+        tracker.record('ancestry.browse_urls', seconds)
+    tracker.record('ancestry.browse_urls', 4.0, timed_out=True)
+    assert tracker.timeout('ancestry.browse_urls', 20) == 4.0
+    stats = tracker.stats()['ancestry.browse_urls']
+    assert (stats['samples'], stats['timeouts'], stats['max']) == (3, 11, 2.0)
+    assert 'ancestry.browse_urls' in tracker.report()
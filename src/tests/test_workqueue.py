@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+import requests
+import pandas as pd
+
+from parish_scraper import family_search, throttle
+from parish_scraper.family_search import shard_handler
+from parish_scraper.sinks import CsvSink
+from parish_scraper.workqueue import *
+from tests.conftest import WebServer
+from tests.mock_family_search import *
+
+
+class Store:
+#==============================================================================
+#============================test_enqueue_records==============================
+    mock_collection_urls = {(('County', 'Kent'), ('Parish', 'Canterbury')) : {'1800-1850' : 'https://a/1', '1851-1900' : 'https://a/2'},
+                            (('County', 'Kent'), ('Parish', 'Dover'))      : {'1800-1850' : 'https://a/3'}}
+    expected_payload = {'collection' : '1234', 'labels' : [['County', 'Kent'], ['Parish', 'Dover']], 'date_range' : '1800-1850'}
+#==============================================================================
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=60, max_attempts=2)
+
+
+def test_enqueue_records(queue):
+    assert enqueue_records(queue, Store.mock_collection_urls, '1234') == 3
+    # Items are only enqueued once
+    assert enqueue_records(queue, Store.mock_collection_urls, '1234') == 0
+    items = [queue.claim('worker') for _ in range(3)]
+    assert [item.key for item in items] == ['https://a/1', 'https://a/2', 'https://a/3']
+    assert items[2].payload == Store.expected_payload
+    assert queue.claim('worker') is None
+
+
+def test_lease(queue):
+    queue.put(SEARCH_SHARD, 'a', {'offset' : 0})
+    item = queue.claim('worker 1')
+    assert queue.heartbeat(item)
+    # An expired lease is claimed again by another worker, and the first worker can no longer complete the item
+    queue.lease_seconds = -1
+    assert queue.heartbeat(item)
+    item_again = queue.claim('worker 2')
+    assert (item_again.key, item_again.attempts) == ('a', 2)
+    assert not queue.complete(item)
+    assert queue.complete(item_again, {'rows' : 5})
+    assert queue.counts() == {'done' : 1}
+    assert queue.results() == {'a' : {'rows' : 5}}
+
+
+def test_fail(queue):
+    queue.put(SEARCH_SHARD, 'a')
+    queue.fail(queue.claim('worker'), 'Timed out')
+    assert queue.counts() == {'pending' : 1}
+    queue.fail(queue.claim('worker'), 'Timed out')
+    assert queue.counts() == {'failed' : 1}
+    assert queue.claim('worker') is None
+
+
+def test_run_worker(queue):
+    queue.put_many([(SEARCH_SHARD, str(i), None) for i in range(20)])
+    worked_on = []
+
+    def handler(item):
+        worked_on.append(item.key)
+        if item.key == '7' and item.attempts == 1:
+            raise ValueError('Flaky page')
+        return {'rows' : int(item.key)}
+
+    summaries = []
+    workers = [threading.Thread(target=lambda: summaries.append(run_worker(queue, {SEARCH_SHARD : handler}, poll_interval=0.01)))
+               for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Every item was worked on once, except the one whose first attempt failed
+    assert sorted(worked_on, key=int) == sorted([str(i) for i in range(20)] + ['7'], key=int)
+    assert queue.counts() == {'done' : 20}
+    assert sum(summary.get('done', 0) for summary in summaries) == 20
+
+
+def test_search_shards(tmp_path, queue, monkeypatch):
+    server = WebServer(make_family_search_site(empty_every=4))
+    monkeypatch.setitem(throttle._limiters, 'family_search', throttle.RateLimiter(rate=1000.0, burst=1000))
+    with server.run():
+        monkeypatch.setattr(family_search, 'SERVICE_URL', service_url(server))
+        enqueue_search_shards(queue, 'Canterbury', [(1800, 1801), (1802, 1802)])
+        sink = CsvSink(str(tmp_path / 'burials'))
+        with requests.Session() as session:
+            summary = run_worker(queue, {SEARCH_SHARD : shard_handler(queue, session, sink, 'http')})
+    # The first page of each range enqueued the range's other pages
+    assert summary == {'done' : 3 + 3}
+    df = sink.read().sort_values(['year', 'Name'], key=lambda column: column.str.extract(r'(\d+)$', expand=False).astype(int))
+    expected_df = pd.DataFrame([(str(year), name, date, place) for year in (1801, 1802) for name, date, place in expected_records('Canterbury', year, empty_every=4)],
+                               columns=['year', 'Name', 'Date', 'Place'])
+    pd.testing.assert_frame_equal(df.drop(columns='place').reset_index(drop=True), expected_df, check_dtype=False)
+
+
+def test_search_shard_rerun(tmp_path, monkeypatch):
+    server = WebServer(make_family_search_site())
+    monkeypatch.setitem(throttle._limiters, 'family_search', throttle.RateLimiter(rate=1000.0, burst=1000))
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=-1)
+    with server.run():
+        monkeypatch.setattr(family_search, 'SERVICE_URL', service_url(server))
+        enqueue_search_shards(queue, 'Canterbury', [(1801, 1802)])
+        sink = CsvSink(str(tmp_path / 'burials'))
+        with requests.Session() as session:
+            handle = shard_handler(queue, session, sink, 'http')
+            # The first worker writes the shard, but its lease expires before it completes it
+            item = queue.claim('worker 1')
+            handle(item)
+            item_again = queue.claim('worker 2')
+            assert (item_again.key, item_again.attempts) == (item.key, 2)
+            rows = handle(item_again)['rows']
+    assert not queue.complete(item)
+    df = sink.read()
+    # The first page of the range was written once, although it was scraped twice
+    assert len(df) == rows > 0
+    assert not df.duplicated().any()